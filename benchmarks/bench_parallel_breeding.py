@@ -0,0 +1,63 @@
+"""
+Benchmark: process-pool offspring generation in PromptEvolver
+
+Breeds one generation with 1, 2, 4 and 8 workers from the same seed, checks
+that every worker count produces identical offspring, and reports the time
+of a warm run (the pool is started before timing).
+
+    python benchmarks/bench_parallel_breeding.py --size 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from llm_picbreeder import evolver
+
+def breed(population, size, workers, chunk_size, seed):
+    prompt_evolver = evolver.PromptEvolver()
+    prompt_evolver.population_size = size
+    prompt_evolver.mutation_rate = 0.5
+    prompt_evolver.breeding_workers = workers
+    prompt_evolver.breeding_chunk_size = chunk_size
+    try:
+        # Warm-up generation starts the pool outside the timed region
+        prompt_evolver.np_rng = np.random.default_rng(seed)
+        prompt_evolver.evolve_arrays(population)
+
+        prompt_evolver.np_rng = np.random.default_rng(seed)
+        start = time.perf_counter()
+        offspring = prompt_evolver.evolve_arrays(population)
+        elapsed = time.perf_counter() - start
+    finally:
+        prompt_evolver.close()
+    return elapsed, [offspring.content_of(row) for row in range(len(offspring))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel breeding benchmark")
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    seeder = evolver.PromptEvolver()
+    population = seeder.initialize_arrays("Write a product description\nfor a new phone", args.size)
+    population.fitness[:] = np.random.default_rng(args.seed).uniform(1.0, 5.0, args.size)
+
+    print(f"population={args.size} chunk_size={args.chunk_size} cpus={os.cpu_count()}")
+    print(f"{'workers':>7} {'time (s)':>9} {'speedup':>8} {'identical':>10}")
+    baseline_time = baseline_offspring = None
+    for workers in args.workers:
+        elapsed, offspring = breed(population, args.size, workers, args.chunk_size, args.seed)
+        if baseline_time is None:
+            baseline_time, baseline_offspring = elapsed, offspring
+        print(f"{workers:>7} {elapsed:9.3f} {baseline_time / elapsed:7.2f}x {str(offspring == baseline_offspring):>10}")
+
+if __name__ == "__main__":
+    main()
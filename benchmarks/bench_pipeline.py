@@ -0,0 +1,355 @@
+"""
+Benchmark: the evolution and evaluation pipeline end to end
+
+Times each stage across population sizes and base prompt lengths:
+initialize_population, _mutate_prompt, crossover, evolve_population,
+evaluate_prompt_batch against a fake LLM with a fixed latency, the
+/prompts/ endpoints over a populated SQLite database, bulk ingestion,
+novelty scoring against a large archive, automated fitness scoring,
+concurrent rating ingestion, generational against steady-state
+evolution when LLM latency is heavy-tailed, and restoring run checkpoints.
+Every case reports the best of several repeats as items per second.
+
+Results can be written as JSON and compared against a stored baseline;
+the script exits with status 1 when any case is slower than the baseline
+by more than the tolerance.
+
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --sizes 100 1000 --prompt-lengths 10 200
+    python benchmarks/bench_pipeline.py --output benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --baseline benchmarks/baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from llm_picbreeder import (aggregates, checkpoints, database, dedup, evolver, fitness, ingest, llm_interface,
+                            models, novelty, ratings, runs, steady_state)
+from llm_picbreeder.config import settings
+
+WORDS = ("robot", "learning", "paint", "ocean", "quietly", "describe", "history", "bright")
+
+class FakeAsyncClient:
+    """Stands in for AsyncOpenAI, answering every request after a fixed latency
+    
+    With ``sigma`` the latency is log-normal around it instead, which is
+    closer to real provider latency: most replies are quick, a few are slow.
+    """
+
+    def __init__(self, latency, sigma=0.0, seed=0):
+        self.latency = latency
+        self.sigma = sigma
+        self.rng = random.Random(seed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, max_tokens, temperature):
+        await asyncio.sleep(self.latency * self.rng.lognormvariate(0.0, self.sigma) if self.sigma else self.latency)
+        message = SimpleNamespace(content=f"Answer to {messages[-1]['content']}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+def make_prompt(length):
+    """A base prompt of ``length`` words split over a few lines"""
+    words = [WORDS[i % len(WORDS)] for i in range(length)]
+    lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+    return "Write about this\n" + "\n".join(lines)
+
+def make_evolver(size):
+    prompt_evolver = evolver.PromptEvolver(seed=0)
+    prompt_evolver.population_size = size
+    return prompt_evolver
+
+def rated_population(prompt_evolver, base_prompt, size):
+    population = prompt_evolver.initialize_population(base_prompt, size)
+    index = aggregates.RatingIndex()
+    for i, genome in enumerate(population):
+        genome.id = i + 1
+        index.add(genome.id, 1.0 + (i * 7919) % 400 / 100)
+    return population, index
+
+def best_of(repeats, fn):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+# Each case does its setup and returns the callable to time and the items it processes
+
+def case_initialize(size, base_prompt, options):
+    prompt_evolver = make_evolver(size)
+    return lambda: prompt_evolver.initialize_population(base_prompt, size), size
+
+def case_mutate(size, base_prompt, options):
+    prompt_evolver = make_evolver(size)
+    return lambda: [prompt_evolver._mutate_prompt(base_prompt) for _ in range(size)], size
+
+def case_crossover(size, base_prompt, options):
+    prompt_evolver = make_evolver(size)
+    parents = prompt_evolver.initialize_population(base_prompt, 2)
+    return lambda: [prompt_evolver.crossover(*parents) for _ in range(size)], size
+
+def case_evolve(size, base_prompt, options):
+    prompt_evolver = make_evolver(size)
+    population, index = rated_population(prompt_evolver, base_prompt, size)
+    return lambda: prompt_evolver.evolve_population(population, index), size
+
+def case_evaluate(size, base_prompt, options):
+    # Concurrency is bounded by the scheduler, i.e. MAX_CONCURRENT_REQUESTS
+    llm = llm_interface.LLMInterface(async_client=FakeAsyncClient(options.latency))
+    llm.cache = None  # every repeat pays the full latency
+    population, _ = rated_population(make_evolver(size), base_prompt, size)
+    # Distinct prompts so the batch's deduplication does not hide requests
+    for genome in population:
+        genome.content += f"\nVariant {genome.id}"
+    return lambda: llm.evaluate_prompt_batch(population), size
+
+def case_prompts_api(size, base_prompt, options):
+    from fastapi.testclient import TestClient
+    from llm_picbreeder import main
+
+    tmp = tempfile.mkdtemp()
+    engine = create_engine(f"sqlite:///{tmp}/bench.db", connect_args={"check_same_thread": False})
+    database.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as db:
+        population = make_evolver(size).initialize_population(base_prompt, size)
+        runs.create_run(db, base_prompt, population, {"seed": 0})
+
+    # Each TestClient request may run on a new event loop, so don't pool connections
+    async_factory = async_sessionmaker(
+        create_async_engine(database.async_database_url(f"sqlite:///{tmp}/bench.db"), poolclass=NullPool),
+        expire_on_commit=False
+    )
+
+    async def get_async_db():
+        async with async_factory() as db:
+            yield db
+
+    main.app.dependency_overrides[database.get_async_db] = get_async_db
+    client = TestClient(main.app)
+    page = min(size, 100)
+
+    def list_and_create():
+        params = {"limit": page}
+        while True:
+            response = client.get("/prompts/", params=params)
+            response.raise_for_status()
+            params["cursor"] = response.json()["next_cursor"]
+            if params["cursor"] is None:
+                break
+        client.post("/prompts/", json={"content": base_prompt}).raise_for_status()
+    return list_and_create, size + 1
+
+def case_bulk_ingest(size, base_prompt, options):
+    tmp = tempfile.mkdtemp()
+    engine = database.create_db_engine(f"sqlite:///{tmp}/ingest.db")
+    database.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    records = [{"content": f"{base_prompt}\nVariant {i}"} for i in range(size)]
+
+    def ingest_all():
+        with session_factory() as db:
+            for start in range(0, size, settings.INGEST_BATCH_SIZE):
+                ingest.ingest_batch(db, records[start:start + settings.INGEST_BATCH_SIZE])
+    return ingest_all, size
+
+def case_novelty(size, base_prompt, options):
+    # Scores a population of ``size`` against an archive of --archive-size earlier prompts
+    prompt_evolver = make_evolver(size)
+    prompt_evolver.mutation_rate = 1.0
+    archive = novelty.NoveltyArchive()
+    archive.add([prompt_evolver._mutate_prompt(f"{base_prompt}\nVariant {i}") for i in range(options.archive_size)])
+    population = [prompt_evolver._mutate_prompt(base_prompt) for _ in range(size)]
+    return lambda: archive.novelty(population, settings.NOVELTY_K), size
+
+def case_fitness(size, base_prompt, options):
+    prompt_evolver = make_evolver(size)
+    prompts = [prompt_evolver._add_constraints(base_prompt) for _ in range(size)]
+    outputs = [f"{base_prompt}\n- Example {i}, such as a list item.\n- Another one." for i in range(size)]
+    rate = fitness.make_fitness_function()
+    return lambda: rate.score(prompts, outputs), size
+
+def case_rating_ingest(size, base_prompt, options):
+    # One rating per submission from 32 concurrent raters, as separate API requests would be
+    tmp = tempfile.mkdtemp()
+    engine = database.create_db_engine(f"sqlite:///{tmp}/ratings.db")
+    database.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    with session_factory() as db:
+        prompt_ids = ingest.ingest_batch(db, [{"content": f"{base_prompt}\nVariant {i}"} for i in range(100)])
+    submissions = [[models.RatingIn(prompt_id=prompt_ids[i % 100], rating=1.0 + i % 5)] for i in range(size)]
+    writer = ratings.RatingWriter(session_factory)
+    pool = ThreadPoolExecutor(32)
+
+    def rate_all():
+        futures = list(pool.map(writer.submit, submissions))
+        for future in futures:
+            future.result()
+    return rate_all, size
+
+def jittery_llm(options):
+    llm = llm_interface.LLMInterface(async_client=FakeAsyncClient(options.latency, options.latency_sigma))
+    llm.cache = None
+    # Pin the adaptive window, which shrinks under latency spread, so both modes get the same concurrency
+    limiter = llm.scheduler.limiter
+    limiter.minimum = limiter.limit = settings.STEADY_STATE_IN_FLIGHT
+    return llm
+
+def mutating_evolver():
+    # Mutate every child so that nearly all of them need a request of their own
+    prompt_evolver = make_evolver(32)
+    prompt_evolver.mutation_rate = 1.0
+    return prompt_evolver
+
+def case_generational(size, base_prompt, options):
+    # ``size`` evaluations as generations of 32, each waiting for its slowest reply
+    def evolve():
+        prompt_evolver = mutating_evolver()
+        llm = jittery_llm(options)
+        rate = fitness.make_fitness_function()
+        population = prompt_evolver.initialize_population(base_prompt)
+        next_id = iter(range(1, size + 1))
+        for _ in range(size // 32):
+            for genome in population:
+                genome.id = next(next_id)
+            evaluations = llm.evaluate_prompt_batch(population, settings.STEADY_STATE_IN_FLIGHT)
+            rate(population, evaluations)
+            population = prompt_evolver.evolve_population(population, evaluations)
+    return evolve, size // 32 * 32
+
+def case_steady_state(size, base_prompt, options):
+    # The same number of evaluations and population size, bred as replies arrive
+    def evolve():
+        llm = jittery_llm(options)
+        engine = steady_state.SteadyStateEvolver(mutating_evolver(), llm, fitness.make_fitness_function())
+        asyncio.run(engine.run(base_prompt, size // 32 * 32))
+    return evolve, size // 32 * 32
+
+def case_checkpoint_restore(size, base_prompt, options):
+    # A checkpoint whose dedup and novelty archives hold ``size`` evaluated prompts
+    prompt_evolver = make_evolver(size)
+    deduplicator = dedup.Deduplicator()
+    prompts = [f"{prompt_evolver._mutate_prompt(base_prompt)}\nVariant {i}" for i in range(size)]
+    for i, prompt in enumerate(prompts):
+        deduplicator.add(prompt, models.PromptEvaluation(prompt_id=i + 1, output_content=f"Answer to {prompt}",
+                                                         rating=1.0 + i % 5))
+    prompt_evolver.novelty_archive.add(prompts)
+    data = checkpoints.encode(prompt_evolver, deduplicator, 100, range(1, 33))
+
+    def restore():
+        checkpoints.Checkpoint(data).restore(evolver.PromptEvolver(seed=0), dedup.Deduplicator())
+    return restore, size
+
+CASES = {
+    "initialize_population": case_initialize,
+    "mutate_prompt": case_mutate,
+    "crossover": case_crossover,
+    "evolve_population": case_evolve,
+    "evaluate_prompt_batch": case_evaluate,
+    "prompts_api": case_prompts_api,
+    "bulk_ingest": case_bulk_ingest,
+    "novelty_score": case_novelty,
+    "fitness_score": case_fitness,
+    "rating_ingest": case_rating_ingest,
+    "generational_run": case_generational,
+    "steady_state_run": case_steady_state,
+    "checkpoint_restore": case_checkpoint_restore
+}
+
+def run_benchmarks(args):
+    results = []
+    for name in args.cases:
+        for size in args.sizes:
+            for length in args.prompt_lengths:
+                fn, items = CASES[name](size, make_prompt(length), args)
+                seconds = best_of(args.repeats, fn)
+                results.append({
+                    "case": name,
+                    "size": size,
+                    "prompt_length": length,
+                    "seconds": seconds,
+                    "per_second": items / seconds if seconds > 0 else float("inf")
+                })
+                print(f"{name:>22} {size:>8} {length:>8} {seconds * 1000:11.2f} {results[-1]['per_second']:14.0f}")
+    return results
+
+def result_key(result):
+    return result["case"], result["size"], result["prompt_length"]
+
+def compare(results, baseline, tolerance):
+    """Print each case's throughput relative to the baseline; return the regressions"""
+    previous = {result_key(r): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'case':>22} {'size':>8} {'length':>8} {'baseline/s':>14} {'now/s':>14} {'change':>8}")
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None:
+            continue
+        change = result["per_second"] / before["per_second"] - 1
+        flag = ""
+        if change < -tolerance:
+            regressions.append(result)
+            flag = "  REGRESSION"
+        print(f"{result['case']:>22} {result['size']:>8} {result['prompt_length']:>8} "
+              f"{before['per_second']:14.0f} {result['per_second']:14.0f} {change:+7.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Evolution and evaluation pipeline benchmark")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100, 1000])
+    parser.add_argument("--prompt-lengths", nargs="+", type=int, default=[10, 100])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.01, help="Fake LLM latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=1.0,
+                        help="Log-normal spread of the fake LLM latency in generational_run and steady_state_run")
+    parser.add_argument("--archive-size", type=int, default=100000, help="Archived prompts in novelty_score")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results stored in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed throughput drop before a case counts as a regression")
+    args = parser.parse_args()
+
+    print(f"{'case':>22} {'size':>8} {'length':>8} {'time (ms)':>11} {'items/s':>14}")
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "latency": args.latency,
+        "max_concurrent_requests": settings.MAX_CONCURRENT_REQUESTS,
+        "repeats": args.repeats,
+        "results": run_benchmarks(args)
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report["results"], baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
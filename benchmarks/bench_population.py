@@ -0,0 +1,59 @@
+"""
+Benchmark: genome-based vs columnar populations in PromptEvolver
+
+Evolves one generation through evolve_population (PromptGenome in and out)
+and through evolve_arrays (columnar Population), reporting wall time and
+peak traced memory.
+
+    python benchmarks/bench_population.py --sizes 10000 50000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from llm_picbreeder import aggregates, evolver
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20
+
+def main():
+    parser = argparse.ArgumentParser(description="Population representation benchmark")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    print(f"{'population':>10} {'genomes (s)':>12} {'genomes (MiB)':>14} {'arrays (s)':>11} {'arrays (MiB)':>13}")
+    for size in args.sizes:
+        prompt_evolver = evolver.PromptEvolver()
+        prompt_evolver.population_size = size
+        prompt_evolver.mutation_rate = 0.5
+
+        arrays = prompt_evolver.initialize_arrays("Write a product description", size)
+        arrays.ids[:] = np.arange(size)
+        arrays.fitness[:] = np.random.default_rng(0).uniform(1.0, 5.0, size)
+
+        genomes = arrays.to_genomes()
+        for i, genome in enumerate(genomes):
+            genome.id = i
+        index = aggregates.RatingIndex()
+        for i, rating in enumerate(arrays.fitness):
+            index.add(i, rating)
+
+        genome_time, genome_mem = measure(prompt_evolver.evolve_population, genomes, index)
+        array_time, array_mem = measure(prompt_evolver.evolve_arrays, arrays)
+        print(f"{size:>10} {genome_time:12.3f} {genome_mem:14.1f} {array_time:11.3f} {array_mem:13.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark: fitness aggregation for selection in PromptEvolver
+
+Compares the original per-prompt scan over all evaluations (O(P x E)) with
+the RatingIndex lookup used by PromptEvolver.rank_population (O(P + E)).
+
+    python benchmarks/bench_selection.py
+    python benchmarks/bench_selection.py --sizes 1000x10000 10000x100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from llm_picbreeder import aggregates, evolver, models
+
+# The scan is quadratic; above this many comparisons it is extrapolated
+MAX_SCAN_WORK = 2e8
+
+def make_data(num_prompts: int, num_evaluations: int):
+    rng = random.Random(0)
+    population = [models.PromptGenome(id=i, content=f"Prompt {i}") for i in range(num_prompts)]
+    evaluations = [
+        models.PromptEvaluation(prompt_id=rng.randrange(num_prompts), output_content="", rating=rng.uniform(1, 5))
+        for _ in range(num_evaluations)
+    ]
+    return population, evaluations
+
+def rank_by_scan(population, evaluations):
+    """The selection stage as it was: filter every evaluation for every prompt"""
+    rated_prompts = []
+    for prompt in population:
+        prompt_evals = [e for e in evaluations if e.prompt_id == prompt.id and not e.error]
+        if prompt_evals:
+            rated_prompts.append((prompt, sum(e.rating for e in prompt_evals) / len(prompt_evals)))
+        else:
+            rated_prompts.append((prompt, 0.0))
+    rated_prompts.sort(key=lambda x: x[1], reverse=True)
+    return rated_prompts
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Selection-stage scaling benchmark")
+    parser.add_argument("--sizes", nargs="+", default=["100x1000", "1000x10000", "10000x100000"],
+                        help="PROMPTSxEVALUATIONS pairs")
+    args = parser.parse_args()
+
+    prompt_evolver = evolver.PromptEvolver()
+    print(f"{'prompts':>8} {'evals':>8} {'scan (s)':>12} {'index (s)':>10} {'prebuilt (s)':>13} {'speedup':>9}")
+
+    for size in args.sizes:
+        num_prompts, num_evaluations = (int(n) for n in size.split("x"))
+        population, evaluations = make_data(num_prompts, num_evaluations)
+
+        # From a raw evaluation list (builds the index) and from a live index
+        index_time, ranked = timed(prompt_evolver.rank_population, population, evaluations)
+        index = aggregates.RatingIndex.from_evaluations(evaluations)
+        prebuilt_time, _ = timed(prompt_evolver.rank_population, population, index)
+
+        work = num_prompts * num_evaluations
+        if work <= MAX_SCAN_WORK:
+            scan_time, scanned = timed(rank_by_scan, population, evaluations)
+            assert [round(r, 9) for _, r in scanned] == [round(r, 9) for _, r in ranked]
+            scan_label = f"{scan_time:12.3f}"
+        else:
+            # Calibrate on a slice and extrapolate the quadratic cost
+            sample = max(1, int(MAX_SCAN_WORK // num_evaluations) // 10)
+            sample_time, _ = timed(rank_by_scan, population[:sample], evaluations)
+            scan_time = sample_time * num_prompts / sample
+            scan_label = f"~{scan_time:11.1f}"
+
+        print(f"{num_prompts:>8} {num_evaluations:>8} {scan_label} {index_time:10.3f} "
+              f"{prebuilt_time:13.4f} {scan_time / index_time:8.0f}x")
+
+if __name__ == "__main__":
+    main()
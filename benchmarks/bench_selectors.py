@@ -0,0 +1,59 @@
+"""
+Benchmark: vectorized parent selection operators
+
+Times drawing every parent for one generation (two per offspring) with each
+selector, and a full evolve_population call, across population sizes.
+
+    python benchmarks/bench_selectors.py
+    python benchmarks/bench_selectors.py --sizes 10000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from llm_picbreeder import aggregates, evolver, models, selection
+
+def best_of(repeats, fn, *args):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description="Selection operator benchmark")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    methods = list(selection.SELECTORS)
+    print(f"{'population':>10} " + " ".join(f"{m + ' (ms)':>16}" for m in methods) + f" {'evolve (ms)':>12}")
+
+    for size in args.sizes:
+        fitness = rng.uniform(1.0, 5.0, size)
+        timings = [
+            best_of(args.repeats, selection.make_selector(method), fitness, 2 * size, rng) * 1000
+            for method in methods
+        ]
+
+        prompt_evolver = evolver.PromptEvolver()
+        prompt_evolver.population_size = size
+        prompt_evolver.selection_method = "tournament"
+        population = [models.PromptGenome(id=i, content=f"Prompt {i}\nBe concise.") for i in range(size)]
+        index = aggregates.RatingIndex()
+        for i, rating in enumerate(fitness):
+            index.add(i, rating)
+        evolve_time = best_of(1, prompt_evolver.evolve_population, population, index) * 1000
+
+        print(f"{size:>10} " + " ".join(f"{t:16.2f}" for t in timings) + f" {evolve_time:12.1f}")
+
+if __name__ == "__main__":
+    main()
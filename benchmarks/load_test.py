@@ -0,0 +1,172 @@
+"""
+Load test: sync (threadpool) vs async handlers for the prompt and run endpoints
+
+Drives a mix of GET /prompts/, GET /prompts/{id}/ancestors, GET /runs/{id}
+and POST /prompts/ from many concurrent clients and reports requests per
+second and latency percentiles.
+
+By default both variants run in-process over ASGI against the same SQLite
+file: "sync" is a reference app with the previous ``def`` handlers on
+``database.get_db`` sessions, "async" is ``main.app`` with its
+``async def`` handlers on an aiosqlite session. With --url the same mix is
+sent to a running server instead, e.g. to compare two deployments.
+
+    python benchmarks/load_test.py --concurrency 50 --duration 10
+    python benchmarks/load_test.py --url http://localhost:8000
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+from fastapi import Depends, FastAPI
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from llm_picbreeder import database, evolver, lineage, models, queries, runs
+from llm_picbreeder import main as api
+
+def make_sync_app(session_factory):
+    """The request handlers as they were before they became async"""
+    app = FastAPI()
+
+    def get_db():
+        with session_factory() as db:
+            yield db
+
+    @app.get("/prompts/")
+    def get_prompts(limit: int = 100, db=Depends(get_db)):
+        items, next_cursor = queries.list_prompts(db, limit)
+        return {"items": items, "next_cursor": next_cursor}
+
+    @app.get("/prompts/{prompt_id}/ancestors")
+    def get_prompt_ancestors(prompt_id: int, db=Depends(get_db)):
+        return queries.ancestors(db, prompt_id)
+
+    @app.get("/runs/{run_id}")
+    def get_run(run_id: int, db=Depends(get_db)):
+        return runs.run_summary(db.get(database.DBEvolutionRun, run_id))
+
+    @app.post("/prompts/")
+    def create_prompt(prompt: models.PromptGenome, db=Depends(get_db)):
+        db_prompt = database.DBPrompt(content=prompt.content, parent_id=prompt.parent_id)
+        db.add(db_prompt)
+        db.flush()
+        lineage.index_prompts(db, [(db_prompt.id, db_prompt.parent_id)])
+        db.commit()
+        return {"id": db_prompt.id}
+
+    return app
+
+def populate(session_factory, runs_count, population_size):
+    """Store a few evolved runs so the lineage queries have depth"""
+    run_ids, prompt_ids = [], []
+    prompt_evolver = evolver.PromptEvolver(seed=0)
+    prompt_evolver.population_size = population_size
+    with session_factory() as db:
+        for i in range(runs_count):
+            run = runs.start_run(db, f"Write a story about topic {i}", runs.evolver_config(prompt_evolver))
+            for _ in runs.run_generations(db, run, 5, api.llm_interface_instance, api.rate_outputs):
+                pass
+            run_ids.append(run.id)
+            prompt_ids.extend(run.population_ids)
+    return run_ids, prompt_ids
+
+async def one_request(client, rng, run_ids, prompt_ids):
+    choice = rng.random()
+    if choice < 0.4:
+        return await client.get("/prompts/", params={"limit": 20})
+    if choice < 0.7:
+        return await client.get(f"/prompts/{rng.choice(prompt_ids)}/ancestors")
+    if choice < 0.9:
+        return await client.get(f"/runs/{rng.choice(run_ids)}")
+    return await client.post("/prompts/", json={"content": "Load test prompt", "parent_id": rng.choice(prompt_ids)})
+
+async def drive(client, concurrency, duration, run_ids, prompt_ids):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(seed):
+        nonlocal errors
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await one_request(client, rng, run_ids, prompt_ids)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000
+    }
+
+def report(name, result):
+    print(f"{name:>8} {result['requests']:>9} {result['errors']:>7} {result['rps']:>10.1f} "
+          f"{result['p50_ms']:>9.1f} {result['p99_ms']:>9.1f}")
+
+async def run_in_process(args):
+    tmp = tempfile.mkdtemp()
+    url = f"sqlite:///{tmp}/load.db"
+    engine = database.create_db_engine(url)
+    database.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    run_ids, prompt_ids = populate(session_factory, args.runs, args.population)
+
+    async_engine = database.create_async_db_engine(url)
+    async_factory = async_sessionmaker(async_engine, expire_on_commit=False)
+
+    async def get_async_db():
+        async with async_factory() as db:
+            yield db
+
+    api.app.dependency_overrides[database.get_async_db] = get_async_db
+    apps = {"sync": make_sync_app(session_factory), "async": api.app}
+    try:
+        for name in args.variants:
+            transport = httpx.ASGITransport(app=apps[name])
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                report(name, await drive(client, args.concurrency, args.duration, run_ids, prompt_ids))
+    finally:
+        api.app.dependency_overrides.clear()
+        await async_engine.dispose()
+        engine.dispose()
+
+async def run_against_server(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=60.0) as client:
+        run = (await client.post("/evolve/", params={"base_prompt": "Write a story", "generations": 5})).json()
+        run_ids, prompt_ids = [run["id"]], run["population_ids"]
+        report("server", await drive(client, args.concurrency, args.duration, run_ids, prompt_ids))
+
+def main():
+    parser = argparse.ArgumentParser(description="API load test")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per variant")
+    parser.add_argument("--variants", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    parser.add_argument("--runs", type=int, default=5, help="Runs stored before the test")
+    parser.add_argument("--population", type=int, default=20)
+    parser.add_argument("--url", help="Load a running server instead of the in-process apps")
+    args = parser.parse_args()
+
+    print(f"concurrency={args.concurrency} duration={args.duration}s cpus={os.cpu_count()}")
+    print(f"{'variant':>8} {'requests':>9} {'errors':>7} {'req/s':>10} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    asyncio.run(run_against_server(args) if args.url else run_in_process(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Per-prompt rating aggregates for LLM-Picbreeder
+"""
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from .models import PromptEvaluation
+
+class RatingAggregate:
+    """Running count, sum, mean and variance of one prompt's ratings
+
+    Uses Welford's update, so adding a rating is O(1) and numerically stable.
+    """
+    __slots__ = ("count", "total", "mean", "m2")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, rating: float):
+        self.count += 1
+        self.total += rating
+        delta = rating - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (rating - self.mean)
+
+    @classmethod
+    def from_moments(cls, count: int, total: float, m2: float) -> "RatingAggregate":
+        aggregate = cls()
+        aggregate.count = count
+        aggregate.total = total
+        aggregate.mean = total / count if count else 0.0
+        aggregate.m2 = m2
+        return aggregate
+
+    @property
+    def variance(self) -> float:
+        """Population variance of the ratings (0 for fewer than two)"""
+        return self.m2 / self.count if self.count > 1 else 0.0
+
+    def bayesian_mean(self, prior_mean: float, prior_weight: float) -> float:
+        """Mean shrunk towards ``prior_mean`` as if ``prior_weight`` extra ratings had that value
+
+        Keeps a prompt with one 5-star rating from outranking one with a
+        hundred 4.8s.
+        """
+        if self.count + prior_weight <= 0:
+            return prior_mean
+        return (prior_weight * prior_mean + self.total) / (prior_weight + self.count)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"count": self.count, "sum": self.total, "mean": self.mean, "variance": self.variance}
+
+class RatingIndex:
+    """Rating aggregates keyed by prompt id, updated as ratings arrive
+
+    ``score`` is the fitness the evolver selects on: the plain mean, or the
+    Bayesian average when a ``prior_weight`` is set.
+    """
+
+    def __init__(self, prior_mean: float = 0.0, prior_weight: float = 0.0):
+        self._aggregates: Dict[int, RatingAggregate] = {}
+        self.prior_mean = prior_mean
+        self.prior_weight = prior_weight
+
+    @classmethod
+    def from_evaluations(cls, evaluations: Iterable[PromptEvaluation]) -> "RatingIndex":
+        index = cls()
+        index.extend(evaluations)
+        return index
+
+    def add(self, prompt_id: int, rating: float):
+        aggregate = self._aggregates.get(prompt_id)
+        if aggregate is None:
+            aggregate = self._aggregates[prompt_id] = RatingAggregate()
+        aggregate.add(rating)
+
+    def add_evaluation(self, evaluation: PromptEvaluation):
+        # Failed LLM requests carry no signal about the prompt
+        if not evaluation.error:
+            self.add(evaluation.prompt_id, evaluation.rating)
+
+    def extend(self, evaluations: Iterable[PromptEvaluation]):
+        for evaluation in evaluations:
+            self.add_evaluation(evaluation)
+
+    def get(self, prompt_id: int) -> Optional[RatingAggregate]:
+        return self._aggregates.get(prompt_id)
+
+    def mean(self, prompt_id: int, default: float = 0.0) -> float:
+        aggregate = self._aggregates.get(prompt_id)
+        return aggregate.mean if aggregate is not None else default
+
+    def score(self, prompt_id: int, default: float = 0.0) -> float:
+        aggregate = self._aggregates.get(prompt_id)
+        if aggregate is None:
+            return default
+        if self.prior_weight > 0:
+            return aggregate.bayesian_mean(self.prior_mean, self.prior_weight)
+        return aggregate.mean
+
+    def set(self, prompt_id: int, aggregate: RatingAggregate):
+        self._aggregates[prompt_id] = aggregate
+
+    def items(self) -> Iterator[Tuple[int, RatingAggregate]]:
+        return iter(self._aggregates.items())
+
+    def __contains__(self, prompt_id) -> bool:
+        return prompt_id in self._aggregates
+
+    def __len__(self) -> int:
+        return len(self._aggregates)
@@ -0,0 +1,103 @@
+"""
+Response cache for LLM-Picbreeder
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+def make_cache_key(model: str, system_message: str, prompt: str,
+                   temperature: float, max_tokens: int) -> str:
+    """Hash everything that determines an LLM generation into a cache key"""
+    payload = json.dumps([model, system_message, prompt, temperature, max_tokens],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """Content-addressed cache of LLM responses
+
+    Entries live in an in-memory LRU of ``max_entries`` items. When ``path``
+    is given, they are also written to a SQLite file so that they survive
+    restarts; disk hits are promoted back into memory.
+    """
+
+    def __init__(self, max_entries: int = 1024, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for ``key``, or None on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, response: str):
+        """Store a response in every tier"""
+        with self._lock:
+            self._remember(key, response)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)",
+                    (key, response)
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, response: str):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+            self.hits = self.disk_hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "persistent": self._db is not None
+        }
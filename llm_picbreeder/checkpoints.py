@@ -0,0 +1,176 @@
+"""
+Run checkpoints for LLM-Picbreeder
+
+Everything a run needs to continue is committed with each generation, but
+its in-memory state, the deduplication and novelty archives, is rebuilt on
+resume by replaying every recorded generation, which grows with the run.
+A checkpoint snapshots that state, with the evolver's random streams and
+the current population, into one compressed ``.npz`` blob stored in
+``run_checkpoints``, so resuming only replays the generations recorded
+since the last checkpoint.
+
+Evaluation aggregates are not duplicated here: the rating summaries are
+committed in the same transaction as each generation.
+"""
+import io
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from .config import settings
+from .database import DBEvolutionRun, DBRunCheckpoint
+from .dedup import Deduplicator
+from .evolver import PromptEvolver
+from .models import PromptEvaluation
+
+FORMAT_VERSION = 1
+NO_USER = -1
+
+def _pack_strings(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """UTF-8 bytes of all texts back to back, and the offsets that split them"""
+    encoded = [text.encode() for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def _unpack_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    raw = data.tobytes()
+    bounds = offsets.tolist()
+    return [raw[bounds[i]:bounds[i + 1]].decode() for i in range(len(bounds) - 1)]
+
+def encode(evolver: PromptEvolver, deduplicator: Optional[Deduplicator], generation: int,
+           population_ids: Sequence[int]) -> bytes:
+    """Serialize a run's evolution state once ``generation`` is its next generation
+    
+    Only reads in-memory state, so it can run in a worker thread.
+    """
+    version, py_state, gauss = evolver.rng.getstate()
+    meta = {
+        "format": FORMAT_VERSION,
+        "generation": generation,
+        "py_rng": [version, gauss],
+        "np_rng": evolver.np_rng.bit_generator.state,
+        "dedup": deduplicator is not None,
+        "reused": deduplicator.reused if deduplicator is not None else 0
+    }
+    arrays: Dict[str, np.ndarray] = {
+        "population_ids": np.array(population_ids, dtype=np.int64),
+        "py_rng_state": np.array(py_state, dtype=np.uint32)
+    }
+
+    if deduplicator is not None:
+        canonicals, signatures, evaluations = deduplicator.snapshot()
+        # MinHash values are below 2**31
+        arrays["dedup_signatures"] = signatures.astype(np.uint32)
+        arrays["dedup_canonical"], arrays["dedup_canonical_offsets"] = _pack_strings(canonicals)
+        arrays["dedup_outputs"], arrays["dedup_output_offsets"] = _pack_strings([e.output_content for e in evaluations])
+        arrays["dedup_prompt_ids"] = np.array([e.prompt_id for e in evaluations], dtype=np.int64)
+        arrays["dedup_ratings"] = np.array([e.rating for e in evaluations], dtype=np.float64)
+        arrays["dedup_user_ids"] = np.array(
+            [NO_USER if e.user_id is None else e.user_id for e in evaluations], dtype=np.int64
+        )
+
+    # Hashed n-gram vectors are mostly zeros, so they are stored sparse
+    novelty = evolver.novelty_archive.snapshot()
+    rows, columns = np.nonzero(novelty["vectors"])
+    arrays["novelty_row_counts"] = np.bincount(rows, minlength=len(novelty["vectors"])).astype(np.int32)
+    arrays["novelty_columns"] = columns.astype(np.uint16)
+    arrays["novelty_values"] = novelty["vectors"][rows, columns]
+    arrays["novelty_centroids"] = novelty["centroids"]
+    arrays["novelty_cells"] = novelty["cells"]
+    arrays["novelty_indexed"] = novelty["indexed"]
+
+    arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+class Checkpoint:
+    """A decoded checkpoint, applied to a fresh evolver and deduplicator with ``restore``"""
+
+    def __init__(self, data: bytes):
+        with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+            self.arrays = {name: npz[name] for name in npz.files}
+        self.meta: Dict[str, Any] = json.loads(self.arrays.pop("meta").tobytes())
+        if self.meta["format"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported checkpoint format {self.meta['format']}")
+
+    @property
+    def generation(self) -> int:
+        return self.meta["generation"]
+
+    @property
+    def population_ids(self) -> List[int]:
+        return self.arrays["population_ids"].tolist()
+
+    def restore(self, evolver: Optional[PromptEvolver], deduplicator: Optional[Deduplicator]):
+        """Load the random streams and archives into a fresh ``evolver`` and ``deduplicator``
+        
+        Either may be None to leave it out.
+        """
+        arrays = self.arrays
+        if deduplicator is not None and self.meta["dedup"]:
+            user_ids = arrays["dedup_user_ids"].tolist()
+            evaluations = [
+                PromptEvaluation(
+                    prompt_id=prompt_id,
+                    output_content=output,
+                    rating=rating,
+                    user_id=None if user_id == NO_USER else user_id
+                )
+                for prompt_id, output, rating, user_id in zip(
+                    arrays["dedup_prompt_ids"].tolist(),
+                    _unpack_strings(arrays["dedup_outputs"], arrays["dedup_output_offsets"]),
+                    arrays["dedup_ratings"].tolist(),
+                    user_ids
+                )
+            ]
+            deduplicator.restore(
+                _unpack_strings(arrays["dedup_canonical"], arrays["dedup_canonical_offsets"]),
+                arrays["dedup_signatures"].astype(np.uint64),
+                evaluations
+            )
+            deduplicator.reused = self.meta["reused"]
+
+        if evolver is None:
+            return
+        version, gauss = self.meta["py_rng"]
+        evolver.rng.setstate((version, tuple(arrays["py_rng_state"].tolist()), gauss))
+        evolver.np_rng.bit_generator.state = self.meta["np_rng"]
+
+        counts = arrays["novelty_row_counts"]
+        vectors = np.zeros((len(counts), evolver.novelty_archive.embedder.dim), dtype=np.float32)
+        vectors[np.repeat(np.arange(len(counts)), counts), arrays["novelty_columns"]] = arrays["novelty_values"]
+        evolver.novelty_archive.restore({
+            "vectors": vectors,
+            "centroids": arrays["novelty_centroids"],
+            "cells": arrays["novelty_cells"],
+            "indexed": arrays["novelty_indexed"]
+        })
+
+def save_checkpoint(db: Session, run_id: int, generation: int, data: bytes) -> DBRunCheckpoint:
+    """Replace the run's checkpoint with an ``encode``d one and commit"""
+    try:
+        checkpoint = db.get(DBRunCheckpoint, run_id)
+        if checkpoint is None:
+            checkpoint = DBRunCheckpoint(run_id=run_id)
+            db.add(checkpoint)
+        checkpoint.generation = generation
+        checkpoint.data = data
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return checkpoint
+
+def load_checkpoint(db: Session, run: DBEvolutionRun) -> Optional[Checkpoint]:
+    """The run's latest checkpoint, or None if it has none that can be used"""
+    row = db.get(DBRunCheckpoint, run.id)
+    if row is None or row.generation > run.next_generation:
+        return None
+    return Checkpoint(row.data)
+
+def due(generation: int) -> bool:
+    """Whether a checkpoint is taken after recording ``generation``"""
+    interval = settings.CHECKPOINT_INTERVAL
+    return interval > 0 and (generation + 1) % interval == 0
@@ -1 +1,262 @@
-\"\"\"\nCommand-line interface for LLM-Picbreeder\n\"\"\"\nimport argparse\nimport random\nfrom . import evolver, llm_interface, models\n\ndef run_evolution_demo(base_prompt: str, generations: int = 3, population_size: int = 5):\n    \"\"\"Run a simple evolution demo\"\"\"\n    print(f\"Starting evolution demo with prompt: '{base_prompt}'\")\n    print(f\"Generations: {generations}, Population size: {population_size}\")\n    print(\"=\" * 60)\n    \n    # Initialize components\n    evolver_instance = evolver.PromptEvolver()\n    llm_interface_instance = llm_interface.LLMInterface()\n    \n    # Override population size for demo\n    evolver_instance.population_size = population_size\n    \n    # Initialize population\n    population = evolver_instance.initialize_population(base_prompt)\n    \n    for gen in range(generations):\n        print(f\"\\nGeneration {gen + 1}\")\n        print(\"-\" * 30)\n        \n        # Generate responses for each prompt\n        evaluations = llm_interface_instance.evaluate_prompt_batch(population)\n        \n        # Display prompts and responses\n        for i, (prompt, evaluation) in enumerate(zip(population, evaluations)):\n            print(f\"\\nPrompt {i+1}: {prompt.content}\")\n            print(f\"Response: {evaluation.output_content[:100]}...\")\n        \n        # For demo purposes, assign random ratings\n        for evaluation in evaluations:\n            evaluation.rating = random.uniform(1.0, 5.0)\n        \n        # Show ratings\n        print(\"\\nRatings:\")\n        for i, evaluation in enumerate(evaluations):\n            print(f\"  Prompt {i+1}: {evaluation.rating:.2f}/5.0\")\n        \n        # Evolve to next generation (except for the last generation)\n        if gen < generations - 1:\n            population = evolver_instance.evolve_population(population, evaluations)\n            print(f\"\\nEvolving to generation {gen + 2}...\")\n    \n    print(\"\\n\" + \"=\" * 60)\n    print(\"Evolution demo completed!\")\n\ndef main():\n    parser = argparse.ArgumentParser(description=\"LLM-Picbreeder CLI\")\n    parser.add_argument(\"--prompt\", type=str, default=\"Write a short story about a robot learning to paint\", \n                        help=\"Base prompt to start evolution\")\n    parser.add_argument(\"--generations\", type=int, default=3, \n                        help=\"Number of generations to evolve\")\n    parser.add_argument(\"--population\", type=int, default=5, \n                        help=\"Population size\")\n    parser.add_argument(\"--demo\", action=\"store_true\", \n                        help=\"Run evolution demo\")\n    \n    args = parser.parse_args()\n    \n    if args.demo:\n        run_evolution_demo(args.prompt, args.generations, args.population)\n    else:\n        print(\"LLM-Picbreeder CLI\")\n        print(\"Use --demo to run an evolution demo\")\n        print(\"Use --help for more options\")\n\nif __name__ == \"__main__\":\n    main()\n
\ No newline at end of file
+"""
+Command-line interface for LLM-Picbreeder
+"""
+import argparse
+import asyncio
+import itertools
+from typing import List, Optional
+from . import evolver, fitness, islands, llm_interface, models, steady_state
+
+def run_evolution_demo(base_prompt: str, generations: int = 3, population_size: int = 5,
+                       seed: Optional[int] = None):
+    """Run a simple evolution demo"""
+    print(f"Starting evolution demo with prompt: '{base_prompt}'")
+    print(f"Generations: {generations}, Population size: {population_size}")
+    print("=" * 60)
+    
+    # Initialize components
+    evolver_instance = evolver.PromptEvolver(seed=seed)
+    llm_interface_instance = llm_interface.LLMInterface()
+    rate_outputs = fitness.make_fitness_function()
+    
+    # Override population size for demo
+    evolver_instance.population_size = population_size
+    
+    # Initialize population
+    population = evolver_instance.initialize_population(base_prompt)
+    
+    # Nothing is stored in the demo, so number the prompts locally
+    next_id = itertools.count(1)
+    
+    for gen in range(generations):
+        print(f"\nGeneration {gen + 1}")
+        print("-" * 30)
+        
+        for prompt in population:
+            if prompt.id is None:
+                prompt.id = next(next_id)
+        
+        # Generate responses for each prompt
+        evaluations = llm_interface_instance.evaluate_prompt_batch(population)
+        
+        # Display prompts and responses
+        for i, (prompt, evaluation) in enumerate(zip(population, evaluations)):
+            print(f"\nPrompt {i+1}: {prompt.content}")
+            print(f"Response: {evaluation.output_content[:100]}...")
+        
+        # Rate the outputs automatically
+        rate_outputs(population, evaluations)
+        
+        # Show ratings
+        print("\nRatings:")
+        for i, evaluation in enumerate(evaluations):
+            print(f"  Prompt {i+1}: {evaluation.rating:.2f}/5.0")
+        
+        # Evolve to next generation (except for the last generation)
+        if gen < generations - 1:
+            population = evolver_instance.evolve_population(population, evaluations)
+            print(f"\nEvolving to generation {gen + 2}...")
+    
+    print("\n" + "=" * 60)
+    print("Evolution demo completed!")
+
+def run_steady_state_demo(base_prompt: str, evaluations: int = 20, population_size: int = 5,
+                          seed: Optional[int] = None):
+    """Run a steady-state evolution demo, breeding as each evaluation completes"""
+    print(f"Starting steady-state demo with prompt: '{base_prompt}'")
+    print(f"Evaluations: {evaluations}, Population size: {population_size}")
+    print("=" * 60)
+    
+    evolver_instance = evolver.PromptEvolver(seed=seed)
+    evolver_instance.population_size = population_size
+    engine = steady_state.SteadyStateEvolver(
+        evolver_instance,
+        llm_interface.LLMInterface(),
+        fitness.make_fitness_function()
+    )
+    
+    def show(prompt, evaluation):
+        print(f"[{engine.completed}] {evaluation.rating:.2f}/5.0  {prompt.content[:60]!r}")
+    
+    ranked = asyncio.run(engine.run(base_prompt, evaluations, on_result=show))
+    
+    print("\nFinal population:")
+    for prompt, evaluation in ranked:
+        print(f"  {evaluation.rating:.2f}/5.0  {prompt.content}")
+    
+    print("\n" + "=" * 60)
+    print("Steady-state demo completed!")
+
+def run_island_model(base_prompt: str, generations: int, island_count: int, population_size: int,
+                     seed: Optional[int] = None, island: Optional[int] = None, run_key: Optional[str] = None):
+    """Run an island-model evolution, or with ``island`` just that island of one spread over hosts"""
+    if island is not None:
+        # Islands on other hosts exchange migrants through the shared database
+        transport = islands.DatabaseTransport(run_key)
+        transport.create_table()
+        results = [islands.run_island(island, island_count, base_prompt, generations, transport,
+                                      seed=seed, population_size=population_size)]
+    else:
+        transport = islands.DatabaseTransport(run_key) if run_key else None
+        results = islands.run_islands(base_prompt, generations, island_count, transport,
+                                      seed=seed, population_size=population_size)
+    
+    for result in results:
+        best = result["population"][0]
+        print(f"\nIsland {result['island']}: best rating per generation "
+              + ", ".join(f"{r:.2f}" for r in result["best_ratings"]))
+        print(f"  Migrants received: {result['migrants_received']}")
+        print(f"  Best prompt ({best['rating']:.2f}/5.0): {best['content']}")
+
+def replay(run_id: int) -> bool:
+    """Check that a stored run is reproduced exactly from its seed and ratings"""
+    from . import database, runs
+    
+    with database.SessionLocal() as db:
+        run = db.get(database.DBEvolutionRun, run_id)
+        if run is None:
+            print(f"Run {run_id} not found")
+            return False
+        
+        print(f"Replaying run {run_id} (seed {(run.config or {}).get('seed')})")
+        reproducible = True
+        for result in runs.replay_run(db, run):
+            status = "ok" if result["matches"] else "MISMATCH"
+            print(f"  Generation {result['generation']}: {result['size']} prompts {status}")
+            reproducible = reproducible and result["matches"]
+    
+    print("Run reproduced exactly" if reproducible else "Run diverged from its recording")
+    return reproducible
+
+def upgrade_db():
+    """Add the columns and indexes introduced since an existing database was created"""
+    from . import database
+    
+    changes = database.upgrade_schema()
+    for change in changes:
+        print(f"  {change}")
+    print(f"Schema is up to date ({len(changes)} changes made)")
+
+def rebuild_lineage():
+    """Recompute the lineage index for prompts stored before it existed"""
+    from . import database, lineage
+    
+    database.init_db()
+    with database.SessionLocal() as db:
+        count = lineage.rebuild_index(db)
+    print(f"Indexed the lineage of {count} prompts")
+
+def rebuild_ratings():
+    """Recompute the rating summaries for evaluations stored before they existed"""
+    from . import database, ratings
+    
+    database.init_db()
+    with database.SessionLocal() as db:
+        count = ratings.rebuild_summaries(db)
+    print(f"Summarized the ratings of {count} prompts")
+
+def export_archive(directory: str, format: str, tables: List[str], incremental: bool):
+    """Export tables to files in ``directory``, resuming from saved watermarks when incremental"""
+    import json
+    import os
+    from . import database, export
+    
+    with database.SessionLocal() as db:
+        if incremental and not export.supports_incremental(db):
+            raise SystemExit("--incremental needs SQLite: on this database rows may commit with ids "
+                             "below a saved watermark and would be skipped")
+    try:
+        export.require_pyarrow(format)
+    except RuntimeError as e:
+        raise SystemExit(f"{e}; install it or use --format ndjson")
+    
+    os.makedirs(directory, exist_ok=True)
+    state_path = os.path.join(directory, "watermarks.json")
+    watermarks = {}
+    if incremental and os.path.exists(state_path):
+        with open(state_path) as f:
+            watermarks = json.load(f)
+    
+    with database.SessionLocal() as db:
+        for table in tables:
+            since = watermarks.get(table, 0)
+            until, stream = export.export_table(db, table, format, since)
+            if until <= since:
+                print(f"  {table}: nothing new since id {since}")
+                continue
+            path = os.path.join(directory, f"{table}-{since + 1}-{until}.{export.FORMATS[format][1]}")
+            with open(path, "wb") as f:
+                for data in stream:
+                    f.write(data)
+            watermarks[table] = until
+            print(f"  {table}: ids {since + 1}-{until} -> {path}")
+    
+    with open(state_path, "w") as f:
+        json.dump(watermarks, f)
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM-Picbreeder CLI")
+    parser.add_argument("--prompt", type=str, default="Write a short story about a robot learning to paint", 
+                        help="Base prompt to start evolution")
+    parser.add_argument("--generations", type=int, default=3, 
+                        help="Number of generations to evolve")
+    parser.add_argument("--population", type=int, default=5, 
+                        help="Population size")
+    parser.add_argument("--seed", type=int, default=None, 
+                        help="Random seed for a reproducible demo")
+    parser.add_argument("--demo", action="store_true", 
+                        help="Run evolution demo")
+    parser.add_argument("--steady-state", type=int, metavar="EVALUATIONS", 
+                        help="Run a steady-state evolution demo with this many evaluations")
+    parser.add_argument("--islands", type=int, metavar="N", 
+                        help="Run an island-model evolution with N islands in local processes")
+    parser.add_argument("--island", type=int, metavar="INDEX", 
+                        help="Run only this island of --islands N, migrating through the database; "
+                             "it uses 1/N of the configured rate limits and concurrency")
+    parser.add_argument("--run-key", type=str, 
+                        help="Name shared by the islands of a run that migrate through the database")
+    parser.add_argument("--replay", type=int, metavar="RUN_ID", 
+                        help="Verify that a stored run replays bit-for-bit")
+    parser.add_argument("--upgrade-db", action="store_true", 
+                        help="Add the columns and indexes an existing database is missing")
+    parser.add_argument("--rebuild-lineage", action="store_true", 
+                        help="Rebuild the prompt lineage index from parent links")
+    parser.add_argument("--rebuild-ratings", action="store_true", 
+                        help="Rebuild the per-prompt rating summaries from stored evaluations")
+    parser.add_argument("--export", metavar="DIR", 
+                        help="Export the archive to files in DIR")
+    parser.add_argument("--format", choices=["ndjson", "parquet", "arrow"], default="ndjson", 
+                        help="File format for --export (parquet and arrow need pyarrow)")
+    parser.add_argument("--tables", nargs="+", default=["prompts", "evaluations", "lineages"], 
+                        help="Tables to export")
+    parser.add_argument("--incremental", action="store_true", 
+                        help="Only export rows added since the last export to DIR")
+    
+    args = parser.parse_args()
+    
+    if args.export:
+        export_archive(args.export, args.format, args.tables, args.incremental)
+    elif args.upgrade_db:
+        upgrade_db()
+    elif args.rebuild_lineage:
+        rebuild_lineage()
+    elif args.rebuild_ratings:
+        rebuild_ratings()
+    elif args.replay is not None:
+        raise SystemExit(0 if replay(args.replay) else 1)
+    elif args.islands is not None:
+        if args.island is not None and not args.run_key:
+            parser.error("--island needs --run-key")
+        run_island_model(args.prompt, args.generations, args.islands, args.population, args.seed,
+                         args.island, args.run_key)
+    elif args.steady_state is not None:
+        run_steady_state_demo(args.prompt, args.steady_state, args.population, args.seed)
+    elif args.demo:
+        run_evolution_demo(args.prompt, args.generations, args.population, args.seed)
+    else:
+        print("LLM-Picbreeder CLI")
+        print("Use --demo to run an evolution demo")
+        print("Use --help for more options")
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 Configuration for LLM-Picbreeder
 """
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 import os
 
 class Settings(BaseSettings):
@@ -11,16 +11,71 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str = "sqlite:///./llm_picbreeder.db"
+    ASYNC_DATABASE_URL: str = ""  # Derived from DATABASE_URL when empty
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800  # Seconds; server databases only
+    DB_POOL_PRE_PING: bool = True
+    SQLITE_WAL: bool = True
+    SQLITE_BUSY_TIMEOUT: float = 30.0  # Seconds to wait on a locked database
+    INGEST_BATCH_SIZE: int = 5000  # Prompts per transaction in bulk uploads
+    EXPORT_CHUNK_SIZE: int = 10000  # Rows held in memory at once during exports
+    RATING_BATCH_SIZE: int = 1000  # Most ratings committed in one transaction by the rating writer
     
     # Evolution parameters
     POPULATION_SIZE: int = 15
     MUTATION_RATE: float = 0.1
     CROSSOVER_RATE: float = 0.7
+    RANDOM_SEED: Optional[int] = None  # Seeds evolvers; runs get a fresh seed when unset
+    SELECTION_METHOD: str = "truncation"  # truncation, tournament, roulette, rank or sus
+    TOURNAMENT_SIZE: int = 3
+    TRUNCATION_FRACTION: float = 0.5
+    BREEDING_WORKERS: int = 0  # 0 breeds in-process; >= 1 uses seeded chunks (> 1 in a process pool)
+    BREEDING_CHUNK_SIZE: int = 512
+    DEDUP_MODE: str = "reuse"  # off, reuse (skip re-evaluating near-duplicates) or replace (also re-mutate them)
+    DEDUP_THRESHOLD: float = 0.9  # Estimated Jaccard similarity of character shingles
+    NOVELTY_WEIGHT: float = 0.0  # Share of fitness from novelty search; 0 selects on ratings alone
+    NOVELTY_K: int = 10  # Nearest archived prompts averaged into a novelty score
+    STEADY_STATE_IN_FLIGHT: int = 8  # Evaluations kept running in steady-state mode
+    CHECKPOINT_INTERVAL: int = 10  # Generations between run checkpoints; 0 disables them
+    ISLAND_COUNT: int = 4  # Sub-populations in an island-model run, one process each
+    MIGRATION_INTERVAL: int = 5  # Generations between migrations
+    MIGRATION_SIZE: int = 2  # Best genomes each island sends to each neighbour
+    MIGRATION_TOPOLOGY: str = "ring"  # ring, star or complete
+    MIGRATION_TIMEOUT: float = 600.0  # Seconds an island waits for its neighbours' migrants
+    MIGRATION_POLL_INTERVAL: float = 0.5  # Seconds between checks for migrants in the database
+    
+    # Automated rating
+    FITNESS_EVALUATORS: str = "constraints:2,readability:1,lexical_diversity:1"  # name[:weight],...
+    FITNESS_REGEX: str = ""  # Outputs must match this pattern (empty disables the check)
+    FITNESS_JSON_SCHEMA: str = ""  # Outputs must be JSON valid against this inline schema (needs jsonschema)
+    RATING_PRIOR_MEAN: float = 3.0  # Bayesian average of user ratings: the prior mean...
+    RATING_PRIOR_WEIGHT: float = 5.0  # ...and how many ratings it counts as
     
     # LLM settings
     DEFAULT_MODEL: str = "gpt-3.5-turbo"
     MAX_TOKENS: int = 500
     TEMPERATURE: float = 0.7
+    MAX_CONCURRENT_REQUESTS: int = 8
+    MIN_CONCURRENT_REQUESTS: int = 1
+    REQUEST_TIMEOUT: float = 60.0
+
+    # Provider quotas (0 disables a budget) and retry policy; islands split them evenly
+    RATE_LIMIT_RPM: int = 0
+    RATE_LIMIT_TPM: int = 0
+    MAX_RETRIES: int = 5
+    RETRY_BACKOFF_BASE: float = 0.5
+    RETRY_BACKOFF_MAX: float = 30.0
+
+    # Background jobs
+    JOB_WORKERS: int = 8
+    JOB_POLL_INTERVAL: float = 1.0
+    RUN_LEASE_TIMEOUT: float = 900.0  # Seconds a run stays claimed without recording a generation
+
+    # Response cache
+    CACHE_SIZE: int = 1024
+    CACHE_PATH: str = ""
     
     class Config:
         env_file = ".env"
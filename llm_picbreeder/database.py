@@ -1,10 +1,14 @@
 """
 Database interface for LLM-Picbreeder
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, ForeignKey, JSON
+from sqlalchemy import create_engine, event, inspect, make_url, text, Boolean, Column, Integer, String, Float, DateTime, Text, ForeignKey, JSON, Index, LargeBinary
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import StaticPool
 from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
 from .config import settings
 
 Base = declarative_base()
@@ -18,9 +22,17 @@ class DBPrompt(Base):
     metadata_json = Column(JSON)
     creator_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     parent_id = Column(Integer, ForeignKey("prompts.id"), nullable=True)
+    run_id = Column(Integer, ForeignKey("evolution_runs.id"), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     complexity_score = Column(Float, default=0.0)
     
+    # Keyset pagination seeks on (created_at, id), optionally within a creator or parent
+    __table_args__ = (
+        Index("ix_prompts_created_at_id", "created_at", "id"),
+        Index("ix_prompts_creator_created_at", "creator_id", "created_at", "id"),
+        Index("ix_prompts_parent_created_at", "parent_id", "created_at", "id"),
+    )
+    
     # Relationships
     children = relationship("DBPrompt", back_populates="parent")
     parent = relationship("DBPrompt", back_populates="children", remote_side=[id])
@@ -35,8 +47,15 @@ class DBEvaluation(Base):
     output_content = Column(Text, nullable=False)
     rating = Column(Float, nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    run_id = Column(Integer, ForeignKey("evolution_runs.id"), nullable=True)
+    generation = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)  # Set when the LLM request failed
+    fitness = Column(Float, nullable=True)  # What selection used for a run's evaluation, so replays can too
+    reused = Column(Boolean, nullable=True, default=False)  # Copied from a near-duplicate, not a new rating
     created_at = Column(DateTime, default=datetime.utcnow)
     
+    __table_args__ = (Index("ix_evaluations_run_generation", "run_id", "generation"),)
+    
     # Relationships
     prompt = relationship("DBPrompt", back_populates="evaluations")
     user = relationship("DBUser", back_populates="evaluations")
@@ -56,18 +75,233 @@ class DBLineage(Base):
     __tablename__ = "lineages"
     
     id = Column(Integer, primary_key=True, index=True)
-    prompt_id = Column(Integer, ForeignKey("prompts.id"), nullable=False)
+    prompt_id = Column(Integer, ForeignKey("prompts.id"), nullable=False, index=True)
     ancestor_ids = Column(JSON)
     generation = Column(Integer, default=0)
     branch_point = Column(Integer, nullable=True)
+    run_id = Column(Integer, ForeignKey("evolution_runs.id"), nullable=True, index=True)
+
+class DBPromptClosure(Base):
+    """Closure table over ``prompts.parent_id``: one row per (ancestor, descendant) pair
+    
+    Every prompt is its own ancestor at depth 0, so a whole family tree in
+    either direction is a single indexed lookup.
+    """
+    __tablename__ = "prompt_closure"
+    
+    ancestor_id = Column(Integer, ForeignKey("prompts.id"), primary_key=True)
+    descendant_id = Column(Integer, ForeignKey("prompts.id"), primary_key=True)
+    depth = Column(Integer, nullable=False)
+    
+    __table_args__ = (Index("ix_prompt_closure_descendant_depth", "descendant_id", "depth"),)
+
+class DBRatingSummary(Base):
+    """Running aggregate of a prompt's ratings, merged into as evaluations are stored
+    
+    ``m2`` is the sum of squared deviations from the mean (Welford), so the
+    variance is ``m2 / count``.
+    """
+    __tablename__ = "rating_summaries"
+    
+    prompt_id = Column(Integer, ForeignKey("prompts.id"), primary_key=True)
+    count = Column(Integer, nullable=False)
+    total = Column(Float, nullable=False)
+    m2 = Column(Float, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DBEvolutionRun(Base):
+    __tablename__ = "evolution_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    base_prompt = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="running")  # running, paused, completed or failed
+    next_generation = Column(Integer, nullable=False, default=0)
+    population_ids = Column(JSON)  # Current population, awaiting evaluation
+    config = Column(JSON)
+    error = Column(Text, nullable=True)
+    # Whoever is evolving the run holds it until the lease expires; each generation renews it
+    lease_owner = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DBRunCheckpoint(Base):
+    """A run's latest checkpoint: its in-memory evolution state as a compressed ``.npz`` blob"""
+    __tablename__ = "run_checkpoints"
+    
+    run_id = Column(Integer, ForeignKey("evolution_runs.id"), primary_key=True)
+    generation = Column(Integer, nullable=False)  # The run's next_generation when it was taken
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DBJob(Base):
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("evolution_runs.id"), nullable=False, index=True)
+    status = Column(String, nullable=False, default="queued", index=True)
+    target_generation = Column(Integer, nullable=False)
+    progress = Column(JSON)  # One summary per completed generation
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class DBMigration(Base):
+    """Genomes one island of an island-model run sends another, for islands on different hosts"""
+    __tablename__ = "migrations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    run_key = Column(String, nullable=False)
+    generation = Column(Integer, nullable=False)
+    source = Column(Integer, nullable=False)
+    target = Column(Integer, nullable=False)
+    migrants = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (Index("ix_migrations_inbox", "run_key", "target", "generation"),)
+
+def is_sqlite(url) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def _is_sqlite_memory(url) -> bool:
+    return make_url(url).database in (None, "", ":memory:")
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # WAL lets readers run alongside the single writer; waiting on a
+        # locked database instead of failing at once avoids spurious errors
+        if settings.SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT * 1000)}")
+    finally:
+        cursor.close()
+
+def _engine_options(url) -> Dict[str, Any]:
+    """Dialect-specific ``create_engine`` arguments built from settings"""
+    if is_sqlite(url):
+        if _is_sqlite_memory(url):
+            # Every connection to :memory: is a separate database, so share one
+            return {"connect_args": {"check_same_thread": False}, "poolclass": StaticPool}
+        return {
+            "connect_args": {"check_same_thread": False, "timeout": settings.SQLITE_BUSY_TIMEOUT},
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "pool_timeout": settings.DB_POOL_TIMEOUT
+        }
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING
+    }
+
+def create_db_engine(url: Optional[str] = None, **overrides) -> Engine:
+    """Create an engine for ``url`` (default ``DATABASE_URL``) with pooling from settings
+
+    SQLite file databases get WAL mode and a busy timeout on every new
+    connection; server databases such as PostgreSQL get pool pre-ping and
+    recycling so connections dropped by the server are replaced.
+    """
+    url = url or settings.DATABASE_URL
+    engine = create_engine(url, **{**_engine_options(url), **overrides})
+    if is_sqlite(url) and not _is_sqlite_memory(url):
+        event.listen(engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+# Async drivers for each sync URL scheme
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def async_database_url(url: Optional[str] = None) -> str:
+    """The async-driver form of a database URL, honouring ASYNC_DATABASE_URL"""
+    if url is None and settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    url = make_url(url or settings.DATABASE_URL)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for {backend!r}; set ASYNC_DATABASE_URL")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+def create_async_db_engine(url: Optional[str] = None, **overrides):
+    """Async counterpart of ``create_db_engine`` (needs aiosqlite or asyncpg)"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = async_database_url(url)
+    engine = create_async_engine(url, **{**_engine_options(url), **overrides})
+    if is_sqlite(url) and not _is_sqlite_memory(url):
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return engine
 
 # Create database engine and session
-engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
+engine = create_db_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+_async_sessionmaker = None
+
+def get_async_sessionmaker():
+    """Session factory for the async engine, created on first use"""
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        _async_sessionmaker = async_sessionmaker(create_async_db_engine(), expire_on_commit=False)
+    return _async_sessionmaker
+
+def _apply(ddl: Callable[[], None], applied: Callable[[], bool]):
+    # Another process upgrading the same database may get there first
+    try:
+        ddl()
+    except DBAPIError:
+        if not applied():
+            raise
+
+def upgrade_schema(bind: Optional[Engine] = None) -> List[str]:
+    """Bring an existing database up to the current schema; returns the changes made
+    
+    ``create_all`` only creates missing tables, so the columns and indexes
+    added to existing tables since a database was created are added here.
+    Only nullable columns can be added. Does nothing on an up-to-date database.
+    """
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    preparer = bind.dialect.identifier_preparer
+    changes = []
+    
+    for table in Base.metadata.sorted_tables:
+        def column_names():
+            return {c["name"] for c in inspect(bind).get_columns(table.name)}
+        
+        def index_names():
+            return {i["name"] for i in inspect(bind).get_indexes(table.name)}
+        
+        existing = column_names()
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable and column.server_default is None:
+                raise RuntimeError(f"{table.name}.{column.name} is required and cannot be added automatically")
+            statement = text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                             f"{preparer.format_column(column)} {column.type.compile(dialect=bind.dialect)}")
+            
+            def add_column():
+                with bind.begin() as connection:
+                    connection.execute(statement)
+            
+            _apply(add_column, lambda: column.name in column_names())
+            changes.append(f"added column {table.name}.{column.name}")
+        
+        existing = index_names()
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                _apply(lambda: index.create(bind), lambda: index.name in index_names())
+                changes.append(f"created index {index.name}")
+    return changes
+
 def init_db():
-    """Initialize the database"""
-    Base.metadata.create_all(bind=engine)
+    """Initialize the database, upgrading the schema of an existing one"""
+    upgrade_schema(engine)
 
 def get_db():
     """Get database session"""
@@ -75,4 +309,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Get an async database session"""
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -0,0 +1,226 @@
+"""
+Near-duplicate detection for LLM-Picbreeder
+
+Prompts are canonicalized (case and whitespace folded), cut into character
+shingles and summarized by MinHash signatures. Signatures are bucketed by
+LSH bands, so finding the near-duplicates of a prompt among everything
+already evaluated only compares it with a handful of candidates.
+
+A ``Deduplicator`` sits in front of the LLM: members of a population that
+are near-duplicates of an earlier member, or of a prompt evaluated before,
+reuse that evaluation instead of costing a request. Optionally, duplicate
+offspring are re-mutated before they are stored so the population keeps
+its diversity.
+"""
+import re
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+from .config import settings
+from .models import PromptEvaluation, PromptGenome
+
+DEDUP_MODES = ("off", "reuse", "replace")
+
+_PRIME = (1 << 31) - 1
+_WHITESPACE = re.compile(r"\s+")
+
+def canonicalize(text: str) -> str:
+    """Fold case and runs of whitespace, which never change a prompt's meaning"""
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+class MinHasher:
+    """MinHash signatures over character shingles of canonical text
+
+    The hash permutations come from a fixed seed, so signatures from
+    different processes and sessions are comparable.
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, canonical: str) -> np.ndarray:
+        k = self.shingle_size
+        grams = {canonical[i:i + k] for i in range(max(1, len(canonical) - k + 1))}
+        return np.fromiter((zlib.crc32(g.encode()) & _PRIME for g in grams), dtype=np.uint64, count=len(grams))
+
+    def signature(self, canonical: str) -> np.ndarray:
+        hashes = self.shingles(canonical)
+        # (a * x + b) mod p stays below 2**63 because a, x, b < 2**31
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+
+class LSHIndex:
+    """Buckets signatures by band so similar ones collide in at least one band"""
+
+    def __init__(self, num_perm: int = 64, bands: int = 8):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(bands)]
+        self._signatures: List[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, signature: np.ndarray) -> int:
+        """Index a signature and return its position"""
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        for band, key in self._keys(signature):
+            self._buckets[band].setdefault(key, []).append(position)
+        return position
+
+    def nearest(self, signature: np.ndarray, threshold: float) -> Optional[Tuple[int, float]]:
+        """The most similar indexed signature at or above ``threshold``, if any"""
+        candidates = set()
+        for band, key in self._keys(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+        best = None
+        for position in candidates:
+            similarity = float(np.mean(self._signatures[position] == signature))
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (position, similarity)
+        return best
+
+# Where a duplicate's evaluation comes from: an earlier population member
+# (by position) or an evaluation from the archive
+Source = Union[int, PromptEvaluation]
+
+class Deduplicator:
+    """Finds near-duplicate prompts in a population and in the evaluated archive"""
+
+    def __init__(self, threshold: Optional[float] = None, num_perm: int = 64, bands: int = 8):
+        self.threshold = threshold if threshold is not None else settings.DEDUP_THRESHOLD
+        self.hasher = MinHasher(num_perm)
+        self._index = LSHIndex(num_perm, bands)
+        self._exact: Dict[str, int] = {}
+        self._archive: List[PromptEvaluation] = []
+        self.reused = 0
+
+    def __len__(self) -> int:
+        return len(self._archive)
+
+    def _match(self, canonical: str, signature: np.ndarray) -> Optional[PromptEvaluation]:
+        position = self._exact.get(canonical)
+        if position is None:
+            nearest = self._index.nearest(signature, self.threshold)
+            position = nearest[0] if nearest else None
+        return self._archive[position] if position is not None else None
+
+    def add(self, content: str, evaluation: PromptEvaluation):
+        """Remember a successful evaluation so later duplicates can reuse it"""
+        if evaluation.error:
+            return
+        canonical = canonicalize(content)
+        if canonical in self._exact:
+            return
+        self._exact[canonical] = self._index.add(self.hasher.signature(canonical))
+        self._archive.append(evaluation)
+
+    def snapshot(self) -> Tuple[List[str], np.ndarray, List[PromptEvaluation]]:
+        """The archive's canonical texts, signatures and evaluations, in the order they were added"""
+        signatures = np.array(self._index._signatures, dtype=np.uint64).reshape(len(self), self.hasher.num_perm)
+        return list(self._exact), signatures, list(self._archive)
+
+    def restore(self, canonicals: List[str], signatures: np.ndarray, evaluations: List[PromptEvaluation]):
+        """Refill an empty archive from a ``snapshot``, without recomputing signatures"""
+        for canonical, signature, evaluation in zip(canonicals, signatures, evaluations):
+            self._exact[canonical] = self._index.add(signature)
+            self._archive.append(evaluation)
+
+    def split(self, population: List[PromptGenome]) -> Tuple[List[PromptGenome], Dict[int, Source]]:
+        """Separate the prompts that need evaluating from the duplicates
+
+        Returns the members to evaluate, in population order, and for each
+        duplicate (by position) where its evaluation should come from.
+        """
+        fresh, duplicates = [], {}
+        seen = LSHIndex(self.hasher.num_perm, self._index.bands)
+        seen_exact: Dict[str, int] = {}
+        seen_positions: List[int] = []
+        for position, genome in enumerate(population):
+            canonical = canonicalize(genome.content)
+            signature = self.hasher.signature(canonical)
+            archived = self._match(canonical, signature)
+            if archived is not None:
+                duplicates[position] = archived
+                continue
+            earlier = seen_exact.get(canonical)
+            if earlier is None:
+                nearest = seen.nearest(signature, self.threshold)
+                earlier = seen_positions[nearest[0]] if nearest else None
+            if earlier is not None:
+                duplicates[position] = earlier
+                continue
+            seen_exact[canonical] = position
+            seen.add(signature)
+            seen_positions.append(position)
+            fresh.append(genome)
+        return fresh, duplicates
+
+    def merge(self, population: List[PromptGenome], fresh_evaluations: List[PromptEvaluation],
+              duplicates: Dict[int, Source]) -> List[PromptEvaluation]:
+        """Evaluations for the whole population, copying each duplicate's source
+
+        Call after the fresh evaluations have been rated; the fresh ones are
+        added to the archive.
+        """
+        fresh = iter(fresh_evaluations)
+        evaluations: List[PromptEvaluation] = []
+        for position, genome in enumerate(population):
+            source = duplicates.get(position)
+            if source is None:
+                evaluation = next(fresh)
+                self.add(genome.content, evaluation)
+            else:
+                original = evaluations[source] if isinstance(source, int) else source
+                evaluation = original.model_copy(update={"id": None, "prompt_id": genome.id, "reused": True})
+                self.reused += 1
+            evaluations.append(evaluation)
+        return evaluations
+
+    def absorb(self, population: List[PromptGenome], evaluations: List[PromptEvaluation]):
+        """Add a rated generation to the archive exactly as ``split``/``merge`` would have
+
+        Used to rebuild the archive from recorded generations, so a resumed
+        or replayed run sees the same archive as the original one did.
+        """
+        fresh, duplicates = self.split(population)
+        for position, genome in enumerate(population):
+            if position not in duplicates:
+                self.add(genome.content, evaluations[position])
+
+    def diversify(self, population: List[PromptGenome], mutate: Callable[[str], str], attempts: int = 3):
+        """Re-mutate new offspring that duplicate the archive or an earlier member
+
+        Only genomes without an id (not yet stored) are touched; each gets up
+        to ``attempts`` mutations and is kept as is if none is distinct.
+        """
+        seen = LSHIndex(self.hasher.num_perm, self._index.bands)
+        seen_exact = set()
+        for genome in population:
+            content = genome.content
+            for attempt in range(attempts + 1):
+                canonical = canonicalize(content)
+                signature = self.hasher.signature(canonical)
+                duplicate = (
+                    canonical in seen_exact
+                    or seen.nearest(signature, self.threshold) is not None
+                    or self._match(canonical, signature) is not None
+                )
+                if not duplicate or genome.id is not None or attempt == attempts:
+                    break
+                content = mutate(content)
+            if content != genome.content:
+                genome.content = content
+                genome.metadata = {**genome.metadata, "deduplicated": True}
+            seen_exact.add(canonical)
+            seen.add(signature)
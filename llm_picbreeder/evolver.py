@@ -1,34 +1,75 @@
 """
 Evolution engine for LLM-Picbreeder
 """
+import multiprocessing
 import random
 import string
-from typing import List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Union
+import numpy as np
+from . import novelty, selection
+from .aggregates import RatingIndex
+from .population import NO_ID, Population
 from .models import PromptGenome, PromptEvaluation
 from .config import settings
 
 class PromptEvolver:
     """Handles the evolutionary operations for prompts"""
     
-    def __init__(self):
+    def __init__(self, seed: Optional[int] = None):
         self.mutation_rate = settings.MUTATION_RATE
         self.crossover_rate = settings.CROSSOVER_RATE
         self.population_size = settings.POPULATION_SIZE
+        self.selection_method = settings.SELECTION_METHOD
+        self.tournament_size = settings.TOURNAMENT_SIZE
+        self.truncation_fraction = settings.TRUNCATION_FRACTION
+        self.breeding_workers = settings.BREEDING_WORKERS
+        self.breeding_chunk_size = settings.BREEDING_CHUNK_SIZE
+        self.novelty_weight = settings.NOVELTY_WEIGHT
+        self.novelty_k = settings.NOVELTY_K
+        self.novelty_archive = novelty.NoveltyArchive()
+        self._executor = None
+        self.reseed(seed if seed is not None else settings.RANDOM_SEED)
+    
+    def reseed(self, seed: Optional[int]):
+        """Reset every random stream the evolver draws from
+        
+        All operators use ``rng`` and selection uses ``np_rng``, so a seeded
+        evolver is fully reproducible. ``None`` seeds from OS entropy.
+        """
+        self.seed = seed
+        self._set_streams(np.random.SeedSequence(seed))
+    
+    def seed_generation(self, generation: int):
+        """Derive the streams used to produce ``generation`` of a seeded run
+        
+        Each generation gets its own stream keyed on (seed, generation), so a
+        run resumed or replayed from any generation makes the same draws.
+        Unseeded evolvers keep their current streams.
+        """
+        if self.seed is None:
+            return
+        self._set_streams(np.random.SeedSequence(self.seed, spawn_key=(generation,)))
+    
+    def _set_streams(self, sequence: np.random.SeedSequence):
+        py_sequence, np_sequence = sequence.spawn(2)
+        self.rng = random.Random(int(py_sequence.generate_state(1, np.uint64)[0]))
+        self.np_rng = np.random.default_rng(np_sequence)
     
     def initialize_population(self, base_prompt: str = "", size: int = None) -> List[PromptGenome]:
         """Create an initial population of prompt variants"""
+        return self.initialize_arrays(base_prompt, size).to_genomes()
+    
+    def initialize_arrays(self, base_prompt: str = "", size: int = None) -> Population:
+        """Create an initial columnar population of prompt variants"""
         if size is None:
             size = self.population_size
             
-        population = []
+        population = Population(capacity=size)
         for i in range(size):
             # Create variations of the base prompt
             variant = self._mutate_prompt(base_prompt, initial=True)
-            genome = PromptGenome(
-                content=variant,
-                metadata={"source": "initial_population", "variant_id": i}
-            )
-            population.append(genome)
+            population.append(variant, "initial_population")
             
         return population
     
@@ -42,11 +83,11 @@ class PromptEvolver:
                 self._add_example,
                 self._reorder_elements
             ]
-            mutation = random.choice(mutations)
+            mutation = self.rng.choice(mutations)
             return mutation(prompt)
         
         # For evolutionary mutations
-        if random.random() < self.mutation_rate:
+        if self.rng.random() < self.mutation_rate:
             mutations = [
                 self._add_instruction,
                 self._change_tone,
@@ -56,14 +97,25 @@ class PromptEvolver:
             ]
             
             # Apply one or more mutations
-            num_mutations = random.randint(1, 2)
+            num_mutations = self.rng.randint(1, 2)
             for _ in range(num_mutations):
                 if prompt:  # Only mutate non-empty prompts
-                    mutation = random.choice(mutations)
+                    mutation = self.rng.choice(mutations)
                     prompt = mutation(prompt)
                     
         return prompt
     
+    def mutate(self, prompt: str) -> str:
+        """Apply exactly one evolutionary mutation, regardless of the mutation rate"""
+        mutations = [
+            self._add_instruction,
+            self._change_tone,
+            self._substitute_words,
+            self._add_constraints,
+            self._remove_elements
+        ]
+        return self.rng.choice(mutations)(prompt)
+    
     def _add_instruction(self, prompt: str) -> str:
         """Add an instruction to the prompt"""
         instructions = [
@@ -74,7 +126,7 @@ class PromptEvolver:
             "Use examples to illustrate your points."
         ]
         
-        instruction = random.choice(instructions)
+        instruction = self.rng.choice(instructions)
         if prompt:
             return f"{prompt}\n\n{instruction}"
         return instruction
@@ -90,7 +142,7 @@ class PromptEvolver:
         ]
         
         # Replace or add tone instruction
-        tone = random.choice(tone_changes)
+        tone = self.rng.choice(tone_changes)
         if "You are" in prompt:
             lines = prompt.split('\n')
             for i, line in enumerate(lines):
@@ -116,7 +168,7 @@ class PromptEvolver:
         for i, word in enumerate(words):
             clean_word = word.lower().strip(string.punctuation)
             if clean_word in substitutions:
-                words[i] = random.choice(substitutions[clean_word])
+                words[i] = self.rng.choice(substitutions[clean_word])
                 
         return ' '.join(words)
     
@@ -130,7 +182,7 @@ class PromptEvolver:
             "Avoid jargon and acronyms."
         ]
         
-        constraint = random.choice(constraints)
+        constraint = self.rng.choice(constraints)
         return f"{prompt}\n\n{constraint}"
     
     def _remove_elements(self, prompt: str) -> str:
@@ -138,7 +190,7 @@ class PromptEvolver:
         lines = prompt.split('\n')
         if len(lines) > 1:
             # Remove a random line (but not the first one)
-            idx = random.randint(1, len(lines) - 1)
+            idx = self.rng.randint(1, len(lines) - 1)
             lines.pop(idx)
             return '\n'.join(lines)
         return prompt
@@ -151,7 +203,7 @@ class PromptEvolver:
             "As an illustration: When discussing gravity, consider..."
         ]
         
-        example = random.choice(examples)
+        example = self.rng.choice(examples)
         return f"{prompt}\n\n{example}"
     
     def _reorder_elements(self, prompt: str) -> str:
@@ -160,20 +212,25 @@ class PromptEvolver:
         if len(lines) > 2:
             # Shuffle middle lines
             middle = lines[1:-1]
-            random.shuffle(middle)
+            self.rng.shuffle(middle)
             lines = [lines[0]] + middle + [lines[-1]]
             return '\n'.join(lines)
         return prompt
     
-    def crossover(self, parent1: PromptGenome, parent2: PromptGenome) -> PromptGenome:
-        """Create a new prompt by combining two parents"""
-        if random.random() > self.crossover_rate:
+    def _recombine(self, content1: str, content2: str) -> Tuple[str, int]:
+        """Combine two prompt texts
+        
+        Returns the child text and which parent it copies (0 or 1), or -1
+        when the parents were actually crossed over.
+        """
+        if self.rng.random() > self.crossover_rate:
             # Return one of the parents without crossover
-            return random.choice([parent1, parent2])
+            which = self.rng.choice([0, 1])
+            return (content1, content2)[which], which
         
         # Simple crossover - combine parts of both prompts
-        lines1 = parent1.content.split('\n')
-        lines2 = parent2.content.split('\n')
+        lines1 = content1.split('\n')
+        lines2 = content2.split('\n')
         
         # Create child by combining lines from both parents
         child_lines = []
@@ -182,13 +239,25 @@ class PromptEvolver:
         for i in range(max_lines):
             if i < len(lines1) and i < len(lines2):
                 # Choose line from either parent
-                child_lines.append(random.choice([lines1[i], lines2[i]]))
+                child_lines.append(self.rng.choice([lines1[i], lines2[i]]))
             elif i < len(lines1):
                 child_lines.append(lines1[i])
             else:
                 child_lines.append(lines2[i])
         
-        child_content = '\n'.join(child_lines)
+        return '\n'.join(child_lines), -1
+    
+    def crossover(self, parent1: PromptGenome, parent2: PromptGenome) -> PromptGenome:
+        """Create a new prompt by combining two parents"""
+        child_content, copied = self._recombine(parent1.content, parent2.content)
+        if copied >= 0:
+            # The copy is a new individual, so mutating it must not touch the parent
+            parent = (parent1, parent2)[copied]
+            return PromptGenome(
+                content=child_content,
+                metadata={"source": "clone", "parent_id": parent.id},
+                parent_id=parent.id
+            )
         
         # Create new genome
         child = PromptGenome(
@@ -203,51 +272,163 @@ class PromptEvolver:
         
         return child
     
-    def evolve_population(self, population: List[PromptGenome], 
-                         evaluations: List[PromptEvaluation]) -> List[PromptGenome]:
-        """Create a new generation from the current population"""
-        # Sort population by evaluation ratings
-        rated_prompts = []
-        for prompt in population:
-            # Find evaluations for this prompt
-            prompt_evals = [e for e in evaluations if e.prompt_id == prompt.id]
-            if prompt_evals:
-                avg_rating = sum(e.rating for e in prompt_evals) / len(prompt_evals)
-                rated_prompts.append((prompt, avg_rating))
-            else:
-                rated_prompts.append((prompt, 0.0))
+    def rank_population(self, population: List[PromptGenome],
+                        evaluations: Union[List[PromptEvaluation], RatingIndex]) -> List[Tuple[PromptGenome, float]]:
+        """Pair each prompt with its rating score, best first
+        
+        ``evaluations`` may be a raw list or a ``RatingIndex`` that is kept up
+        to date as ratings arrive (e.g. one loaded from the rating summaries);
+        either way each prompt's fitness is an O(1) lookup. Unrated prompts
+        score 0.0.
+        """
+        if not isinstance(evaluations, RatingIndex):
+            evaluations = RatingIndex.from_evaluations(evaluations)
+        
+        rated_prompts = [(prompt, evaluations.score(prompt.id)) for prompt in population]
         
         # Sort by rating (descending)
         rated_prompts.sort(key=lambda x: x[1], reverse=True)
+        return rated_prompts
+    
+    def evolve_population(self, population: List[PromptGenome], 
+                         evaluations: Union[List[PromptEvaluation], RatingIndex]) -> List[PromptGenome]:
+        """Create a new generation from the current population"""
+        if not isinstance(evaluations, RatingIndex):
+            evaluations = RatingIndex.from_evaluations(evaluations)
         
-        # Select top performers (tournament selection)
-        selected = [prompt for prompt, rating in rated_prompts[:self.population_size//2]]
+        arrays = Population.from_genomes(population)
+        arrays.fitness[:] = [evaluations.score(p.id) for p in population]
+        return self.evolve_arrays(arrays).to_genomes()
+    
+    def evolve_arrays(self, population: Population) -> Population:
+        """Create a new generation from a columnar population
         
-        # Create new population through crossover and mutation
-        new_population = []
+        Fitness is read from ``population.fitness``, blended with novelty
+        when ``novelty_weight`` is set. Offspring are recorded as rows
+        referencing interned content, so no genomes are built here.
+        """
+        fitness = population.fitness
+        if self.novelty_weight > 0:
+            fitness = self.novelty_fitness(population)
         
         # Keep some of the best unchanged (elitism)
-        elite_count = max(1, self.population_size // 5)
-        new_population.extend(selected[:elite_count])
+        elite_count = min(len(population), max(1, self.population_size // 5))
+        order = np.argsort(-fitness, kind="stable")
+        new_population = population.take(order[:elite_count])
         
         # Fill the rest with offspring
-        while len(new_population) < self.population_size:
-            # Select parents
-            parent1 = random.choice(selected)
-            parent2 = random.choice(selected)
-            
-            # Create child
-            if parent1.id != parent2.id:  # Ensure different parents
-                child = self.crossover(parent1, parent2)
+        generation = int(population.generation.max(initial=0)) + 1
+        num_offspring = max(0, self.population_size - len(new_population))
+        return self.breed_offspring(population, fitness, num_offspring, new_population, generation)
+    
+    def breed_offspring(self, population: Population, fitness: np.ndarray, count: int,
+                        into: Optional[Population] = None, generation: int = 0) -> Population:
+        """Select ``count`` parent pairs on ``fitness`` and append their children to ``into``
+        
+        Every parent is drawn in one selector call. Returns ``into``, or a
+        new population sharing ``population``'s content pool.
+        """
+        if into is None:
+            into = Population(population.pool, capacity=count)
+        selector = selection.make_selector(
+            self.selection_method,
+            tournament_size=self.tournament_size,
+            truncation_fraction=self.truncation_fraction
+        )
+        parents = selector(fitness, 2 * count, self.np_rng).reshape(-1, 2)
+        
+        ids = population.ids
+        for (i, j), (content, copied) in zip(parents, self._breed(population, parents)):
+            if copied == CROSSED:
+                source, parent_id, parent2_id = "crossover", ids[i], ids[j]
+            elif copied == MUTATED:
+                source, parent_id, parent2_id = "mutation", ids[i], NO_ID
             else:
-                # If same parent, just mutate
-                child = PromptGenome(
-                    content=parent1.content,
-                    metadata={"source": "mutation", "parent_id": parent1.id}
-                )
+                source, parent_id, parent2_id = "clone", ids[(i, j)[copied]], NO_ID
             
-            # Apply mutation
-            child.content = self._mutate_prompt(child.content)
-            new_population.append(child)
+            into.append(
+                content,
+                source,
+                parent_id=parent_id,
+                parent2_id=parent2_id,
+                generation=generation
+            )
+        
+        return into
+    
+    def novelty_fitness(self, population: Population) -> np.ndarray:
+        """Ratings blended with each member's novelty against the archive
         
-        return new_population
\ No newline at end of file
+        The population is archived first, so members are also compared with
+        each other; every evaluated generation stays in the archive.
+        """
+        texts = [population.content_of(row) for row in range(len(population))]
+        self.novelty_archive.add(texts)
+        scores = self.novelty_archive.novelty(texts, self.novelty_k, exclude_self=True)
+        return novelty.blend(population.fitness, scores, self.novelty_weight)
+    
+    def _breed(self, population: Population, parents: np.ndarray) -> List[Tuple[str, int]]:
+        """Produce one (content, copied) child per parent pair
+        
+        ``copied`` is CROSSED, MUTATED or the index of the cloned parent.
+        With ``breeding_workers`` set, pairs are split into fixed-size chunks
+        that each get their own seed drawn from ``np_rng``, so the offspring
+        depend only on that generator and not on how many workers run them.
+        """
+        pairs = [
+            (population.content_of(i), population.content_of(j) if i != j else None)
+            for i, j in parents
+        ]
+        
+        if not self.breeding_workers:
+            return [_breed_pair(self, content1, content2) for content1, content2 in pairs]
+        
+        chunk_size = self.breeding_chunk_size
+        chunks = [pairs[k:k + chunk_size] for k in range(0, len(pairs), chunk_size)]
+        seeds = np.random.SeedSequence(int(self.np_rng.integers(2 ** 63))).spawn(len(chunks))
+        tasks = [
+            (chunk, self.mutation_rate, self.crossover_rate, int(seed.generate_state(1)[0]))
+            for chunk, seed in zip(chunks, seeds)
+        ]
+        
+        if self.breeding_workers == 1:
+            results = map(_breed_chunk, tasks)
+        else:
+            if self._executor is None:
+                # Spawned, not forked: the API process has job and LLM threads running
+                self._executor = ProcessPoolExecutor(max_workers=self.breeding_workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            results = self._executor.map(_breed_chunk, tasks)
+        return [child for chunk in results for child in chunk]
+    
+    def close(self):
+        """Shut down the breeding process pool, if one was started
+        
+        Whoever creates an evolver closes it once done breeding with it.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+CROSSED = -1
+MUTATED = -2
+
+def _breed_pair(evolver: PromptEvolver, content1: str, content2: Optional[str]) -> Tuple[str, int]:
+    # Create child
+    if content2 is not None:  # Ensure different parents
+        content, copied = evolver._recombine(content1, content2)
+        copied = CROSSED if copied < 0 else copied
+    else:
+        # If same parent, just mutate
+        content, copied = content1, MUTATED
+    
+    # Apply mutation
+    return evolver._mutate_prompt(content), copied
+
+def _breed_chunk(task) -> List[Tuple[str, int]]:
+    """Breed one chunk of parent pairs; runs in a worker process"""
+    pairs, mutation_rate, crossover_rate, seed = task
+    breeder = PromptEvolver(seed=seed)
+    breeder.mutation_rate = mutation_rate
+    breeder.crossover_rate = crossover_rate
+    return [_breed_pair(breeder, content1, content2) for content1, content2 in pairs]
@@ -0,0 +1,176 @@
+"""
+Streaming export of the prompt archive for LLM-Picbreeder
+
+Rows of the ``prompts``, ``evaluations`` and ``lineages`` tables are read
+in id order through a streaming cursor, ``EXPORT_CHUNK_SIZE`` at a time,
+and encoded as NDJSON, Parquet or an Arrow IPC stream chunk by chunk, so
+memory use does not grow with the size of the archive.
+
+Every export covers the ids in ``(since, watermark]``, where the watermark
+is the table's highest id when the export starts. Passing the watermark of
+one export as ``since`` to the next exports only the rows added in between.
+That is only sound where ids commit in order, as on SQLite, whose writers
+are serialized. PostgreSQL hands out ids before commit, so a transaction
+open during an export can later commit rows below its watermark; exports
+from ``since`` are refused there and only full exports are available.
+"""
+import io
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import DateTime, Float, Integer, JSON, Table, func, select
+from sqlalchemy.orm import Session
+from .config import settings
+from .database import DBEvaluation, DBLineage, DBPrompt, is_sqlite
+
+TABLES: Dict[str, Table] = {
+    "prompts": DBPrompt.__table__,
+    "evaluations": DBEvaluation.__table__,
+    "lineages": DBLineage.__table__
+}
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows")
+}
+
+def get_table(name: str) -> Table:
+    if name not in TABLES:
+        raise ValueError(f"Unknown table {name!r}; expected one of {sorted(TABLES)}")
+    return TABLES[name]
+
+def watermark(db: Session, table: Table) -> int:
+    """The highest id currently in ``table`` (0 when empty)"""
+    return db.scalar(select(func.coalesce(func.max(table.c.id), 0)))
+
+def iter_chunks(db: Session, table: Table, since: int = 0, until: Optional[int] = None,
+                chunk_size: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Yield the rows with ``since < id <= until`` as lists of dicts, in id order
+
+    ``yield_per`` makes the driver stream results (a server-side cursor on
+    PostgreSQL), so only one chunk is held in memory at a time.
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    query = select(table).where(table.c.id > since).order_by(table.c.id)
+    if until is not None:
+        query = query.where(table.c.id <= until)
+    result = db.execute(query.execution_options(yield_per=chunk_size))
+    for partition in result.mappings().partitions():
+        yield [dict(row) for row in partition]
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+def encode_ndjson(chunks: Iterator[List[Dict[str, Any]]]) -> Iterator[bytes]:
+    for chunk in chunks:
+        yield "".join(json.dumps(row, default=_json_default) + "\n" for row in chunk).encode()
+
+def arrow_schema(table: Table):
+    """Arrow schema for a table; JSON columns are exported as JSON text"""
+    import pyarrow as pa
+
+    fields = []
+    for column in table.columns:
+        if isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+def _record_batch(table: Table, schema, chunk: List[Dict[str, Any]]):
+    import pyarrow as pa
+
+    columns = []
+    for column in table.columns:
+        values = [row[column.name] for row in chunk]
+        if isinstance(column.type, JSON):
+            values = [None if v is None else json.dumps(v) for v in values]
+        columns.append(values)
+    return pa.RecordBatch.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+        schema=schema
+    )
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back in pieces"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+def require_pyarrow(format: str):
+    """Raise RuntimeError if ``format`` needs pyarrow and it is not installed"""
+    if format == "ndjson":
+        return
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(f"Exporting {format} requires pyarrow") from e
+
+def supports_incremental(db: Session) -> bool:
+    """Whether ids commit in order on this database, so exports can resume from a watermark"""
+    return is_sqlite(db.get_bind().url)
+
+def encode_arrow(table: Table, chunks: Iterator[List[Dict[str, Any]]], format: str) -> Iterator[bytes]:
+    """Encode chunks as Parquet (one row group per chunk) or an Arrow IPC stream"""
+    require_pyarrow(format)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(table)
+    sink = _ChunkSink()
+    if format == "parquet":
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    else:
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), schema)
+    with writer:
+        for chunk in chunks:
+            writer.write_batch(_record_batch(table, schema, chunk))
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+def export_table(db: Session, name: str, format: str = "ndjson", since: int = 0,
+                 chunk_size: Optional[int] = None) -> Tuple[int, Iterator[bytes]]:
+    """Start an export of one table; returns its watermark and the encoded byte stream
+    
+    Raises ValueError for an export from ``since`` where that is unsound
+    (see ``supports_incremental``) and RuntimeError if the format needs
+    pyarrow and it is missing, before anything is read.
+    """
+    table = get_table(name)
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format!r}; expected one of {sorted(FORMATS)}")
+    if since and not supports_incremental(db):
+        raise ValueError("Exports from a watermark need SQLite; on this database rows may commit "
+                         "with ids below it, so export the whole table instead")
+    require_pyarrow(format)
+    until = watermark(db, table)
+    chunks = iter_chunks(db, table, since, until, chunk_size)
+    if format == "ndjson":
+        return until, encode_ndjson(chunks)
+    return until, encode_arrow(table, chunks, format)
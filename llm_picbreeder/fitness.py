@@ -0,0 +1,252 @@
+"""
+Automated fitness evaluation for LLM-Picbreeder
+
+Scores LLM outputs offline, on the CPU, so runs can proceed unattended
+without a human rating every generation. Text statistics for a whole
+generation are extracted once into ``Features`` arrays; each evaluator maps
+them to one score in [0, 1] per output with array arithmetic, and a
+``FitnessFunction`` combines weighted evaluators into ratings on the usual
+1-5 scale.
+
+Built-in evaluators:
+
+* ``constraints``: how well each output meets the constraints
+  ``PromptEvolver._add_constraints`` put in its prompt (word limits,
+  example counts, list structure, technical terms, no acronyms)
+* ``readability``: Flesch reading ease
+* ``lexical_diversity``: type-token ratio over a fixed-length prefix
+
+``RegexCheck`` and ``JSONSchemaCheck`` add user-supplied checks.
+"""
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from .config import settings
+from .models import PromptEvaluation, PromptGenome
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z'-]*|\d+")
+_SENTENCE_END = re.compile(r"[.!?]+(?:\s|$)")
+_VOWEL_GROUPS = re.compile(r"[aeiouy]+")
+_LIST_ITEM = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+\S", re.MULTILINE)
+_EXAMPLE_MARKER = re.compile(r"\b(?:for example|for instance|e\.g\.|example \d+|such as)", re.IGNORECASE)
+_ACRONYM = re.compile(r"\b[A-Z]{2,}s?\b")
+
+# The constraints PromptEvolver._add_constraints appends to prompts
+_WORD_LIMIT = re.compile(r"limit your response to (\d+) words", re.IGNORECASE)
+_MIN_EXAMPLES = re.compile(r"include at least (\d+) examples?", re.IGNORECASE)
+_AS_LIST = re.compile(r"structure your response as a list", re.IGNORECASE)
+_TECHNICAL = re.compile(r"use technical terminology", re.IGNORECASE)
+_NO_JARGON = re.compile(r"avoid jargon and acronyms", re.IGNORECASE)
+
+DIVERSITY_WINDOW = 100  # Tokens per output considered for lexical diversity
+TECHNICAL_WORD_LENGTH = 10  # Words at least this long count as technical terms
+
+def _syllables(word: str) -> int:
+    groups = len(_VOWEL_GROUPS.findall(word.lower()))
+    if word.lower().endswith("e") and groups > 1:
+        groups -= 1
+    return max(1, groups)
+
+class Features:
+    """Text statistics for one generation's outputs, one array entry per output"""
+
+    def __init__(self, prompts: Sequence[str], outputs: Sequence[str]):
+        self.prompts = list(prompts)
+        self.outputs = list(outputs)
+        words = [_WORD.findall(output) for output in self.outputs]
+        window = [[w.lower() for w in ws[:DIVERSITY_WINDOW]] for ws in words]
+
+        self.words = np.array([len(ws) for ws in words], dtype=np.float64)
+        self.sentences = np.array([max(1, len(_SENTENCE_END.findall(o))) for o in self.outputs], dtype=np.float64)
+        self.syllables = np.array([sum(_syllables(w) for w in ws) for ws in words], dtype=np.float64)
+        self.window_tokens = np.array([len(ws) for ws in window], dtype=np.float64)
+        self.window_types = np.array([len(set(ws)) for ws in window], dtype=np.float64)
+        self.long_words = np.array([sum(len(w) >= TECHNICAL_WORD_LENGTH for w in ws) for ws in words],
+                                   dtype=np.float64)
+        self.list_items = np.array([len(_LIST_ITEM.findall(o)) for o in self.outputs], dtype=np.float64)
+        self.example_markers = np.array([len(_EXAMPLE_MARKER.findall(o)) for o in self.outputs], dtype=np.float64)
+        self.acronyms = np.array([len(_ACRONYM.findall(o)) for o in self.outputs], dtype=np.float64)
+
+        self.word_limit = self._number(_WORD_LIMIT, np.nan)
+        self.min_examples = self._number(_MIN_EXAMPLES, np.nan)
+        self.as_list = self._flag(_AS_LIST)
+        self.technical = self._flag(_TECHNICAL)
+        self.no_jargon = self._flag(_NO_JARGON)
+
+    def __len__(self) -> int:
+        return len(self.outputs)
+
+    def _number(self, pattern: re.Pattern, missing: float) -> np.ndarray:
+        matches = [pattern.search(p) for p in self.prompts]
+        return np.array([float(m.group(1)) if m else missing for m in matches])
+
+    def _flag(self, pattern: re.Pattern) -> np.ndarray:
+        return np.array([pattern.search(p) is not None for p in self.prompts], dtype=bool)
+
+Evaluator = Callable[[Features], np.ndarray]
+
+def _ratio(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+def constraint_score(features: Features) -> np.ndarray:
+    """Mean satisfaction of the constraints each prompt asked for; 1.0 when it asked for none"""
+    scores, applies = [], []
+
+    limit = np.nan_to_num(features.word_limit, nan=np.inf)
+    scores.append(np.where(features.words > limit, _ratio(limit, features.words), 1.0))
+    applies.append(~np.isnan(features.word_limit))
+
+    required = np.nan_to_num(features.min_examples)
+    examples = np.maximum(features.example_markers, features.list_items)
+    scores.append(np.minimum(1.0, _ratio(examples, required)))
+    applies.append(~np.isnan(features.min_examples))
+
+    scores.append(np.minimum(1.0, features.list_items / 3.0))
+    applies.append(features.as_list)
+
+    # About one word in ten being a long technical term counts as fully technical
+    scores.append(np.minimum(1.0, 10.0 * _ratio(features.long_words, features.words)))
+    applies.append(features.technical)
+
+    scores.append(1.0 / (1.0 + features.acronyms))
+    applies.append(features.no_jargon)
+
+    scores, applies = np.array(scores), np.array(applies)
+    counts = applies.sum(axis=0)
+    total = np.where(applies, scores, 0.0).sum(axis=0)
+    return np.where(counts > 0, _ratio(total, counts.astype(np.float64)), 1.0)
+
+def readability_score(features: Features) -> np.ndarray:
+    """Flesch reading ease scaled from 0-100 to 0-1; empty outputs score 0"""
+    ease = (206.835 - 1.015 * _ratio(features.words, features.sentences)
+            - 84.6 * _ratio(features.syllables, features.words))
+    return np.where(features.words > 0, np.clip(ease, 0.0, 100.0) / 100.0, 0.0)
+
+def lexical_diversity_score(features: Features) -> np.ndarray:
+    """Distinct words per word among the first ``DIVERSITY_WINDOW`` words
+
+    The fixed window keeps long outputs from being penalized just for
+    their length.
+    """
+    return _ratio(features.window_types, features.window_tokens)
+
+class RegexCheck:
+    """1.0 for outputs matching ``pattern`` (or not matching it, with ``forbid``), else 0.0"""
+
+    def __init__(self, pattern: str, forbid: bool = False, flags: int = 0):
+        self.pattern = re.compile(pattern, flags)
+        self.forbid = forbid
+
+    def __call__(self, features: Features) -> np.ndarray:
+        found = np.array([self.pattern.search(o) is not None for o in features.outputs], dtype=bool)
+        return (found != self.forbid).astype(np.float64)
+
+class JSONSchemaCheck:
+    """1.0 for outputs that are JSON valid against ``schema``, 0.5 for other JSON, 0.0 otherwise
+
+    A JSON value wrapped in prose or a code fence is found by taking the
+    text from the first bracket to the last matching one.
+    """
+
+    def __init__(self, schema: Union[str, Dict[str, Any]]):
+        try:
+            import jsonschema
+        except ImportError as e:
+            raise RuntimeError("JSON schema checks require jsonschema") from e
+        if isinstance(schema, str):
+            schema = json.loads(schema)
+        validator_class = jsonschema.validators.validator_for(schema)
+        validator_class.check_schema(schema)
+        self.validator = validator_class(schema)
+
+    @staticmethod
+    def _parse(output: str):
+        text = output.strip()
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+        for open_char, close_char in ("{}", "[]"):
+            start, end = text.find(open_char), text.rfind(close_char)
+            if 0 <= start < end:
+                try:
+                    return json.loads(text[start:end + 1])
+                except ValueError:
+                    continue
+        raise ValueError("No JSON value found")
+
+    def __call__(self, features: Features) -> np.ndarray:
+        scores = np.zeros(len(features))
+        for i, output in enumerate(features.outputs):
+            try:
+                value = self._parse(output)
+            except ValueError:
+                continue
+            scores[i] = 1.0 if self.validator.is_valid(value) else 0.5
+        return scores
+
+EVALUATORS: Dict[str, Evaluator] = {
+    "constraints": constraint_score,
+    "readability": readability_score,
+    "lexical_diversity": lexical_diversity_score
+}
+
+def parse_spec(spec: str) -> List[Tuple[str, float]]:
+    """Parse ``"name[:weight],..."``, e.g. ``"constraints:2,readability"``"""
+    parsed = []
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, weight = part.partition(":")
+        name = name.strip()
+        if name not in EVALUATORS:
+            raise ValueError(f"Unknown evaluator {name!r}; expected one of {sorted(EVALUATORS)}")
+        parsed.append((name, float(weight) if weight else 1.0))
+    return parsed
+
+class FitnessFunction:
+    """Weighted mean of evaluators, usable wherever a rating function is expected"""
+
+    def __init__(self, evaluators: Sequence[Tuple[str, Evaluator, float]]):
+        if not evaluators:
+            raise ValueError("A fitness function needs at least one evaluator")
+        if any(weight < 0 for _, _, weight in evaluators) or sum(w for _, _, w in evaluators) <= 0:
+            raise ValueError("Evaluator weights must be non-negative and not all zero")
+        self.evaluators = list(evaluators)
+
+    def breakdown(self, prompts: Sequence[str], outputs: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Each evaluator's scores for a generation, by name"""
+        features = Features(prompts, outputs)
+        return {name: np.asarray(evaluate(features), dtype=np.float64) for name, evaluate, _ in self.evaluators}
+
+    def score(self, prompts: Sequence[str], outputs: Sequence[str]) -> np.ndarray:
+        """Combined scores in [0, 1], one per output"""
+        if len(outputs) == 0:
+            return np.zeros(0)
+        scores = self.breakdown(prompts, outputs)
+        weights = np.array([weight for _, _, weight in self.evaluators])
+        stacked = np.array([scores[name] for name, _, _ in self.evaluators])
+        return np.clip(weights @ stacked / weights.sum(), 0.0, 1.0)
+
+    def __call__(self, population: List[PromptGenome], evaluations: List[PromptEvaluation]):
+        """Rate a generation on the 1-5 scale; ``evaluations[i]`` is the output of ``population[i]``
+
+        Failed evaluations keep their rating.
+        """
+        rated = [(p, e) for p, e in zip(population, evaluations) if not e.error]
+        scores = self.score([p.content for p, _ in rated], [e.output_content for _, e in rated])
+        for (_, evaluation), score in zip(rated, scores.tolist()):
+            evaluation.rating = 1.0 + 4.0 * score
+
+def make_fitness_function(spec: Optional[str] = None, regex: Optional[str] = None,
+                          json_schema: Optional[str] = None) -> FitnessFunction:
+    """Build the fitness function described by the arguments, defaulting to the settings"""
+    spec = settings.FITNESS_EVALUATORS if spec is None else spec
+    regex = settings.FITNESS_REGEX if regex is None else regex
+    json_schema = settings.FITNESS_JSON_SCHEMA if json_schema is None else json_schema
+
+    evaluators = [(name, EVALUATORS[name], weight) for name, weight in parse_spec(spec)]
+    if regex:
+        evaluators.append(("regex", RegexCheck(regex), 1.0))
+    if json_schema:
+        evaluators.append(("json_schema", JSONSchemaCheck(json_schema), 1.0))
+    return FitnessFunction(evaluators)
@@ -0,0 +1,76 @@
+"""
+Bulk prompt ingestion for LLM-Picbreeder
+
+Prompts are validated and written in batches: each batch is one
+multi-row INSERT ... RETURNING plus one insert into the lineage index, so
+seeding a library of prompts costs a handful of transactions rather than
+one per prompt.
+"""
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional
+from pydantic import TypeAdapter
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from . import lineage
+from .database import DBPrompt
+from .models import PromptGenome
+
+_genome_batch = TypeAdapter(List[PromptGenome])
+
+def insert_prompts(db: Session, genomes: List[PromptGenome], run_id: Optional[int] = None) -> List[int]:
+    """Bulk insert genomes and index their lineage, without committing
+
+    Assigned ids are written back onto the genomes and returned in order.
+    """
+    if not genomes:
+        return []
+    # A Core insert skips the ORM's per-row bookkeeping
+    prompts = DBPrompt.__table__
+    ids = db.execute(
+        insert(prompts).returning(prompts.c.id, sort_by_parameter_order=True),
+        [
+            {
+                "content": g.content,
+                "template_vars": g.template_vars,
+                "metadata_json": g.metadata,
+                "creator_id": g.creator_id,
+                "parent_id": g.parent_id,
+                "run_id": run_id,
+                "complexity_score": g.complexity_score
+            }
+            for g in genomes
+        ]
+    ).scalars().all()
+    for genome, prompt_id in zip(genomes, ids):
+        genome.id = prompt_id
+    lineage.index_prompts(db, [(g.id, g.parent_id) for g in genomes])
+    return ids
+
+def ingest_batch(db: Session, records: List[Dict[str, Any]]) -> List[int]:
+    """Validate one batch of prompt records and store it in its own transaction
+
+    Raises pydantic's ``ValidationError`` before anything is written if a
+    record is invalid. Ids in the records are ignored; new ones are assigned.
+    """
+    genomes = _genome_batch.validate_python(records)
+    for genome in genomes:
+        genome.id = None
+    try:
+        ids = insert_prompts(db, genomes)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return ids
+
+async def aiter_ndjson(chunks: AsyncIterable[bytes]) -> AsyncIterator[Any]:
+    """Decode a byte stream of newline-delimited JSON, skipping blank lines"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    if buffer.strip():
+        yield json.loads(buffer)
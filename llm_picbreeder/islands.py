@@ -0,0 +1,299 @@
+"""
+Island-model evolution for LLM-Picbreeder
+
+An island-model run evolves several independent sub-populations, each in
+its own process with its own evolver and LLM client. Every
+``MIGRATION_INTERVAL`` generations each island sends copies of its best
+``MIGRATION_SIZE`` genomes, with their evaluations, to its neighbours in
+the ``MIGRATION_TOPOLOGY``, where they replace the worst individuals.
+Isolation keeps the islands diverse; migration spreads good prompts.
+
+Migrants travel through a ``QueueTransport`` when every island runs on
+this machine, or a ``DatabaseTransport`` through the shared database, in
+which case islands can run on separate hosts (see ``cli.py --island``).
+
+Migration is synchronous: an island waits for its neighbours' migrants
+before breeding, so a seeded run is reproducible whatever the timing.
+
+The islands share one API key, so each island's LLM client gets an equal
+share of ``RATE_LIMIT_RPM``, ``RATE_LIMIT_TPM`` and
+``MAX_CONCURRENT_REQUESTS``. This holds for islands started on separate
+hosts too: each one takes 1/N of the configured quota, so every host should
+be configured with the quota of the whole run, not its own part of it.
+"""
+import itertools
+import multiprocessing
+import queue
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from sqlalchemy import inspect, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import sessionmaker
+from . import database, fitness
+from .config import settings
+from .evolver import PromptEvolver
+from .llm_interface import LLMInterface
+from .models import PromptEvaluation, PromptGenome
+
+TOPOLOGIES = ("ring", "star", "complete")
+
+def neighbours(topology: str, islands: int) -> List[List[int]]:
+    """The islands each island sends migrants to
+
+    ``ring`` sends to the next island, ``star`` links island 0 both ways
+    with every other island, and ``complete`` sends to every other island.
+    """
+    if topology == "ring":
+        return [[(i + 1) % islands] if islands > 1 else [] for i in range(islands)]
+    if topology == "star":
+        return [list(range(1, islands))] + [[0] for _ in range(1, islands)]
+    if topology == "complete":
+        return [[j for j in range(islands) if j != i] for i in range(islands)]
+    raise ValueError(f"Unknown migration topology {topology!r}; expected one of {list(TOPOLOGIES)}")
+
+def island_seed(seed: Optional[int], island: int) -> Optional[int]:
+    """An independent seed for each island of a seeded run"""
+    if seed is None:
+        return None
+    return int(np.random.SeedSequence(seed, spawn_key=(island,)).generate_state(1)[0])
+
+class QueueTransport:
+    """Migrants passed through one multiprocessing queue per island, for islands on one machine
+
+    Must be handed to the island processes when they are started.
+    """
+
+    def __init__(self, islands: int, context=None):
+        context = context or multiprocessing.get_context("spawn")
+        self.inboxes = [context.Queue() for _ in range(islands)]
+        self._received: Dict[int, Dict[int, List[Dict[str, Any]]]] = {}
+
+    def send(self, generation: int, source: int, target: int, migrants: List[Dict[str, Any]]):
+        self.inboxes[target].put((generation, source, migrants))
+
+    def receive(self, generation: int, target: int, sources: Sequence[int],
+                timeout: Optional[float] = None) -> Dict[int, List[Dict[str, Any]]]:
+        """Wait for the migrants every island in ``sources`` sent ``target`` at ``generation``
+
+        A faster neighbour's later migrants are held until they are asked for.
+        """
+        timeout = settings.MIGRATION_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        received = self._received.setdefault(generation, {})
+        while not set(sources) <= received.keys():
+            try:
+                sent_at, source, migrants = self.inboxes[target].get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise TimeoutError(f"Island {target} got no migrants for generation {generation} "
+                                   f"from {sorted(set(sources) - received.keys())}") from None
+            self._received.setdefault(sent_at, {})[source] = migrants
+        return {source: received[source] for source in sources}
+
+class DatabaseTransport:
+    """Migrants stored as rows of ``migrations`` in a shared database, for islands on many hosts
+
+    Islands of the same run share a ``run_key``; receiving polls every
+    ``MIGRATION_POLL_INTERVAL`` seconds.
+    """
+
+    def __init__(self, run_key: str, url: Optional[str] = None, poll_interval: Optional[float] = None):
+        self.run_key = run_key
+        self.url = url or settings.DATABASE_URL
+        self.poll_interval = settings.MIGRATION_POLL_INTERVAL if poll_interval is None else poll_interval
+        self._session_factory = None
+
+    def __getstate__(self):
+        # Engines do not survive pickling; each process opens its own
+        return {**self.__dict__, "_session_factory": None}
+
+    def _session(self):
+        if self._session_factory is None:
+            self._session_factory = sessionmaker(bind=database.create_db_engine(self.url))
+        return self._session_factory()
+
+    def create_table(self):
+        """Create ``migrations`` if it is missing; islands starting together may race to do it"""
+        table = database.DBMigration.__table__
+        with self._session() as db:
+            engine = db.get_bind()
+        try:
+            table.create(engine, checkfirst=True)
+        except DBAPIError:
+            if not inspect(engine).has_table(table.name):
+                raise
+
+    def send(self, generation: int, source: int, target: int, migrants: List[Dict[str, Any]]):
+        with self._session() as db:
+            db.add(database.DBMigration(run_key=self.run_key, generation=generation, source=source,
+                                        target=target, migrants=migrants))
+            db.commit()
+
+    def receive(self, generation: int, target: int, sources: Sequence[int],
+                timeout: Optional[float] = None) -> Dict[int, List[Dict[str, Any]]]:
+        """Wait for the migrants every island in ``sources`` sent ``target`` at ``generation``"""
+        timeout = settings.MIGRATION_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        query = select(database.DBMigration.source, database.DBMigration.migrants).where(
+            database.DBMigration.run_key == self.run_key,
+            database.DBMigration.target == target,
+            database.DBMigration.generation == generation
+        )
+        while True:
+            with self._session() as db:
+                received = dict(db.execute(query).all())
+            if set(sources) <= received.keys():
+                return {source: received[source] for source in sources}
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Island {target} got no migrants for generation {generation} "
+                                   f"from {sorted(set(sources) - received.keys())}")
+            time.sleep(self.poll_interval)
+
+def _emigrants(population: List[PromptGenome], evaluations: List[PromptEvaluation],
+               size: int) -> List[Dict[str, Any]]:
+    ratings = np.array([e.rating for e in evaluations])
+    order = [i for i in np.argsort(-ratings, kind="stable").tolist() if not evaluations[i].error]
+    return [
+        {
+            "prompt_id": population[i].id,
+            "content": population[i].content,
+            "parent_id": population[i].parent_id,
+            "output_content": evaluations[i].output_content,
+            "rating": evaluations[i].rating
+        }
+        for i in order[:size]
+    ]
+
+def _immigrate(population: List[PromptGenome], evaluations: List[PromptEvaluation],
+               arrivals: Dict[int, List[Dict[str, Any]]]):
+    """Replace the worst individuals with the migrants, in place"""
+    migrants = [(source, m) for source in sorted(arrivals) for m in arrivals[source]]
+    ratings = np.array([0.0 if e.error else e.rating for e in evaluations])
+    worst = np.argsort(ratings, kind="stable")[:len(migrants)]
+    for row, (source, migrant) in zip(worst.tolist(), migrants):
+        population[row] = PromptGenome(
+            id=migrant["prompt_id"],
+            content=migrant["content"],
+            metadata={"source": "migration", "island": source},
+            parent_id=migrant["parent_id"]
+        )
+        evaluations[row] = PromptEvaluation(
+            prompt_id=migrant["prompt_id"],
+            output_content=migrant["output_content"],
+            rating=migrant["rating"]
+        )
+
+def run_island(island: int, islands: int, base_prompt: str, generations: int, transport,
+               seed: Optional[int] = None, population_size: Optional[int] = None,
+               interval: Optional[int] = None, size: Optional[int] = None,
+               topology: Optional[str] = None) -> Dict[str, Any]:
+    """Evolve one island for ``generations`` generations, exchanging migrants through ``transport``
+
+    Prompt ids are congruent to ``island + 1`` modulo ``islands``, so they are unique
+    across the run and migrants keep theirs. Returns the island's best
+    rating per generation and its final rated population, best first.
+    """
+    interval = interval or settings.MIGRATION_INTERVAL
+    size = settings.MIGRATION_SIZE if size is None else size
+    graph = neighbours(topology or settings.MIGRATION_TOPOLOGY, islands)
+    targets = graph[island]
+    sources = [i for i in range(islands) if island in graph[i]]
+
+    evolver = PromptEvolver(seed=island_seed(seed, island))
+    if population_size:
+        evolver.population_size = population_size
+    llm = LLMInterface(shares=islands)
+    rate = fitness.make_fitness_function()
+    ids = itertools.count(island + 1, islands)
+
+    best_ratings = []
+    migrants_received = 0
+    try:
+        population = evolver.initialize_population(base_prompt)
+        for generation in range(generations):
+            for genome in population:
+                if genome.id is None:
+                    genome.id = next(ids)
+            evaluations = llm.evaluate_prompt_batch(population)
+            rate(population, evaluations)
+            best_ratings.append(max((e.rating for e in evaluations if not e.error), default=0.0))
+            if generation == generations - 1:
+                break
+
+            if size and (generation + 1) % interval == 0:
+                for target in targets:
+                    transport.send(generation, island, target, _emigrants(population, evaluations, size))
+                arrivals = transport.receive(generation, island, sources)
+                _immigrate(population, evaluations, arrivals)
+                migrants_received += sum(len(m) for m in arrivals.values())
+
+            evolver.seed_generation(generation + 1)
+            population = evolver.evolve_population(population, evaluations)
+
+        ranked = evolver.rank_population(population, evaluations)
+    finally:
+        evolver.close()
+    return {
+        "island": island,
+        "best_ratings": best_ratings,
+        "migrants_received": migrants_received,
+        "population": [{"id": p.id, "content": p.content, "rating": rating} for p, rating in ranked]
+    }
+
+def _island_process(results, island: int, islands: int, args: tuple, kwargs: dict):
+    try:
+        results.put((island, run_island(island, islands, *args, **kwargs), None))
+    except Exception:
+        results.put((island, None, traceback.format_exc()))
+
+def run_islands(base_prompt: str, generations: int, islands: Optional[int] = None,
+                transport=None, **kwargs) -> List[Dict[str, Any]]:
+    """Run every island of an island-model run in its own local process
+
+    ``transport`` defaults to a ``QueueTransport``; keyword arguments are
+    passed to ``run_island``. Returns each island's result, by island.
+    """
+    islands = islands or settings.ISLAND_COUNT
+    context = multiprocessing.get_context("spawn")
+    if transport is None:
+        transport = QueueTransport(islands, context)
+    elif isinstance(transport, DatabaseTransport):
+        transport.create_table()
+    results = context.Queue()
+    processes = [
+        context.Process(target=_island_process, name=f"island-{i}",
+                        args=(results, i, islands, (base_prompt, generations, transport), kwargs))
+        for i in range(islands)
+    ]
+    for process in processes:
+        process.start()
+
+    outcomes, errors = {}, {}
+    finished = False
+    try:
+        while len(outcomes) + len(errors) < islands:
+            try:
+                island, result, error = results.get(timeout=1.0)
+            except queue.Empty:
+                if any(p.exitcode not in (None, 0) for p in processes):
+                    raise RuntimeError("An island process died without reporting a result")
+                continue
+            if error is None:
+                outcomes[island] = result
+            else:
+                errors[island] = error
+                break
+        finished = not errors
+    finally:
+        for process in processes:
+            # After a failure or interrupt the survivors would wait for the lost
+            # island's migrants until they time out
+            if not finished and process.is_alive():
+                process.terminate()
+            process.join()
+
+    if errors:
+        island, error = min(errors.items())
+        raise RuntimeError(f"Island {island} failed:\n{error}")
+    return [outcomes[i] for i in range(islands)]
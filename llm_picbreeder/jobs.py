@@ -0,0 +1,178 @@
+"""
+Background job queue for LLM-Picbreeder
+
+Jobs are rows in the ``jobs`` table, so the queue survives restarts and can
+be inspected with plain SQL. Each job advances one evolution run to a target
+generation; because runs are persisted generation by generation, a job
+interrupted by a crash is simply picked up again and continues from the
+run's last committed generation.
+
+A worker leases a job's run before it claims the job (see
+``runs.claim_run``), so jobs for the same run execute one after another,
+whichever process runs them. A running job is only requeued once its run's
+lease has lapsed, i.e. when the process running it has died.
+"""
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from . import runs
+from .config import settings
+from .database import DBEvolutionRun, DBJob
+from .llm_interface import LLMInterface
+
+def generation_summary(generation: int, evaluations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compact per-generation progress record"""
+    rated = [e for e in evaluations if not e.get("error")]
+    best = max(rated, key=lambda e: e["rating"], default=None)
+    return {
+        "generation": generation,
+        "evaluated": len(rated),
+        "mean_rating": sum(e["rating"] for e in rated) / len(rated) if rated else None,
+        "best_rating": best["rating"] if best else None,
+        "best_prompt_id": best["prompt_id"] if best else None
+    }
+
+class JobQueue:
+    """SQLite-backed queue of evolution jobs executed by a pool of worker threads"""
+
+    def __init__(self, session_factory: Callable[[], Session], llm: LLMInterface,
+                 rate: runs.RatingFunction, workers: Optional[int] = None,
+                 poll_interval: Optional[float] = None):
+        self.session_factory = session_factory
+        self.llm = llm
+        self.rate = rate
+        self.workers = workers or settings.JOB_WORKERS
+        self.poll_interval = poll_interval if poll_interval is not None else settings.JOB_POLL_INTERVAL
+
+        self.owner = runs.new_lease_owner()
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Condition()
+
+    def submit(self, db: Session, run: DBEvolutionRun, generations: int) -> DBJob:
+        """Queue ``generations`` more generations of ``run``, after any jobs already queued for it"""
+        pending = db.scalar(
+            select(func.max(DBJob.target_generation))
+            .where(DBJob.run_id == run.id, DBJob.status.in_(("queued", "running")))
+        )
+        job = DBJob(
+            run_id=run.id,
+            status="queued",
+            target_generation=max(run.next_generation, pending or 0) + generations,
+            progress=[]
+        )
+        db.add(job)
+        db.commit()
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job
+
+    def start(self):
+        """Requeue jobs orphaned by a dead process and start the workers"""
+        with self.session_factory() as db:
+            self._requeue_orphans(db)
+
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the workers once their current generation completes"""
+        self._stop.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _lease_owner(self) -> str:
+        # Workers of one queue share a process, so each holds runs under its own name
+        return f"{self.owner}:{threading.current_thread().name}"
+
+    def _requeue_orphans(self, db: Session):
+        """Requeue running jobs whose run is no longer leased by anyone"""
+        free_runs = select(DBEvolutionRun.id).where(runs.run_is_free(datetime.utcnow()))
+        db.execute(
+            update(DBJob)
+            .where(DBJob.status == "running", DBJob.run_id.in_(free_runs))
+            .values(status="queued")
+        )
+        db.commit()
+
+    def _claim(self, db: Session) -> Optional[DBJob]:
+        """Lease the run of the oldest queued job whose run is free, then move that job to running"""
+        self._requeue_orphans(db)
+        while True:
+            candidate = db.execute(
+                select(DBJob.id, DBJob.run_id)
+                .join(DBEvolutionRun, DBEvolutionRun.id == DBJob.run_id)
+                .where(DBJob.status == "queued", runs.run_is_free(datetime.utcnow()))
+                .order_by(DBJob.id)
+                .limit(1)
+            ).first()
+            if candidate is None:
+                return None
+            job_id, run_id = candidate
+            owner = self._lease_owner()
+            if not runs.claim_run(db, run_id, owner):
+                # Another worker leased the run first
+                continue
+            claimed = db.execute(
+                update(DBJob)
+                .where(DBJob.id == job_id, DBJob.status == "queued")
+                .values(status="running", started_at=datetime.utcnow())
+            ).rowcount
+            db.commit()
+            if claimed:
+                return db.get(DBJob, job_id)
+            runs.release_run(db, run_id, owner)
+
+    def _work(self):
+        while not self._stop.is_set():
+            with self.session_factory() as db:
+                job = self._claim(db)
+                if job is not None:
+                    self.run_job(db, job)
+                    continue
+
+            with self._wakeup:
+                self._wakeup.wait(self.poll_interval)
+
+    def run_job(self, db: Session, job: DBJob):
+        """Advance the job's run to its target generation, recording progress
+
+        The job's run must be leased to this worker (see ``_claim``); the
+        lease is released once the job's status is recorded.
+        """
+        owner = self._lease_owner()
+        run = db.get(DBEvolutionRun, job.run_id)
+        remaining = job.target_generation - run.next_generation
+
+        try:
+            for result in runs.run_generations(db, run, max(0, remaining), self.llm, self.rate, owner=owner):
+                job.progress = (job.progress or []) + [
+                    generation_summary(result["generation"], result["evaluations"])
+                ]
+                db.commit()
+                if self._stop.is_set():
+                    break
+        except runs.RunLeasedError:
+            # The lease lapsed mid-generation and the job was requeued and taken elsewhere
+            db.rollback()
+            return
+        except Exception as e:
+            db.rollback()
+            job.status = "failed"
+            job.error = str(e)
+        else:
+            job.status = "succeeded" if run.next_generation >= job.target_generation else "queued"
+        job.finished_at = datetime.utcnow() if job.status != "queued" else None
+        db.commit()
+        runs.release_run(db, run.id, owner)
@@ -0,0 +1,59 @@
+"""
+Lineage index maintenance for LLM-Picbreeder
+
+Prompts form a tree through ``parent_id``. The ``prompt_closure`` table
+stores every (ancestor, descendant, depth) triple of that tree and is
+extended whenever prompts are inserted, so ancestor and descendant queries
+never have to walk the tree row by row.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from .database import DBPrompt, DBPromptClosure
+
+def index_prompts(db: Session, prompts: Iterable[Tuple[int, Optional[int]]]):
+    """Add closure rows for newly inserted ``(prompt_id, parent_id)`` pairs
+
+    Parents must be indexed already or appear earlier in ``prompts``. The
+    parents' ancestries are fetched in one query and the new rows written in
+    one bulk insert.
+    """
+    prompts = list(prompts)
+    if not prompts:
+        return
+
+    new_ids = {prompt_id for prompt_id, _ in prompts}
+    stored_parents = {parent_id for _, parent_id in prompts
+                      if parent_id is not None and parent_id not in new_ids}
+    ancestry: Dict[int, List[Tuple[int, int]]] = {}
+    if stored_parents:
+        rows = db.execute(
+            select(DBPromptClosure.descendant_id, DBPromptClosure.ancestor_id, DBPromptClosure.depth)
+            .where(DBPromptClosure.descendant_id.in_(stored_parents))
+        )
+        for descendant_id, ancestor_id, depth in rows:
+            ancestry.setdefault(descendant_id, []).append((ancestor_id, depth))
+
+    rows = []
+    for prompt_id, parent_id in prompts:
+        ancestors = [(prompt_id, 0)]
+        if parent_id is not None:
+            ancestors += [(ancestor_id, depth + 1) for ancestor_id, depth in ancestry.get(parent_id, [])]
+        ancestry[prompt_id] = ancestors
+        rows.extend({"ancestor_id": a, "descendant_id": prompt_id, "depth": d} for a, d in ancestors)
+    db.execute(insert(DBPromptClosure.__table__), rows)
+
+def rebuild_index(db: Session, batch_size: int = 10000) -> int:
+    """Recompute the whole closure table from ``parent_id``; returns the prompts indexed
+
+    For databases created before the index existed. Prompts are visited in
+    id order, which puts every parent before its children.
+    """
+    db.execute(delete(DBPromptClosure))
+    count = 0
+    query = select(DBPrompt.id, DBPrompt.parent_id).order_by(DBPrompt.id).execution_options(yield_per=batch_size)
+    for batch in db.execute(query).partitions():
+        index_prompts(db, batch)
+        count += len(batch)
+    db.commit()
+    return count
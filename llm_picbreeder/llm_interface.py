@@ -1,59 +1,173 @@
 """
 LLM interface for LLM-Picbreeder
 """
+import asyncio
+import threading
 from typing import List, Dict, Any, Optional
-from openai import OpenAI
+from openai import AsyncOpenAI
+from .cache import ResponseCache, make_cache_key
 from .config import settings
 from .models import PromptGenome, PromptEvaluation
+from .rate_limiter import LLMRequestError, RequestScheduler
 
 class LLMInterface:
-    """Interface to interact with various LLM APIs"""
-    
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY) if settings.OPENAI_API_KEY else None
+    """Interface to interact with various LLM APIs
+
+    ``shares`` splits the configured request, token and concurrency budgets
+    evenly between that many interfaces drawing on one API key, such as the
+    islands of an island-model run, so together they stay within the quota.
+    """
+
+    def __init__(self, async_client=None, cache: Optional[ResponseCache] = None, shares: int = 1):
+        if async_client is None and settings.OPENAI_API_KEY:
+            # Retries are handled by the scheduler, which also tracks quotas
+            async_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+
+        self.async_client = async_client
         self.model = settings.DEFAULT_MODEL
-    
-    def generate_response(self, prompt: str, system_message: str = "") -> str:
-        """Generate a response from the LLM"""
-        if not self.client:
+        self.max_concurrency = max(1, settings.MAX_CONCURRENT_REQUESTS // shares)
+
+        self.scheduler = None
+        if async_client is not None:
+            self.scheduler = RequestScheduler(
+                async_client,
+                requests_per_minute=settings.RATE_LIMIT_RPM / shares,
+                tokens_per_minute=settings.RATE_LIMIT_TPM / shares,
+                max_concurrency=self.max_concurrency,
+                min_concurrency=min(settings.MIN_CONCURRENT_REQUESTS, self.max_concurrency),
+                max_retries=settings.MAX_RETRIES,
+                backoff_base=settings.RETRY_BACKOFF_BASE,
+                backoff_max=settings.RETRY_BACKOFF_MAX,
+                request_timeout=settings.REQUEST_TIMEOUT
+            )
+
+        if cache is None and (settings.CACHE_SIZE > 0 or settings.CACHE_PATH):
+            cache = ResponseCache(settings.CACHE_SIZE, settings.CACHE_PATH or None)
+        self.cache = cache
+
+        # Batches run on a dedicated event loop so that the async client, its
+        # connection pool and the scheduler's budgets outlive individual calls
+        # from sync code
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def _build_messages(self, prompt: str, system_message: str) -> List[Dict[str, str]]:
+        messages = []
+        if system_message:
+            messages.append({"role": "system", "content": system_message})
+
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def _cache_key(self, prompt: str, system_message: str) -> str:
+        return make_cache_key(self.model, system_message, prompt,
+                              settings.TEMPERATURE, settings.MAX_TOKENS)
+
+    async def _complete(self, prompt: str, system_message: str) -> str:
+        """Generate a response, raising ``LLMRequestError`` on failure"""
+        if not self.scheduler:
             # Return a mock response if no API key
             return f"Mock response to: {prompt[:50]}..."
-        
+
+        key = self._cache_key(prompt, system_message)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        response = await self.scheduler.create(
+            model=self.model,
+            messages=self._build_messages(prompt, system_message),
+            max_tokens=settings.MAX_TOKENS,
+            temperature=settings.TEMPERATURE
+        )
+
+        # Filtered or tool-call responses have no text to rate
+        choice = response.choices[0] if response.choices else None
+        if choice is None or choice.message.content is None:
+            reason = getattr(choice, "finish_reason", None) or "no choices"
+            raise LLMRequestError(f"response had no content ({reason})")
+
+        # Errors never reach the cache so that a later generation can retry them
+        content = choice.message.content.strip()
+        if self.cache is not None:
+            self.cache.set(key, content)
+        return content
+
+    async def agenerate_response(self, prompt: str, system_message: str = "") -> str:
+        """Generate a response from the LLM without blocking the event loop"""
         try:
-            messages = []
-            if system_message:
-                messages.append({"role": "system", "content": system_message})
-            
-            messages.append({"role": "user", "content": prompt})
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=settings.MAX_TOKENS,
-                temperature=settings.TEMPERATURE
-            )
-            
-            return response.choices[0].message.content.strip()
-        except Exception as e:
+            return await self._complete(prompt, system_message)
+        except LLMRequestError as e:
             return f"Error generating response: {str(e)}"
-    
-    def evaluate_prompt_batch(self, prompts: List[PromptGenome]) -> List[PromptEvaluation]:
-        """Generate responses for a batch of prompts"""
+
+    def generate_response(self, prompt: str, system_message: str = "") -> str:
+        """Generate a response from the LLM"""
+        return self.run_coroutine(self.agenerate_response(prompt, system_message))
+
+    async def aevaluate_prompt_batch(self, prompts: List[PromptGenome],
+                                     max_concurrency: Optional[int] = None) -> List[PromptEvaluation]:
+        """Generate responses for a batch of prompts concurrently
+
+        At most ``max_concurrency`` requests are in flight at once and the
+        evaluations are returned in the same order as ``prompts``. Prompts
+        with identical content share a single request. Requests that fail
+        for good are returned with ``error`` set so they are not rated.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+
+        # For now, we'll use a simple system message
+        # In practice, this might be part of the prompt genome
+        system_message = "You are a helpful assistant."
+
+        async def respond(content: str):
+            async with semaphore:
+                try:
+                    return await self._complete(content, system_message), None
+                except LLMRequestError as e:
+                    return f"Error generating response: {str(e)}", str(e)
+
+        responses: Dict[str, asyncio.Future] = {}
+        for prompt in prompts:
+            if prompt.content not in responses:
+                responses[prompt.content] = asyncio.ensure_future(respond(prompt.content))
+        await asyncio.gather(*responses.values())
+
         evaluations = []
-        
         for prompt in prompts:
-            # For now, we'll use a simple system message
-            # In practice, this might be part of the prompt genome
-            system_message = "You are a helpful assistant."
-            
-            response = self.generate_response(prompt.content, system_message)
-            
-            evaluation = PromptEvaluation(
+            output, error = responses[prompt.content].result()
+            evaluations.append(PromptEvaluation(
                 prompt_id=prompt.id,
-                output_content=response,
-                rating=0.0  # Will be set by users
-            )
-            
-            evaluations.append(evaluation)
-        
-        return evaluations
\ No newline at end of file
+                output_content=output,
+                rating=0.0,  # Will be set by users
+                error=error
+            ))
+        return evaluations
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=self._loop.run_forever,
+                    name="llm-interface-loop",
+                    daemon=True
+                ).start()
+        return self._loop
+
+    def run_coroutine(self, coro):
+        """Run a coroutine on the interface's event loop and wait for the result"""
+        return asyncio.run_coroutine_threadsafe(coro, self._event_loop()).result()
+
+    async def arun_coroutine(self, coro):
+        """Run a coroutine on the interface's event loop and await it from another loop
+
+        Lets async callers share the interface's client and scheduler
+        without blocking a thread while the requests are in flight.
+        """
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._event_loop()))
+
+    def evaluate_prompt_batch(self, prompts: List[PromptGenome],
+                              max_concurrency: Optional[int] = None) -> List[PromptEvaluation]:
+        """Generate responses for a batch of prompts"""
+        return self.run_coroutine(self.aevaluate_prompt_batch(prompts, max_concurrency))
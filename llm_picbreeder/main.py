@@ -1,23 +1,38 @@
 """
 Main application for LLM-Picbreeder
 """
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Union
+import asyncio
 import json
 
-from . import models, evolver, llm_interface, database
+from . import models, evolver, llm_interface, database, runs, jobs, queries, lineage, ingest, export, fitness, ratings
 from .config import settings
 
-# Initialize the app
-app = FastAPI(title="LLM-Picbreeder", description="Collaborative Evolution of LLM Prompts")
-
 # Initialize components
 evolver_instance = evolver.PromptEvolver()
 llm_interface_instance = llm_interface.LLMInterface()
+# Outputs are rated automatically (see FITNESS_EVALUATORS)
+rate_outputs = fitness.make_fitness_function()
+job_queue = jobs.JobQueue(database.SessionLocal, llm_interface_instance, rate_outputs)
+rating_writer = ratings.RatingWriter(database.SessionLocal)
 
-# Initialize database
-database.init_db()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Initialize database
+    database.init_db()
+    job_queue.start()
+    yield
+    job_queue.stop(timeout=5.0)
+    rating_writer.stop(timeout=5.0)
+
+# Initialize the app
+app = FastAPI(title="LLM-Picbreeder", description="Collaborative Evolution of LLM Prompts", lifespan=lifespan)
 
 @app.get("/")
 def read_root():
@@ -27,23 +42,75 @@ def read_root():
         "version": "0.1.0"
     }
 
-@app.get("/prompts/", response_model=List[models.PromptGenome])
-def get_prompts(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db)):
-    """Get a list of prompts"""
-    db_prompts = db.query(database.DBPrompt).offset(skip).limit(limit).all()
-    return [models.PromptGenome(
-        id=p.id,
-        content=p.content,
-        template_vars=p.template_vars or {},
-        metadata=p.metadata_json or {},
-        creator_id=p.creator_id,
-        parent_id=p.parent_id,
-        created_at=p.created_at,
-        complexity_score=p.complexity_score
-    ) for p in db_prompts]
+@app.get("/cache/stats")
+def get_cache_stats():
+    """Get hit/miss counters for the LLM response cache"""
+    if llm_interface_instance.cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **llm_interface_instance.cache.stats()}
+
+@app.get("/llm/stats")
+def get_llm_stats():
+    """Get request, retry and concurrency counters for the LLM scheduler"""
+    if llm_interface_instance.scheduler is None:
+        return {"enabled": False}
+    return {"enabled": True, **llm_interface_instance.scheduler.stats()}
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    return fields.split(",") if fields else None
+
+@app.get("/prompts/", response_model=models.PromptPage)
+async def get_prompts(limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None,
+                      fields: Optional[str] = None, creator_id: Optional[int] = None,
+                      parent_id: Optional[int] = None, db: AsyncSession = Depends(database.get_async_db)):
+    """Get a page of prompts, oldest first
+    
+    Pass the returned ``next_cursor`` back as ``cursor`` for the next page.
+    ``fields`` is a comma-separated projection, e.g. ``id,complexity_score``.
+    """
+    try:
+        items, next_cursor = await db.run_sync(
+            queries.list_prompts, limit, cursor,
+            fields=_parse_fields(fields),
+            creator_id=creator_id,
+            parent_id=parent_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": items, "next_cursor": next_cursor}
+
+@app.get("/prompts/{prompt_id}/lineage")
+async def get_prompt_lineage(prompt_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """Get a prompt's depth in its family tree and the size of its subtree"""
+    stats = await db.run_sync(queries.lineage_stats, prompt_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+    return stats
+
+@app.get("/prompts/{prompt_id}/ancestors")
+async def get_prompt_ancestors(prompt_id: int, fields: Optional[str] = None, max_depth: Optional[int] = None,
+                               db: AsyncSession = Depends(database.get_async_db)):
+    """Get every ancestor of a prompt, nearest first"""
+    return await _get_relatives(db, queries.ancestors, prompt_id, fields, max_depth)
+
+@app.get("/prompts/{prompt_id}/descendants")
+async def get_prompt_descendants(prompt_id: int, fields: Optional[str] = None, max_depth: Optional[int] = None,
+                                 db: AsyncSession = Depends(database.get_async_db)):
+    """Get every descendant of a prompt, generation by generation"""
+    return await _get_relatives(db, queries.descendants, prompt_id, fields, max_depth)
+
+async def _get_relatives(db: AsyncSession, query, prompt_id: int, fields: Optional[str],
+                         max_depth: Optional[int]):
+    try:
+        relatives = await db.run_sync(query, prompt_id, _parse_fields(fields), max_depth)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not relatives and await db.get(database.DBPrompt, prompt_id) is None:
+        raise HTTPException(status_code=404, detail="Prompt not found")
+    return relatives
 
 @app.post("/prompts/", response_model=models.PromptGenome)
-def create_prompt(prompt: models.PromptGenome, db: Session = Depends(database.get_db)):
+async def create_prompt(prompt: models.PromptGenome, db: AsyncSession = Depends(database.get_async_db)):
     """Create a new prompt"""
     db_prompt = database.DBPrompt(
         content=prompt.content,
@@ -54,8 +121,10 @@ def create_prompt(prompt: models.PromptGenome, db: Session = Depends(database.ge
         complexity_score=prompt.complexity_score
     )
     db.add(db_prompt)
-    db.commit()
-    db.refresh(db_prompt)
+    await db.flush()
+    await db.run_sync(lineage.index_prompts, [(db_prompt.id, db_prompt.parent_id)])
+    await db.commit()
+    await db.refresh(db_prompt)
     
     return models.PromptGenome(
         id=db_prompt.id,
@@ -68,39 +137,286 @@ def create_prompt(prompt: models.PromptGenome, db: Session = Depends(database.ge
         complexity_score=db_prompt.complexity_score
     )
 
-@app.post("/evolve/")
-def evolve_prompts(base_prompt: str, generations: int = 5):
-    """Run an evolution experiment"""
-    # This is a simplified version - in practice, you'd want to store results in the database
-    
-    # Initialize population
-    population = evolver_instance.initialize_population(base_prompt)
-    
-    results = []
-    
-    for gen in range(generations):
-        # Generate responses for each prompt
-        evaluations = llm_interface_instance.evaluate_prompt_batch(population)
-        
-        # For this demo, we'll assign random ratings
-        import random
-        for eval in evaluations:
-            eval.rating = random.uniform(1.0, 5.0)
-        
-        # Store generation results
-        gen_results = {
-            "generation": gen,
-            "population": [p.dict() for p in population],
-            "evaluations": [e.dict() for e in evaluations]
-        }
-        results.append(gen_results)
-        
-        # Evolve to next generation
-        if gen < generations - 1:  # Don't evolve after the last generation
-            population = evolver_instance.evolve_population(population, evaluations)
-    
-    return {"evolution_results": results}
+NDJSON_MEDIA_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+
+@app.post("/prompts/bulk", response_model=models.BulkIngestResult)
+async def create_prompts_bulk(request: Request, db: AsyncSession = Depends(database.get_async_db)):
+    """Create many prompts from a JSON array or an NDJSON stream
+    
+    Prompts are validated and stored in batches of ``INGEST_BATCH_SIZE``,
+    each in its own transaction. An invalid batch stops the upload with a
+    422 that reports how many prompts were already stored; the ids are
+    returned in input order otherwise.
+    """
+    if request.headers.get("content-type", "").split(";")[0].strip() in NDJSON_MEDIA_TYPES:
+        records = ingest.aiter_ndjson(request.stream())
+    else:
+        try:
+            body = json.loads(await request.body())
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON: {e}")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of prompts")
+        records = _aiter(body)
+    
+    ids = []
+    batch = []
+    
+    async def flush():
+        try:
+            ids.extend(await db.run_sync(ingest.ingest_batch, batch))
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail={
+                "stored": len(ids),
+                "errors": [{**error, "index": len(ids) + error["loc"][0]}
+                           for error in e.errors(include_url=False, include_context=False)]
+            })
+        batch.clear()
+    
+    try:
+        async for record in records:
+            batch.append(record)
+            if len(batch) >= settings.INGEST_BATCH_SIZE:
+                await flush()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail={"stored": len(ids), "error": f"Invalid NDJSON: {e}"})
+    if batch:
+        await flush()
+    return {"count": len(ids), "ids": ids}
+
+@app.post("/ratings/", response_model=models.BulkIngestResult)
+async def submit_ratings(payload: Union[models.RatingIn, List[models.RatingIn]]):
+    """Record one rating or a list of them; returns the new evaluation ids
+    
+    Ratings from concurrent requests are committed together in micro-batches
+    and folded into each prompt's rating summary as they are stored.
+    """
+    submitted = payload if isinstance(payload, list) else [payload]
+    try:
+        ids = await asyncio.wrap_future(rating_writer.submit(submitted))
+    except ratings.UnknownPromptError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"count": len(ids), "ids": ids}
+
+@app.get("/prompts/{prompt_id}/rating", response_model=models.RatingSummary)
+async def get_prompt_rating(prompt_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """A prompt's rating count, mean, variance and Bayesian average"""
+    summary = await db.run_sync(ratings.get_summary, prompt_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No ratings for this prompt")
+    return summary
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+@app.get("/export/{table}")
+def export_table(table: str, format: str = "ndjson", since: int = 0):
+    """Stream a table (prompts, evaluations or lineages) as NDJSON, Parquet or Arrow
+    
+    Only rows with ids above ``since`` are exported. The ``X-Export-Watermark``
+    header holds the highest id included; pass it as ``since`` next time to
+    export just the new rows (SQLite only). This is a sync handler on purpose:
+    the body is a generator over the driver's streaming cursor, iterated in
+    the threadpool.
+    """
+    db = database.SessionLocal()
+    try:
+        watermark, stream = export.export_table(db, table, format, since)
+    except ValueError as e:
+        db.close()
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        db.close()
+        raise HTTPException(status_code=501, detail=str(e))
+    
+    def body():
+        try:
+            yield from stream
+        finally:
+            db.close()
+    
+    media_type, extension = export.FORMATS[format]
+    return StreamingResponse(body(), media_type=media_type, headers={
+        "X-Export-Watermark": str(watermark),
+        "Content-Disposition": f'attachment; filename="{table}-{since + 1}-{watermark}.{extension}"'
+    })
+
+@app.post("/evolve/", response_model=models.EvolutionRun)
+async def evolve_prompts(base_prompt: str, generations: int = 5, seed: Optional[int] = None,
+                         db: AsyncSession = Depends(database.get_async_db)):
+    """Run an evolution experiment, persisting every generation as it completes"""
+    run = await db.run_sync(runs.start_run, base_prompt, runs.evolver_config(evolver_instance, seed))
+    
+    async for _ in runs.arun_generations(db, run, generations, llm_interface_instance, rate_outputs):
+        pass
+    
+    return runs.run_summary(run)
+
+def _format_event(event: str, data, format: str) -> str:
+    """Encode one streamed event as a Server-Sent Event or an NDJSON line"""
+    if format == "ndjson":
+        return json.dumps({"event": event, "data": data}, default=str) + "\n"
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+STREAM_MEDIA_TYPES = {"sse": "text/event-stream", "ndjson": "application/x-ndjson"}
+
+@app.post("/evolve/stream")
+async def evolve_prompts_stream(base_prompt: str, generations: int = 5, format: str = "sse",
+                                seed: Optional[int] = None):
+    """Run an evolution experiment, streaming each generation as it completes
+    
+    Only the generation being evaluated is held in memory. If the client
+    disconnects, the run stops after its last committed generation and can
+    be resumed like any other.
+    """
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(STREAM_MEDIA_TYPES)}")
+    
+    async def events():
+        # The request's own session is closed once the handler returns, so
+        # the stream opens its own
+        async with database.get_async_sessionmaker()() as db:
+            run = await db.run_sync(runs.start_run, base_prompt, runs.evolver_config(evolver_instance, seed))
+            yield _format_event("run", runs.run_summary(run).model_dump(), format)
+            
+            async for result in runs.arun_generations(db, run, generations, llm_interface_instance,
+                                                      rate_outputs):
+                yield _format_event("generation", result, format)
+            
+            yield _format_event("done", runs.run_summary(run).model_dump(), format)
+    
+    return StreamingResponse(events(), media_type=STREAM_MEDIA_TYPES[format])
+
+async def _get_run(db: AsyncSession, run_id: int) -> database.DBEvolutionRun:
+    run = await db.get(database.DBEvolutionRun, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return run
+
+@app.get("/runs/{run_id}", response_model=models.EvolutionRun)
+async def get_run(run_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """Get the status and current population of an evolution run"""
+    return runs.run_summary(await _get_run(db, run_id))
+
+@app.get("/runs/{run_id}/generations/{generation}")
+async def get_run_generation(run_id: int, generation: int, db: AsyncSession = Depends(database.get_async_db)):
+    """Get the prompts and evaluations of one generation of a run"""
+    await _get_run(db, run_id)
+    return await db.run_sync(runs.load_generation, run_id, generation)
+
+@app.post("/runs/{run_id}/resume", response_model=models.EvolutionRun)
+async def resume_run(run_id: int, generations: int = 5, db: AsyncSession = Depends(database.get_async_db)):
+    """Continue an evolution run from its last committed generation, starting from its checkpoint
+    
+    Answers 409 while a job or another request is evolving the run.
+    """
+    run = await _get_run(db, run_id)
+    
+    try:
+        async for _ in runs.arun_generations(db, run, generations, llm_interface_instance, rate_outputs):
+            pass
+    except runs.RunLeasedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    return runs.run_summary(run)
+
+def _checkpoint_summary(checkpoint: database.DBRunCheckpoint) -> models.RunCheckpoint:
+    return models.RunCheckpoint(run_id=checkpoint.run_id, generation=checkpoint.generation,
+                                size=len(checkpoint.data), created_at=checkpoint.created_at)
+
+@app.get("/runs/{run_id}/checkpoint", response_model=models.RunCheckpoint)
+async def get_run_checkpoint(run_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """Describe the checkpoint a resumed run would start from"""
+    await _get_run(db, run_id)
+    checkpoint = await db.get(database.DBRunCheckpoint, run_id)
+    if checkpoint is None:
+        raise HTTPException(status_code=404, detail="Run has no checkpoint")
+    return _checkpoint_summary(checkpoint)
+
+@app.post("/runs/{run_id}/checkpoint", response_model=models.RunCheckpoint)
+async def create_run_checkpoint(run_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """Checkpoint a run at its last committed generation, e.g. before moving it to another worker"""
+    run = await _get_run(db, run_id)
+    
+    def checkpoint(sync_db):
+        evolver, deduplicator = runs.restore_state(sync_db, run)
+        return runs.checkpoint_run(sync_db, run, evolver, deduplicator)
+    
+    return _checkpoint_summary(await db.run_sync(checkpoint))
+
+@app.get("/runs/{run_id}/replay")
+async def replay_run(run_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """Check that a run is reproduced exactly from its seed and recorded ratings"""
+    run = await _get_run(db, run_id)
+    generations = await db.run_sync(lambda sync_db: list(runs.replay_run(sync_db, run)))
+    return {
+        "run_id": run_id,
+        "reproducible": all(g["matches"] for g in generations),
+        "generations": generations
+    }
+
+@app.post("/jobs/", response_model=models.Job, status_code=202)
+async def submit_evolution_job(base_prompt: str, generations: int = 5, seed: Optional[int] = None,
+                               db: AsyncSession = Depends(database.get_async_db)):
+    """Start an evolution experiment in the background and return its job immediately"""
+    run = await db.run_sync(runs.start_run, base_prompt, runs.evolver_config(evolver_instance, seed))
+    return await db.run_sync(job_queue.submit, run, generations)
+
+@app.post("/runs/{run_id}/jobs", response_model=models.Job, status_code=202)
+async def submit_resume_job(run_id: int, generations: int = 5, db: AsyncSession = Depends(database.get_async_db)):
+    """Continue an evolution run in the background"""
+    return await db.run_sync(job_queue.submit, await _get_run(db, run_id), generations)
+
+async def _get_job(db: AsyncSession, job_id: int) -> database.DBJob:
+    job = await db.get(database.DBJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/", response_model=List[models.Job])
+async def list_jobs(status: Optional[str] = None, limit: int = 100,
+                    db: AsyncSession = Depends(database.get_async_db)):
+    """List background jobs, newest first"""
+    query = select(database.DBJob)
+    if status:
+        query = query.where(database.DBJob.status == status)
+    return (await db.scalars(query.order_by(database.DBJob.id.desc()).limit(limit))).all()
+
+@app.get("/jobs/{job_id}", response_model=models.Job)
+async def get_job(job_id: int, db: AsyncSession = Depends(database.get_async_db)):
+    """Get the status and per-generation progress of a job"""
+    return await _get_job(db, job_id)
+
+@app.get("/jobs/{job_id}/progress")
+async def get_job_progress(job_id: int, since: int = 0, db: AsyncSession = Depends(database.get_async_db)):
+    """Get the generation summaries recorded after the first ``since`` ones"""
+    job = await _get_job(db, job_id)
+    return {"status": job.status, "progress": (job.progress or [])[since:]}
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: int, format: str = "sse", db: AsyncSession = Depends(database.get_async_db)):
+    """Stream a job's progress as Server-Sent Events (or NDJSON) until it finishes"""
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"format must be one of {sorted(STREAM_MEDIA_TYPES)}")
+    await _get_job(db, job_id)
+    
+    async def events():
+        sent = 0
+        while True:
+            async with database.get_async_sessionmaker()() as poll_db:
+                job = await poll_db.get(database.DBJob, job_id)
+                progress = job.progress or []
+                for summary in progress[sent:]:
+                    yield _format_event("generation", summary, format)
+                sent = len(progress)
+                if job.status in ("succeeded", "failed"):
+                    yield _format_event("status", {"status": job.status, "error": job.error}, format)
+                    return
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+    
+    return StreamingResponse(events(), media_type=STREAM_MEDIA_TYPES[format])
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
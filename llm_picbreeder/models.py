@@ -1,7 +1,7 @@
 """
 Data models for LLM-Picbreeder
 """
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -20,6 +20,16 @@ class PromptGenome(BaseModel):
         "from_attributes": True
     }
 
+class PromptPage(BaseModel):
+    """One page of prompts, restricted to the requested fields"""
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None  # None on the last page
+
+class BulkIngestResult(BaseModel):
+    """Ids assigned to a bulk upload, in input order"""
+    count: int
+    ids: List[int]
+
 class PromptEvaluation(BaseModel):
     """Represents user evaluation of a prompt/output pair"""
     id: Optional[int] = None
@@ -28,11 +38,29 @@ class PromptEvaluation(BaseModel):
     rating: float  # 1-5 scale
     user_id: Optional[int] = None
     created_at: datetime = None
+    error: Optional[str] = None  # Set when the LLM request failed
+    fitness: Optional[float] = None  # Score the prompt was selected on, with every rating it had
+    reused: Optional[bool] = False  # Copied from a near-duplicate's evaluation instead of requested
     
     model_config = {
         "from_attributes": True
     }
 
+class RatingIn(BaseModel):
+    """A user's rating of a prompt, optionally with the output they rated"""
+    prompt_id: int
+    rating: float = Field(ge=1.0, le=5.0)
+    user_id: Optional[int] = None
+    output_content: str = ""
+
+class RatingSummary(BaseModel):
+    """Running aggregate of a prompt's ratings"""
+    prompt_id: int
+    count: int
+    mean: float
+    variance: float
+    bayesian_mean: float  # Mean shrunk towards RATING_PRIOR_MEAN by RATING_PRIOR_WEIGHT ratings
+
 class User(BaseModel):
     """Represents a user in the system"""
     id: Optional[int] = None
@@ -53,4 +81,43 @@ class EvolutionLineage(BaseModel):
     
     model_config = {
         "from_attributes": True
-    }
\ No newline at end of file
+    }
+
+class EvolutionRun(BaseModel):
+    """Represents a persisted evolution experiment"""
+    id: Optional[int] = None
+    base_prompt: str
+    status: str = "running"
+    next_generation: int = 0
+    population_ids: List[int] = []
+    config: Dict[str, Any] = {}
+    error: Optional[str] = None
+    created_at: datetime = None
+    updated_at: datetime = None
+    
+    model_config = {
+        "from_attributes": True
+    }
+
+class RunCheckpoint(BaseModel):
+    """Describes a run's latest checkpoint"""
+    run_id: int
+    generation: int
+    size: int  # Bytes
+    created_at: datetime = None
+
+class Job(BaseModel):
+    """Represents a background evolution job"""
+    id: Optional[int] = None
+    run_id: int
+    status: str = "queued"
+    target_generation: int
+    progress: List[Dict[str, Any]] = []
+    error: Optional[str] = None
+    created_at: datetime = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    model_config = {
+        "from_attributes": True
+    }
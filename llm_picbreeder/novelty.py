@@ -0,0 +1,202 @@
+"""
+Novelty search for LLM-Picbreeder
+
+Picbreeder's lesson is that stepping stones are rarely found by chasing the
+objective. With novelty search on, an individual's fitness blends its
+rating with how different it is from everything seen so far: the mean
+cosine distance to its ``k`` nearest neighbours in an archive of earlier
+prompts.
+
+Prompts are embedded locally as hashed word n-gram vectors, so no model or
+network is needed. Large archives are searched through an inverted file
+index, so scoring stays sub-linear in the archive size.
+"""
+import zlib
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from .dedup import canonicalize
+
+class HashingEmbedder:
+    """Sublinear-TF vectors of hashed word unigrams and bigrams, L2-normalized"""
+
+    def __init__(self, dim: int = 512, ngram_range: Sequence[int] = (1, 2)):
+        self.dim = dim
+        self.ngram_range = tuple(ngram_range)
+
+    def _buckets(self, text: str) -> List[int]:
+        words = canonicalize(text).split()
+        low, high = self.ngram_range
+        return [
+            zlib.crc32(" ".join(words[i:i + n]).encode()) % self.dim
+            for n in range(low, high + 1)
+            for i in range(len(words) - n + 1)
+        ]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = np.bincount(self._buckets(text), minlength=self.dim)
+            nonzero = counts > 0
+            vectors[row, nonzero] = 1.0 + np.log(counts[nonzero])
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+class NoveltyArchive:
+    """Every prompt seen so far, indexed for approximate k-nearest-neighbour queries
+
+    Small archives are searched exhaustively. Past ``exact_limit`` prompts
+    the vectors are clustered with spherical k-means into about
+    ``2 * sqrt(n)`` cells (an inverted file index), and a query only scans
+    the ``probes`` cells whose centroids are closest to it, so its cost
+    grows with ``sqrt(n)`` as long as prompts spread over the cells. The
+    index is rebuilt whenever the archive has doubled since it was last
+    built. Vectors are non-negative, so cosine distances lie in [0, 1].
+    """
+
+    def __init__(self, dim: int = 512, probes: int = 8, exact_limit: int = 4096,
+                 sample_size: int = 16384, seed: int = 0):
+        self.embedder = HashingEmbedder(dim)
+        self.probes = probes
+        self.exact_limit = exact_limit
+        self.sample_size = sample_size
+        self.seed = seed
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._size = 0
+        self._centroids: Optional[np.ndarray] = None
+        self._cells: List[List[int]] = []
+        self._cell_arrays: Dict[int, np.ndarray] = {}
+        self._indexed = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, texts: Sequence[str]):
+        if not texts:
+            return
+        vectors = self.embedder.embed(texts)
+        start = self._size
+        if start + len(vectors) > len(self._vectors):
+            capacity = max(2 * len(self._vectors), start + len(vectors), 1024)
+            grown = np.empty((capacity, self._vectors.shape[1]), dtype=np.float32)
+            grown[:start] = self._vectors[:start]
+            self._vectors = grown
+        self._vectors[start:start + len(vectors)] = vectors
+        self._size += len(vectors)
+
+        if self._size > self.exact_limit and self._size >= 2 * self._indexed:
+            self._build_index()
+        elif self._centroids is not None:
+            self._assign(start, self._size)
+
+    def _build_index(self):
+        """Cluster a sample of the archive with spherical k-means and file every vector"""
+        rng = np.random.default_rng(self.seed)
+        vectors = self._vectors[:self._size]
+        sample = vectors[rng.choice(self._size, min(self._size, self.sample_size), replace=False)]
+        cells = max(1, int(2 * np.sqrt(self._size)))
+        centroids = sample[rng.choice(len(sample), cells, replace=False)]
+        for _ in range(5):
+            nearest = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty cells keep their previous centroid
+            centroids = np.where(norms > 0, sums / np.where(norms > 0, norms, 1.0), centroids)
+        self._centroids = centroids
+        self._cells = [[] for _ in range(cells)]
+        self._cell_arrays = {}
+        self._assign(0, self._size)
+        self._indexed = self._size
+
+    def _assign(self, start: int, stop: int, batch: int = 8192):
+        for low in range(start, stop, batch):
+            high = min(stop, low + batch)
+            nearest = np.argmax(self._vectors[low:high] @ self._centroids.T, axis=1)
+            for offset, cell in enumerate(nearest.tolist()):
+                self._cells[cell].append(low + offset)
+                self._cell_arrays.pop(cell, None)
+
+    def _members(self, cell: int) -> np.ndarray:
+        members = self._cell_arrays.get(cell)
+        if members is None:
+            members = self._cell_arrays[cell] = np.array(self._cells[cell], dtype=np.int64)
+        return members
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        """The archived vectors and index as arrays; ``cells`` gives each vector's cell, or -1"""
+        cells = np.full(self._size, -1, dtype=np.int32)
+        for cell, members in enumerate(self._cells):
+            cells[members] = cell
+        return {
+            "vectors": self._vectors[:self._size].copy(),
+            "centroids": self._centroids if self._centroids is not None else np.empty((0, self.embedder.dim)),
+            "cells": cells,
+            "indexed": np.array(self._indexed)
+        }
+
+    def restore(self, state: Dict[str, np.ndarray]):
+        """Replace the archive with a ``snapshot``, index included, so queries match the original"""
+        self._vectors = np.asarray(state["vectors"], dtype=np.float32)
+        self._size = len(self._vectors)
+        self._indexed = int(state["indexed"])
+        self._cell_arrays = {}
+        if len(state["centroids"]) == 0:
+            self._centroids, self._cells = None, []
+            return
+        self._centroids = np.asarray(state["centroids"], dtype=np.float32)
+        cells = np.asarray(state["cells"])
+        order = np.argsort(cells, kind="stable")
+        bounds = np.searchsorted(cells[order], np.arange(len(self._centroids) + 1))
+        self._cells = [order[bounds[c]:bounds[c + 1]].tolist() for c in range(len(self._centroids))]
+
+    def knn_distances(self, texts: Sequence[str], k: int) -> np.ndarray:
+        """(n, k) distances to each text's nearest archived prompts, nearest first
+
+        Slots beyond the number of prompts searched are filled with 1.0.
+        """
+        vectors = self.embedder.embed(texts)
+        distances = np.ones((len(texts), k))
+        if self._size == 0:
+            return distances
+        if self._centroids is None:
+            found = 1.0 - vectors @ self._vectors[:self._size].T
+            found = np.sort(np.clip(found, 0.0, 1.0), axis=1)[:, :k]
+            distances[:, :found.shape[1]] = found
+            return distances
+
+        # Search cell by cell, so every query probing a cell shares one product
+        probes = min(self.probes, len(self._cells))
+        probed = np.argpartition(-(vectors @ self._centroids.T), probes - 1, axis=1)[:, :probes]
+        rows = np.repeat(np.arange(len(vectors)), probes)
+        cells = probed.ravel()
+        order = np.argsort(cells, kind="stable")
+        boundaries = np.flatnonzero(np.diff(cells[order])) + 1
+        for group in np.split(order, boundaries):
+            members = self._members(int(cells[group[0]]))
+            if len(members) == 0:
+                continue
+            queries = rows[group]
+            found = np.clip(1.0 - vectors[queries] @ self._vectors[members].T, 0.0, 1.0)
+            if found.shape[1] > k:
+                found = np.partition(found, k - 1, axis=1)[:, :k]
+            merged = np.concatenate([distances[queries], found], axis=1)
+            distances[queries] = np.partition(merged, k - 1, axis=1)[:, :k]
+        return np.sort(distances, axis=1)
+
+    def novelty(self, texts: Sequence[str], k: int, exclude_self: bool = False) -> np.ndarray:
+        """Mean distance to the ``k`` nearest neighbours
+
+        With ``exclude_self`` the texts are assumed to be archived already,
+        and each one's closest match (itself) is skipped.
+        """
+        distances = self.knn_distances(texts, k + 1 if exclude_self else k)
+        return distances[:, 1:].mean(axis=1) if exclude_self else distances.mean(axis=1)
+
+def _normalize(values: np.ndarray) -> np.ndarray:
+    if len(values) == 0 or values.max() == values.min():
+        return np.zeros_like(values)
+    return (values - values.min()) / (values.max() - values.min())
+
+def blend(ratings: np.ndarray, novelty: np.ndarray, weight: float) -> np.ndarray:
+    """``(1 - weight) * rating + weight * novelty``, each min-max scaled within the population"""
+    return (1.0 - weight) * _normalize(ratings) + weight * _normalize(novelty)
@@ -0,0 +1,158 @@
+"""
+Columnar population store for LLM-Picbreeder
+
+``PromptGenome`` is convenient at the API boundary but heavy to create by the
+thousand. Inside the evolver a population is a set of parallel NumPy arrays
+with prompt texts interned in a shared ``ContentPool``; genomes are only
+built when a population is handed back to callers.
+"""
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from .models import PromptGenome
+
+# Where an individual came from, stored as a small integer per row
+SOURCES = ("imported", "initial_population", "crossover", "clone", "mutation")
+SOURCE_CODES = {name: code for code, name in enumerate(SOURCES)}
+
+NO_ID = -1
+
+class ContentPool:
+    """Interned prompt texts; identical prompts share one slot"""
+
+    def __init__(self):
+        self._texts: List[str] = []
+        self._offsets: Dict[str, int] = {}
+
+    def intern(self, text: str) -> int:
+        offset = self._offsets.get(text)
+        if offset is None:
+            offset = self._offsets[text] = len(self._texts)
+            self._texts.append(text)
+        return offset
+
+    def __getitem__(self, offset: int) -> str:
+        return self._texts[offset]
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+class Population:
+    """Parallel arrays describing one population
+
+    Rows imported with ``from_genomes`` remember the genome they came from,
+    so ``to_genomes`` hands unchanged individuals (such as elites) back as
+    the very same objects.
+    """
+    _COLUMNS = {
+        "ids": np.int64,
+        "parent_ids": np.int64,
+        "parent2_ids": np.int64,
+        "fitness": np.float64,
+        "generation": np.int32,
+        "content": np.int32,
+        "source": np.int8,
+        "origin": np.int32
+    }
+
+    def __init__(self, pool: Optional[ContentPool] = None, capacity: int = 16,
+                 imported: Optional[List[PromptGenome]] = None):
+        self.pool = pool if pool is not None else ContentPool()
+        self.imported: List[PromptGenome] = imported if imported is not None else []
+        self._size = 0
+        for name, dtype in self._COLUMNS.items():
+            setattr(self, "_" + name, np.empty(max(1, capacity), dtype=dtype))
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getattr__(self, name):
+        # Expose each column as a view trimmed to the population size
+        if name in Population._COLUMNS:
+            return self.__dict__["_" + name][:self._size]
+        raise AttributeError(name)
+
+    def _grow(self, needed: int):
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in self._COLUMNS:
+            column = getattr(self, "_" + name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            setattr(self, "_" + name, grown)
+
+    def append(self, content: str, source: str, parent_id: int = NO_ID, parent2_id: int = NO_ID,
+               generation: int = 0, prompt_id: int = NO_ID, fitness: float = 0.0, origin: int = -1) -> int:
+        """Add one individual and return its row"""
+        self._grow(self._size + 1)
+        row = self._size
+        self._ids[row] = prompt_id
+        self._parent_ids[row] = parent_id
+        self._parent2_ids[row] = parent2_id
+        self._fitness[row] = fitness
+        self._generation[row] = generation
+        self._content[row] = self.pool.intern(content)
+        self._source[row] = SOURCE_CODES[source]
+        self._origin[row] = origin
+        self._size += 1
+        return row
+
+    def content_of(self, row: int) -> str:
+        return self.pool[self._content[row]]
+
+    def take(self, rows: Sequence[int]) -> "Population":
+        """A new population made of the given rows, sharing the content pool"""
+        rows = np.asarray(rows, dtype=np.int64)
+        taken = Population(self.pool, capacity=len(rows), imported=self.imported)
+        for name in self._COLUMNS:
+            getattr(taken, "_" + name)[:len(rows)] = getattr(self, name)[rows]
+        taken._size = len(rows)
+        return taken
+
+    @classmethod
+    def from_genomes(cls, genomes: Sequence[PromptGenome], pool: Optional[ContentPool] = None,
+                     generation: int = 0) -> "Population":
+        population = cls(pool, capacity=len(genomes), imported=list(genomes))
+        for i, genome in enumerate(genomes):
+            population.append(
+                genome.content,
+                "imported",
+                parent_id=genome.parent_id if genome.parent_id is not None else NO_ID,
+                generation=generation,
+                prompt_id=genome.id if genome.id is not None else NO_ID,
+                origin=i
+            )
+        return population
+
+    def to_genomes(self) -> List[PromptGenome]:
+        """Materialize the population as ``PromptGenome`` objects"""
+        genomes = []
+        for row in range(self._size):
+            origin = self._origin[row]
+            if origin >= 0:
+                genomes.append(self.imported[origin])
+                continue
+
+            source = SOURCES[self._source[row]]
+            prompt_id = _optional_id(self._ids[row])
+            parent_id = _optional_id(self._parent_ids[row])
+            if source == "crossover":
+                metadata = {"source": source, "parent1_id": parent_id,
+                            "parent2_id": _optional_id(self._parent2_ids[row])}
+            elif source == "initial_population":
+                metadata = {"source": source, "variant_id": row}
+            else:
+                metadata = {"source": source, "parent_id": parent_id}
+
+            genomes.append(PromptGenome(
+                id=prompt_id,
+                content=self.content_of(row),
+                metadata=metadata,
+                parent_id=parent_id
+            ))
+        return genomes
+
+def _optional_id(value) -> Optional[int]:
+    return None if value == NO_ID else int(value)
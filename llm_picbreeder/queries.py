@@ -0,0 +1,125 @@
+"""
+Read queries for LLM-Picbreeder's API
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session
+from .database import DBPrompt, DBPromptClosure
+
+# API field name -> column; "metadata" is stored as metadata_json
+PROMPT_FIELDS = {
+    "id": DBPrompt.id,
+    "content": DBPrompt.content,
+    "template_vars": DBPrompt.template_vars,
+    "metadata": DBPrompt.metadata_json,
+    "creator_id": DBPrompt.creator_id,
+    "parent_id": DBPrompt.parent_id,
+    "created_at": DBPrompt.created_at,
+    "complexity_score": DBPrompt.complexity_score
+}
+
+def _projection(fields: Optional[Sequence[str]]) -> List[str]:
+    fields = list(fields) if fields else list(PROMPT_FIELDS)
+    unknown = [f for f in fields if f not in PROMPT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields {unknown}; expected some of {list(PROMPT_FIELDS)}")
+    return fields
+
+def _row_to_item(row, fields: Sequence[str]) -> Dict[str, Any]:
+    item = {f: getattr(row, f) for f in fields}
+    if "template_vars" in item and item["template_vars"] is None:
+        item["template_vars"] = {}
+    if "metadata" in item and item["metadata"] is None:
+        item["metadata"] = {}
+    return item
+
+def encode_cursor(created_at: datetime, prompt_id: int) -> str:
+    """Opaque cursor pointing just after the given row"""
+    raw = json.dumps([created_at.isoformat(), prompt_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, prompt_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(prompt_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
+
+def list_prompts(db: Session, limit: int = 100, cursor: Optional[str] = None,
+                 fields: Optional[Sequence[str]] = None, creator_id: Optional[int] = None,
+                 parent_id: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of prompts in (created_at, id) order, plus the cursor for the next page
+
+    Pages are found by seeking the (created_at, id) index rather than with
+    OFFSET, so a deep page costs the same as the first. Only the requested
+    ``fields`` are loaded; rows come back as plain dicts.
+    """
+    fields = _projection(fields)
+
+    # The sort key is always selected so the next cursor can be built
+    columns = [PROMPT_FIELDS[f].label(f) for f in fields]
+    columns += [DBPrompt.created_at.label("_created_at"), DBPrompt.id.label("_id")]
+    query = select(*columns)
+    if creator_id is not None:
+        query = query.where(DBPrompt.creator_id == creator_id)
+    if parent_id is not None:
+        query = query.where(DBPrompt.parent_id == parent_id)
+    if cursor is not None:
+        query = query.where(tuple_(DBPrompt.created_at, DBPrompt.id) > tuple_(*decode_cursor(cursor)))
+    query = query.order_by(DBPrompt.created_at, DBPrompt.id).limit(limit + 1)
+
+    rows = db.execute(query).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]._created_at, rows[-1]._id)
+
+    return [_row_to_item(row, fields) for row in rows], next_cursor
+
+def _relatives(db: Session, prompt_id: int, fields: Optional[Sequence[str]], up: bool,
+               max_depth: Optional[int]) -> List[Dict[str, Any]]:
+    fields = _projection(fields)
+    anchor, other = ((DBPromptClosure.descendant_id, DBPromptClosure.ancestor_id) if up
+                     else (DBPromptClosure.ancestor_id, DBPromptClosure.descendant_id))
+    query = (
+        select(*[PROMPT_FIELDS[f].label(f) for f in fields], DBPromptClosure.depth.label("depth"))
+        .join(DBPromptClosure, other == DBPrompt.id)
+        .where(anchor == prompt_id, DBPromptClosure.depth > 0)
+        .order_by(DBPromptClosure.depth, DBPrompt.id)
+    )
+    if max_depth is not None:
+        query = query.where(DBPromptClosure.depth <= max_depth)
+    return [_row_to_item(row, fields + ["depth"]) for row in db.execute(query)]
+
+def ancestors(db: Session, prompt_id: int, fields: Optional[Sequence[str]] = None,
+              max_depth: Optional[int] = None) -> List[Dict[str, Any]]:
+    """A prompt's ancestors, nearest first, each with its distance as ``depth``"""
+    return _relatives(db, prompt_id, fields, True, max_depth)
+
+def descendants(db: Session, prompt_id: int, fields: Optional[Sequence[str]] = None,
+                max_depth: Optional[int] = None) -> List[Dict[str, Any]]:
+    """A prompt's descendants, breadth first, each with its distance as ``depth``"""
+    return _relatives(db, prompt_id, fields, False, max_depth)
+
+def lineage_stats(db: Session, prompt_id: int) -> Optional[Dict[str, int]]:
+    """Depth below the root and size of the subtree (including the prompt itself)
+
+    Returns None for a prompt that is not in the lineage index.
+    """
+    depth = (
+        select(func.max(DBPromptClosure.depth))
+        .where(DBPromptClosure.descendant_id == prompt_id)
+        .scalar_subquery()
+    )
+    subtree = (
+        select(func.count(), func.max(DBPromptClosure.depth))
+        .where(DBPromptClosure.ancestor_id == prompt_id)
+        .subquery()
+    )
+    row = db.execute(select(depth.label("depth"), *subtree.c)).one()
+    if row[0] is None:
+        return None
+    return {"prompt_id": prompt_id, "depth": row[0], "subtree_size": row[1], "subtree_height": row[2]}
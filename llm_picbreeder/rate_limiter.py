@@ -0,0 +1,226 @@
+"""
+Client-side rate limiting and adaptive concurrency for LLM-Picbreeder
+"""
+import asyncio
+import random
+import time
+from typing import Dict, Any, Optional
+
+import openai
+
+class LLMRequestError(Exception):
+    """Raised when an LLM request fails for good (after any retries)"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``per_minute`` tokens a minute
+
+    A budget of 0 disables the bucket. All calls must come from the same
+    event loop; there is no await between checking and taking tokens, so
+    no lock is needed.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.per_minute / 60.0)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        """Wait until ``amount`` tokens are available and take them"""
+        if self.per_minute <= 0:
+            return
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) * 60.0 / self.per_minute)
+
+    def refund(self, amount: float):
+        """Return tokens that were reserved but not used"""
+        if self.per_minute <= 0 or amount <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD window on the number of requests in flight
+
+    The window grows by roughly one slot per round trip while latency stays
+    within ``latency_tolerance`` times the best smoothed latency seen so
+    far, and shrinks multiplicatively on throttling, server errors or
+    latency blow-ups.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 64,
+                 latency_tolerance: float = 2.0, backoff_factor: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.latency_tolerance = latency_tolerance
+        self.backoff_factor = backoff_factor
+        self.in_flight = 0
+        self.smoothed_latency: Optional[float] = None
+        self.best_latency: Optional[float] = None
+        self._condition: Optional[asyncio.Condition] = None
+
+    @property
+    def window(self) -> int:
+        return int(self.limit)
+
+    async def acquire(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.window)
+            self.in_flight += 1
+
+    async def release(self, latency: Optional[float], ok: bool):
+        """Give the slot back and adapt the window to the observed outcome"""
+        if not ok:
+            self.limit = max(self.minimum, self.limit * self.backoff_factor)
+        elif latency is not None:
+            if self.smoothed_latency is None:
+                self.smoothed_latency = latency
+            else:
+                self.smoothed_latency = 0.8 * self.smoothed_latency + 0.2 * latency
+            if self.best_latency is None or self.smoothed_latency < self.best_latency:
+                self.best_latency = self.smoothed_latency
+
+            if self.smoothed_latency > self.best_latency * self.latency_tolerance:
+                self.limit = max(self.minimum, self.limit * 0.9)
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+def _status_code(exc: Exception) -> Optional[int]:
+    return getattr(exc, "status_code", None)
+
+def is_retryable(exc: Exception) -> bool:
+    """Throttling, server errors, timeouts and dropped connections are retried"""
+    if isinstance(exc, (asyncio.TimeoutError, openai.APIConnectionError)):
+        return True
+    status = _status_code(exc)
+    return status is not None and (status == 429 or status >= 500)
+
+def is_overload(exc: Exception) -> bool:
+    """Throttling, server errors and timeouts: signs the provider wants less concurrency"""
+    if isinstance(exc, asyncio.TimeoutError):
+        return True
+    status = _status_code(exc)
+    return status is not None and (status == 429 or status >= 500)
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class RequestScheduler:
+    """Schedules chat completion requests against provider quotas
+
+    Every request first reserves request and token budget, then a slot in
+    the adaptive concurrency window. Retryable failures are retried with
+    full-jitter exponential backoff (or the server's Retry-After); once the
+    retries are used up an ``LLMRequestError`` is raised instead of a
+    response. Failed attempts hand back their token reservation, and only
+    overload (see ``is_overload``) shrinks the window.
+    """
+
+    def __init__(self, client, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 max_concurrency: int = 8, min_concurrency: int = 1, max_retries: int = 5,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 request_timeout: Optional[float] = None):
+        self.client = client
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial=max(min_concurrency, max_concurrency // 2),
+            minimum=min_concurrency,
+            maximum=max_concurrency
+        )
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.request_timeout = request_timeout
+
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+
+    @staticmethod
+    def estimate_tokens(messages, max_tokens: int) -> int:
+        """Rough token count: ~4 characters per token plus the completion budget"""
+        return sum(len(m["content"]) for m in messages) // 4 + max_tokens
+
+    def _backoff(self, attempt: int, exc: Exception) -> float:
+        retry_after = _retry_after(exc)
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def create(self, **kwargs):
+        """Drop-in for ``client.chat.completions.create``"""
+        estimate = self.estimate_tokens(kwargs["messages"], kwargs.get("max_tokens", 0))
+
+        for attempt in range(self.max_retries + 1):
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(estimate)
+            await self.limiter.acquire()
+
+            self.requests += 1
+            start = time.monotonic()
+            try:
+                call = self.client.chat.completions.create(**kwargs)
+                if self.request_timeout:
+                    response = await asyncio.wait_for(call, timeout=self.request_timeout)
+                else:
+                    response = await call
+            except Exception as e:
+                # A rejected request (400, 401, 404...) says nothing about load
+                await self.limiter.release(None, ok=not is_overload(e))
+                self.token_bucket.refund(estimate)
+                if _status_code(e) == 429:
+                    self.throttled += 1
+                if not is_retryable(e) or attempt == self.max_retries:
+                    self.failures += 1
+                    if isinstance(e, asyncio.TimeoutError):
+                        raise LLMRequestError(f"timed out after {self.request_timeout}s") from e
+                    raise LLMRequestError(str(e), _status_code(e)) from e
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt, e))
+                continue
+
+            await self.limiter.release(time.monotonic() - start, ok=True)
+            usage = getattr(response, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                self.token_bucket.refund(estimate - usage.total_tokens)
+            return response
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and the current concurrency window"""
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "concurrency_window": self.limiter.window,
+            "in_flight": self.limiter.in_flight,
+            "smoothed_latency": self.limiter.smoothed_latency
+        }
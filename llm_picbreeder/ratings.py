@@ -0,0 +1,281 @@
+"""
+Rating ingestion for LLM-Picbreeder
+
+Ratings from many users arrive concurrently. Each one is appended to the
+``evaluations`` table and merged into its prompt's row in
+``rating_summaries`` (count, sum and sum of squared deviations), so a
+prompt's mean, variance and Bayesian average are read in O(1) instead of
+re-scanning its evaluations.
+
+Every user rating counts, but a prompt's automated rating from an
+evolution run counts only once: runs re-rate surviving elites each
+generation and copy ratings to near-duplicates, and counting those again
+would let a prompt's rating count grow with its age rather than its raters.
+
+``RatingWriter`` batches ratings across concurrent requests: a single
+writer thread drains a queue and commits everything that has arrived, up
+to about ``RATING_BATCH_SIZE`` ratings, in one transaction. SQLite allows
+one writer at a time, so committing per micro-batch rather than per
+rating is what lets it take thousands of ratings per second.
+"""
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from sqlalchemy import and_, delete, func, insert, or_, select
+from sqlalchemy.orm import Session
+from .aggregates import RatingAggregate, RatingIndex
+from .config import settings
+from .database import DBEvaluation, DBPrompt, DBRatingSummary
+from .models import PromptEvaluation, RatingIn
+
+# Ratings from one caller and the future that receives their evaluation ids
+Submission = Tuple[List[RatingIn], Future]
+
+class UnknownPromptError(LookupError):
+    """A rating referred to a prompt that does not exist"""
+
+    def __init__(self, prompt_ids: Sequence[int]):
+        super().__init__(f"Unknown prompt ids {sorted(prompt_ids)}")
+        self.prompt_ids = sorted(prompt_ids)
+
+def _moments(ratings: Iterable[Tuple[int, float]]) -> Dict[int, RatingAggregate]:
+    index = RatingIndex()
+    for prompt_id, rating in ratings:
+        index.add(prompt_id, rating)
+    return dict(index.items())
+
+def _dialect_insert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        raise NotImplementedError(f"Rating summaries need an upsert; {dialect!r} is not supported")
+    return dialect_insert
+
+def _upsert_summaries(db: Session, aggregates: Dict[int, RatingAggregate], chunk_size: int = 1000):
+    """Merge aggregates into ``rating_summaries`` in SQL, so concurrent writers never lose updates
+
+    Existing rows are combined with Chan et al.'s parallel variance update.
+    """
+    table = DBRatingSummary.__table__
+    dialect_insert = _dialect_insert(db)
+    now = datetime.utcnow()
+    rows = [
+        {"prompt_id": prompt_id, "count": a.count, "total": a.total, "m2": a.m2, "updated_at": now}
+        for prompt_id, a in aggregates.items()
+    ]
+    for start in range(0, len(rows), chunk_size):
+        statement = dialect_insert(table).values(rows[start:start + chunk_size])
+        old, new = table.c, statement.excluded
+        delta = new.total / new.count - old.total / old.count
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[old.prompt_id],
+            set_={
+                "count": old.count + new.count,
+                "total": old.total + new.total,
+                "m2": old.m2 + new.m2 + delta * delta * old.count * new.count / (old.count + new.count),
+                "updated_at": new.updated_at
+            }
+        ))
+
+def update_summaries(db: Session, ratings: Iterable[Tuple[int, float]]):
+    """Merge ``(prompt_id, rating)`` pairs into the rating summaries, without committing"""
+    aggregates = _moments(ratings)
+    if aggregates:
+        _upsert_summaries(db, aggregates)
+
+def _counted_run_rating():
+    """SQL condition: a run's evaluation holding a new rating of its prompt"""
+    return and_(DBEvaluation.run_id.isnot(None), DBEvaluation.error.is_(None), DBEvaluation.reused.isnot(True))
+
+def new_run_ratings(db: Session, evaluations: Iterable[PromptEvaluation]) -> List[Tuple[int, float]]:
+    """The ``(prompt_id, rating)`` pairs a run's generation adds to the summaries
+
+    Only the first successful, requested rating of each prompt counts; call
+    before the generation's evaluations are written.
+    """
+    candidates: Dict[int, float] = {}
+    for evaluation in evaluations:
+        if not evaluation.error and not evaluation.reused:
+            candidates.setdefault(evaluation.prompt_id, evaluation.rating)
+    if candidates:
+        rated = db.scalars(
+            select(DBEvaluation.prompt_id).distinct()
+            .where(DBEvaluation.prompt_id.in_(candidates), _counted_run_rating())
+        )
+        for prompt_id in rated:
+            del candidates[prompt_id]
+    return list(candidates.items())
+
+def store_ratings(db: Session, ratings: List[RatingIn]) -> List[int]:
+    """Append ratings as evaluations and update the summaries, without committing
+
+    Returns the new evaluation ids in input order.
+    """
+    if not ratings:
+        return []
+    evaluations = DBEvaluation.__table__
+    ids = db.execute(
+        insert(evaluations).returning(evaluations.c.id, sort_by_parameter_order=True),
+        [
+            {
+                "prompt_id": r.prompt_id,
+                "output_content": r.output_content,
+                "rating": r.rating,
+                "user_id": r.user_id
+            }
+            for r in ratings
+        ]
+    ).scalars().all()
+    update_summaries(db, [(r.prompt_id, r.rating) for r in ratings])
+    return ids
+
+def missing_prompts(db: Session, prompt_ids: Iterable[int]) -> set:
+    prompt_ids = set(prompt_ids)
+    if not prompt_ids:
+        return set()
+    found = db.scalars(select(DBPrompt.id).where(DBPrompt.id.in_(prompt_ids)))
+    return prompt_ids - set(found)
+
+def rebuild_summaries(db: Session, batch_size: int = 10000) -> int:
+    """Recompute every summary from the evaluations table; returns the prompts summarized
+
+    For databases created before the summaries existed, or whose summaries
+    counted every re-rating of a run's prompts. Failed evaluations are
+    skipped, and runs contribute one rating per prompt as in
+    ``new_run_ratings``.
+    """
+    db.execute(delete(DBRatingSummary))
+    index = RatingIndex()
+    first_run_ratings = (
+        select(func.min(DBEvaluation.id)).where(_counted_run_rating()).group_by(DBEvaluation.prompt_id)
+    )
+    query = (
+        select(DBEvaluation.prompt_id, DBEvaluation.rating)
+        .where(DBEvaluation.error.is_(None),
+               or_(DBEvaluation.run_id.is_(None), DBEvaluation.id.in_(first_run_ratings)))
+        .execution_options(yield_per=batch_size)
+    )
+    for batch in db.execute(query).partitions():
+        for prompt_id, rating in batch:
+            index.add(prompt_id, rating)
+    aggregates = dict(index.items())
+    if aggregates:
+        _upsert_summaries(db, aggregates)
+    db.commit()
+    return len(aggregates)
+
+def load_index(db: Session, prompt_ids: Optional[Iterable[int]] = None,
+               prior_mean: Optional[float] = None, prior_weight: Optional[float] = None) -> RatingIndex:
+    """A ``RatingIndex`` read from the summaries, scoring prompts by their Bayesian average"""
+    index = RatingIndex(
+        settings.RATING_PRIOR_MEAN if prior_mean is None else prior_mean,
+        settings.RATING_PRIOR_WEIGHT if prior_weight is None else prior_weight
+    )
+    query = select(DBRatingSummary.prompt_id, DBRatingSummary.count, DBRatingSummary.total, DBRatingSummary.m2)
+    if prompt_ids is not None:
+        query = query.where(DBRatingSummary.prompt_id.in_(set(prompt_ids)))
+    for prompt_id, count, total, m2 in db.execute(query):
+        index.set(prompt_id, RatingAggregate.from_moments(count, total, m2))
+    return index
+
+def get_summary(db: Session, prompt_id: int) -> Optional[Dict[str, float]]:
+    """A prompt's rating count, mean, variance and Bayesian average, or None if it is unrated"""
+    aggregate = load_index(db, [prompt_id]).get(prompt_id)
+    if aggregate is None:
+        return None
+    return {
+        "prompt_id": prompt_id,
+        "count": aggregate.count,
+        "mean": aggregate.mean,
+        "variance": aggregate.variance,
+        "bayesian_mean": aggregate.bayesian_mean(settings.RATING_PRIOR_MEAN, settings.RATING_PRIOR_WEIGHT)
+    }
+
+class RatingWriter:
+    """Commits ratings from many callers in shared micro-batches on one thread
+
+    There is no timer: whatever queued up while the previous transaction
+    was committing goes into the next one, so batches grow with the load
+    and a lone rating is written at once.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], batch_size: Optional[int] = None):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.RATING_BATCH_SIZE
+        self._queue: "queue.Queue[Optional[Submission]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, ratings: List[RatingIn]) -> Future:
+        """Queue ratings; the future resolves to their evaluation ids once committed
+
+        Fails with ``UnknownPromptError`` if any rating names a missing
+        prompt, in which case none of these ratings are stored.
+        """
+        future: Future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rating-writer", daemon=True)
+                self._thread.start()
+            self._queue.put((list(ratings), future))
+        return future
+
+    def stop(self, timeout: Optional[float] = None):
+        """Write what is queued, then stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, size = [first], len(first[0])
+            stopping = False
+            while size < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                size += len(item[0])
+            self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch: List["Submission"]):
+        batch = [(ratings, future) for ratings, future in batch if future.set_running_or_notify_cancel()]
+        try:
+            with self.session_factory() as db:
+                missing = missing_prompts(db, (r.prompt_id for ratings, _ in batch for r in ratings))
+                accepted = []
+                for ratings, future in batch:
+                    unknown = missing.intersection(r.prompt_id for r in ratings)
+                    if unknown:
+                        future.set_exception(UnknownPromptError(unknown))
+                    else:
+                        accepted.append((ratings, future))
+                ids = store_ratings(db, [r for ratings, _ in accepted for r in ratings])
+                db.commit()
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for ratings, future in accepted:
+            future.set_result(ids[offset:offset + len(ratings)])
+            offset += len(ratings)
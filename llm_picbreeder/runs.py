@@ -0,0 +1,527 @@
+"""
+Persistent evolution runs for LLM-Picbreeder
+
+A run is stored as an ``evolution_runs`` row plus the prompts, lineage and
+evaluations it produced. Each generation is written in one transaction that
+records the evaluations of the generation just rated together with the
+offspring that make up the next one, so the run can be resumed from the
+database after any committed generation.
+
+Selection reads each prompt's rating summary, so ratings users send to
+``POST /ratings/`` steer the run alongside the automated ratings. A
+prompt's automated rating enters its summary once, however many
+generations it survives (see ``ratings.new_run_ratings``). The score each
+prompt was selected on is stored with its evaluation for replays.
+"""
+import asyncio
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Callable, Dict, Any, Iterator, List, Optional, Tuple
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import checkpoints, ingest, ratings
+from .aggregates import RatingIndex
+from .config import settings
+from .database import DBPrompt, DBEvaluation, DBLineage, DBEvolutionRun, DBRunCheckpoint
+from .dedup import Deduplicator
+from .evolver import PromptEvolver
+from .llm_interface import LLMInterface
+from .models import PromptGenome, PromptEvaluation, EvolutionRun
+
+RatingFunction = Callable[[List[PromptGenome], List[PromptEvaluation]], None]
+
+class RunLeasedError(RuntimeError):
+    """The run is being evolved by another worker"""
+
+def new_lease_owner() -> str:
+    """A lease owner name unique to this process and call"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+
+def run_is_free(now: datetime):
+    """SQL condition: no live lease is held on the run"""
+    return or_(DBEvolutionRun.lease_owner.is_(None), DBEvolutionRun.lease_expires_at < now)
+
+def claim_run(db: Session, run_id: int, owner: str) -> bool:
+    """Atomically lease a run to ``owner`` for ``RUN_LEASE_TIMEOUT`` seconds and commit
+
+    Fails if anyone else holds a live lease; an owner may claim its own run
+    again, which renews the lease.
+    """
+    now = datetime.utcnow()
+    claimed = db.execute(
+        update(DBEvolutionRun)
+        .where(DBEvolutionRun.id == run_id, or_(run_is_free(now), DBEvolutionRun.lease_owner == owner))
+        .values(lease_owner=owner, lease_expires_at=now + timedelta(seconds=settings.RUN_LEASE_TIMEOUT))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return bool(claimed)
+
+def release_run(db: Session, run_id: int, owner: str):
+    """Give up ``owner``'s lease on a run, if it still holds it, and commit"""
+    db.execute(
+        update(DBEvolutionRun)
+        .where(DBEvolutionRun.id == run_id, DBEvolutionRun.lease_owner == owner)
+        .values(lease_owner=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+def evolver_config(evolver: PromptEvolver, seed: Optional[int] = None) -> Dict[str, Any]:
+    """The evolver parameters a run needs to be resumed or replayed identically
+    
+    Every run gets a seed (a fresh one unless given or set on the evolver),
+    so any run can be replayed.
+    """
+    if seed is None:
+        seed = evolver.seed if evolver.seed is not None else random.SystemRandom().getrandbits(63)
+    return {
+        "seed": seed,
+        "population_size": evolver.population_size,
+        "mutation_rate": evolver.mutation_rate,
+        "crossover_rate": evolver.crossover_rate,
+        "selection_method": evolver.selection_method,
+        "tournament_size": evolver.tournament_size,
+        "truncation_fraction": evolver.truncation_fraction,
+        # Chunked breeding draws differently from in-process breeding; only the worker count is free
+        "breeding": "chunked" if evolver.breeding_workers else "in_process",
+        "breeding_chunk_size": evolver.breeding_chunk_size,
+        "dedup_mode": settings.DEDUP_MODE,
+        "dedup_threshold": settings.DEDUP_THRESHOLD,
+        "novelty_weight": evolver.novelty_weight,
+        "novelty_k": evolver.novelty_k
+    }
+
+def make_evolver(config: Dict[str, Any]) -> PromptEvolver:
+    """Build an evolver configured like the one that started a run"""
+    evolver = PromptEvolver(seed=config.get("seed"))
+    evolver.population_size = config.get("population_size", evolver.population_size)
+    evolver.mutation_rate = config.get("mutation_rate", evolver.mutation_rate)
+    evolver.crossover_rate = config.get("crossover_rate", evolver.crossover_rate)
+    evolver.selection_method = config.get("selection_method", evolver.selection_method)
+    evolver.tournament_size = config.get("tournament_size", evolver.tournament_size)
+    evolver.truncation_fraction = config.get("truncation_fraction", evolver.truncation_fraction)
+    # Runs from before the breeding mode was recorded bred in-process, the default
+    if config.get("breeding", "in_process") == "chunked":
+        evolver.breeding_workers = max(1, settings.BREEDING_WORKERS)
+    else:
+        evolver.breeding_workers = 0
+    evolver.breeding_chunk_size = config.get("breeding_chunk_size", evolver.breeding_chunk_size)
+    # Runs from before novelty search selected on ratings alone
+    evolver.novelty_weight = config.get("novelty_weight", 0.0)
+    evolver.novelty_k = config.get("novelty_k", evolver.novelty_k)
+    return evolver
+
+def _new_deduplicator(config: Dict[str, Any]) -> Optional[Deduplicator]:
+    # Runs created before deduplication existed have no ``dedup_mode`` and are left unfiltered
+    if config.get("dedup_mode", "off") == "off":
+        return None
+    return Deduplicator(config.get("dedup_threshold"))
+
+def _absorb_generations(db: Session, run: DBEvolutionRun, start: int,
+                        deduplicator: Optional[Deduplicator], evolver: Optional[PromptEvolver]):
+    """Feed the generations recorded from ``start`` on to the dedup and novelty archives"""
+    if evolver is not None and evolver.novelty_weight <= 0:
+        evolver = None
+    if deduplicator is None and evolver is None:
+        return
+    for generation in range(start, run.next_generation):
+        recorded = load_generation(db, run.id, generation)
+        if evolver is not None:
+            evolver.novelty_archive.add([p["content"] for p in recorded["population"]])
+        if deduplicator is not None:
+            deduplicator.absorb(
+                [PromptGenome(**p) for p in recorded["population"]],
+                [PromptEvaluation(**e) for e in recorded["evaluations"]]
+            )
+
+def restore_novelty_archive(db: Session, run: DBEvolutionRun, evolver: PromptEvolver):
+    """Refill a fresh evolver's novelty archive with the run's evaluated generations"""
+    _absorb_generations(db, run, 0, None, evolver)
+
+def make_deduplicator(db: Session, run: DBEvolutionRun) -> Optional[Deduplicator]:
+    """The run's near-duplicate filter, with its archive rebuilt from the stored generations"""
+    deduplicator = _new_deduplicator(run.config or {})
+    _absorb_generations(db, run, 0, deduplicator, None)
+    return deduplicator
+
+def restore_state(db: Session, run: DBEvolutionRun,
+                  evolver: Optional[PromptEvolver] = None) -> Tuple[PromptEvolver, Optional[Deduplicator]]:
+    """The evolver and near-duplicate filter to continue a run with
+
+    Starts from the run's latest checkpoint, if any, and replays only the
+    generations recorded after it. A given ``evolver`` keeps its own random
+    streams and novelty archive.
+    """
+    restore_evolver = evolver is None
+    if evolver is None:
+        evolver = make_evolver(run.config or {})
+    deduplicator = _new_deduplicator(run.config or {})
+
+    start = 0
+    checkpoint = checkpoints.load_checkpoint(db, run)
+    if checkpoint is not None:
+        checkpoint.restore(evolver if restore_evolver else None, deduplicator)
+        start = checkpoint.generation
+    _absorb_generations(db, run, start, deduplicator, evolver if restore_evolver else None)
+    return evolver, deduplicator
+
+def checkpoint_run(db: Session, run: DBEvolutionRun, evolver: PromptEvolver,
+                   deduplicator: Optional[Deduplicator]) -> DBRunCheckpoint:
+    """Checkpoint a run's state after its last recorded generation"""
+    data = checkpoints.encode(evolver, deduplicator, run.next_generation, run.population_ids or [])
+    return checkpoints.save_checkpoint(db, run.id, run.next_generation, data)
+
+def _split(deduplicator: Optional[Deduplicator], population: List[PromptGenome]):
+    if deduplicator is None:
+        return population, {}
+    return deduplicator.split(population)
+
+def _merge(deduplicator: Optional[Deduplicator], population: List[PromptGenome],
+           evaluations: List[PromptEvaluation], duplicates) -> List[PromptEvaluation]:
+    if deduplicator is None:
+        return evaluations
+    return deduplicator.merge(population, evaluations, duplicates)
+
+def _score_generation(db: Session, evaluations: List[PromptEvaluation]):
+    """Set each evaluation's ``fitness`` to its prompt's score over every rating it has had
+
+    The prompts' stored rating summaries, which hold their earlier
+    automated rating and any sent to ``POST /ratings/``, are merged with
+    the ratings this generation adds and scored by Bayesian average.
+    """
+    index = ratings.load_index(db, {e.prompt_id for e in evaluations})
+    for prompt_id, rating in ratings.new_run_ratings(db, evaluations):
+        index.add(prompt_id, rating)
+    for evaluation in evaluations:
+        if evaluation.prompt_id not in index and not evaluation.error:
+            # A near-duplicate never rated itself scores on the rating it copied
+            index.add(evaluation.prompt_id, evaluation.rating)
+        evaluation.fitness = index.score(evaluation.prompt_id)
+
+def _fitness_index(evaluations: List[PromptEvaluation]) -> RatingIndex:
+    """The scores selection reads, as recorded with the evaluations"""
+    if any(e.fitness is None for e in evaluations):
+        # Generations recorded before fitness was stored selected on their own ratings
+        return RatingIndex.from_evaluations(evaluations)
+    index = RatingIndex()
+    for evaluation in evaluations:
+        index.add(evaluation.prompt_id, evaluation.fitness)
+    return index
+
+def _breed(evolver: PromptEvolver, deduplicator: Optional[Deduplicator], config: Dict[str, Any],
+           generation: int, population: List[PromptGenome],
+           evaluations: List[PromptEvaluation]) -> List[PromptGenome]:
+    """The population following ``generation``, with duplicate offspring re-mutated if configured"""
+    evolver.seed_generation(generation + 1)
+    next_population = evolver.evolve_population(population, _fitness_index(evaluations))
+    if deduplicator is not None and config.get("dedup_mode") == "replace":
+        deduplicator.diversify(next_population, evolver.mutate)
+    return next_population
+
+def _insert_genomes(db: Session, run_id: int, genomes: List[PromptGenome], generation: int):
+    """Bulk insert the genomes that have no id yet, plus their lineage rows
+
+    Assigned ids are written back onto the genomes.
+    """
+    new_genomes = [g for g in genomes if g.id is None]
+    if not new_genomes:
+        return
+    ingest.insert_prompts(db, new_genomes, run_id=run_id)
+
+    # Extend each parent's ancestry, fetched in one query for the generation
+    parent_ids = {g.parent_id for g in new_genomes if g.parent_id is not None}
+    ancestry = {}
+    if parent_ids:
+        rows = db.execute(
+            select(DBLineage.prompt_id, DBLineage.ancestor_ids).where(DBLineage.prompt_id.in_(parent_ids))
+        )
+        ancestry = {prompt_id: ancestors or [] for prompt_id, ancestors in rows}
+
+    db.execute(insert(DBLineage), [
+        {
+            "prompt_id": g.id,
+            "ancestor_ids": ancestry.get(g.parent_id, []) + [g.parent_id] if g.parent_id is not None else [],
+            "generation": generation,
+            "run_id": run_id
+        }
+        for g in new_genomes
+    ])
+
+def start_run(db: Session, base_prompt: str, config: Dict[str, Any]) -> DBEvolutionRun:
+    """Seed an initial population from ``base_prompt`` and persist it as a new run"""
+    evolver = make_evolver(config)
+    evolver.seed_generation(0)
+    return create_run(db, base_prompt, evolver.initialize_population(base_prompt), config)
+
+def create_run(db: Session, base_prompt: str, population: List[PromptGenome],
+               config: Optional[Dict[str, Any]] = None) -> DBEvolutionRun:
+    """Persist a new run and its initial population in one transaction"""
+    try:
+        run = DBEvolutionRun(base_prompt=base_prompt, status="running", next_generation=0, config=config or {})
+        db.add(run)
+        db.flush()
+        _insert_genomes(db, run.id, population, generation=0)
+        run.population_ids = [g.id for g in population]
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return run
+
+def record_generation(db: Session, run: DBEvolutionRun, evaluations: List[PromptEvaluation],
+                      next_population: List[PromptGenome], owner: Optional[str] = None):
+    """Persist a rated generation and the population that follows it
+
+    Evaluations (and their rating summaries), offspring, lineage and the
+    run's progress are committed together, so a crash never leaves a
+    half-written generation behind. With an ``owner``, its lease on the run
+    is renewed, and ``RunLeasedError`` is raised if it has lost it.
+    """
+    generation = run.next_generation
+    try:
+        if owner is not None:
+            # Also locks the run row until commit, so no one else records this generation
+            held = db.execute(
+                update(DBEvolutionRun)
+                .where(DBEvolutionRun.id == run.id, DBEvolutionRun.lease_owner == owner,
+                       DBEvolutionRun.next_generation == generation)
+                .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=settings.RUN_LEASE_TIMEOUT))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not held:
+                raise RunLeasedError(f"Run {run.id} was claimed by another worker")
+        if evaluations:
+            new_ratings = ratings.new_run_ratings(db, evaluations)
+            db.execute(insert(DBEvaluation), [
+                {
+                    "prompt_id": e.prompt_id,
+                    "output_content": e.output_content,
+                    "rating": e.rating,
+                    "user_id": e.user_id,
+                    "run_id": run.id,
+                    "generation": generation,
+                    "error": e.error,
+                    "fitness": e.fitness,
+                    "reused": e.reused
+                }
+                for e in evaluations
+            ])
+            ratings.update_summaries(db, new_ratings)
+        _insert_genomes(db, run.id, next_population, generation=generation + 1)
+        run.population_ids = [g.id for g in next_population]
+        run.next_generation = generation + 1
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+def _to_genome(p: DBPrompt) -> PromptGenome:
+    return PromptGenome(
+        id=p.id,
+        content=p.content,
+        template_vars=p.template_vars or {},
+        metadata=p.metadata_json or {},
+        creator_id=p.creator_id,
+        parent_id=p.parent_id,
+        created_at=p.created_at,
+        complexity_score=p.complexity_score
+    )
+
+def load_population(db: Session, run: DBEvolutionRun) -> List[PromptGenome]:
+    """Load the run's current population in its stored order"""
+    ids = run.population_ids or []
+    prompts = {p.id: p for p in db.scalars(select(DBPrompt).where(DBPrompt.id.in_(ids)))}
+    return [_to_genome(prompts[prompt_id]) for prompt_id in ids]
+
+def load_generation(db: Session, run_id: int, generation: int) -> Dict[str, Any]:
+    """Load the prompts and evaluations recorded for one generation of a run"""
+    rows = db.execute(
+        select(DBEvaluation, DBPrompt)
+        .join(DBPrompt, DBEvaluation.prompt_id == DBPrompt.id)
+        .where(DBEvaluation.run_id == run_id, DBEvaluation.generation == generation)
+        .order_by(DBEvaluation.id)
+    ).all()
+    return {
+        "generation": generation,
+        "population": [_to_genome(p).model_dump() for _, p in rows],
+        "evaluations": [PromptEvaluation.model_validate(e).model_dump() for e, _ in rows]
+    }
+
+def run_summary(run: DBEvolutionRun) -> EvolutionRun:
+    return EvolutionRun.model_validate(run)
+
+def _begin_generations(db: Session, run: DBEvolutionRun, owner: str) -> List[PromptGenome]:
+    if not claim_run(db, run.id, owner):
+        db.refresh(run)
+        raise RunLeasedError(f"Run {run.id} is already being evolved by {run.lease_owner}")
+    # Another worker may have advanced the run before the lease was taken
+    db.refresh(run)
+    population = load_population(db, run)
+    run.status = "running"
+    db.commit()
+    return population
+
+def _fail_generations(db: Session, run: DBEvolutionRun, owner: str, release: bool, error: Exception):
+    db.rollback()
+    if run.lease_owner != owner:
+        # The run was lost to another worker, so its status is not ours to set
+        return
+    run.status = "failed"
+    run.error = str(error)
+    if release:
+        run.lease_owner = run.lease_expires_at = None
+    db.commit()
+
+def _end_generations(db: Session, run: DBEvolutionRun, owner: str, release: bool, target: int):
+    if run.lease_owner != owner:
+        return
+    if run.status == "running":
+        # A consumer that stops iterating early leaves the run paused, to be resumed
+        run.status = "completed" if run.next_generation >= target else "paused"
+    if release:
+        run.lease_owner = run.lease_expires_at = None
+    db.commit()
+
+def _generation_result(run: DBEvolutionRun, generation: int, population: List[PromptGenome],
+                       evaluations: List[PromptEvaluation]) -> Dict[str, Any]:
+    return {
+        "run_id": run.id,
+        "generation": generation,
+        "population": [p.model_dump() for p in population],
+        "evaluations": [e.model_dump() for e in evaluations]
+    }
+
+def run_generations(db: Session, run: DBEvolutionRun, generations: int, llm: LLMInterface,
+                    rate: RatingFunction, evolver: Optional[PromptEvolver] = None,
+                    owner: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Evaluate, rate and evolve ``generations`` generations of a run
+
+    Yields each generation's results after it has been committed. Only the
+    current generation is held in memory. The evolver defaults to one built
+    from the run's config, which is closed when the generations end. The
+    run is marked completed once all ``generations`` are recorded, or
+    paused if the caller stops iterating before then.
+
+    The run is leased while it is evolved, and ``RunLeasedError`` is raised
+    if another worker holds it. A caller passing its own lease ``owner``
+    releases the lease itself.
+    """
+    release = owner is None
+    owner = owner or new_lease_owner()
+    population = _begin_generations(db, run, owner)
+    target = run.next_generation + generations
+    close_evolver = evolver is None
+
+    try:
+        evolver, deduplicator = restore_state(db, run, evolver)
+        for _ in range(generations):
+            generation = run.next_generation
+            # Near-duplicates reuse an earlier evaluation instead of a request
+            fresh, duplicates = _split(deduplicator, population)
+            evaluations = llm.evaluate_prompt_batch(fresh)
+            rate(fresh, evaluations)
+            evaluations = _merge(deduplicator, population, evaluations, duplicates)
+            _score_generation(db, evaluations)
+
+            next_population = _breed(evolver, deduplicator, run.config or {}, generation,
+                                     population, evaluations)
+            record_generation(db, run, evaluations, next_population, owner)
+            if checkpoints.due(generation):
+                checkpoint_run(db, run, evolver, deduplicator)
+
+            yield _generation_result(run, generation, population, evaluations)
+            population = next_population
+    except Exception as e:
+        _fail_generations(db, run, owner, release, e)
+        raise
+    finally:
+        if close_evolver and evolver is not None:
+            evolver.close()
+        _end_generations(db, run, owner, release, target)
+
+async def arun_generations(db: AsyncSession, run: DBEvolutionRun, generations: int, llm: LLMInterface,
+                           rate: RatingFunction, evolver: Optional[PromptEvolver] = None,
+                           owner: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """``run_generations`` for async callers
+
+    Database work goes through the async session, LLM requests are awaited
+    on the interface's own loop, and near-duplicate filtering, rating and
+    breeding run in worker threads, so the caller's event loop is never
+    blocked.
+    """
+    release = owner is None
+    owner = owner or new_lease_owner()
+    population = await db.run_sync(_begin_generations, run, owner)
+    target = run.next_generation + generations
+    close_evolver = evolver is None
+
+    try:
+        evolver, deduplicator = await db.run_sync(restore_state, run, evolver)
+        for _ in range(generations):
+            generation = run.next_generation
+            fresh, duplicates = await asyncio.to_thread(_split, deduplicator, population)
+            evaluations = await llm.arun_coroutine(llm.aevaluate_prompt_batch(fresh))
+            await asyncio.to_thread(rate, fresh, evaluations)
+            evaluations = await asyncio.to_thread(_merge, deduplicator, population, evaluations, duplicates)
+            await db.run_sync(_score_generation, evaluations)
+
+            next_population = await asyncio.to_thread(_breed, evolver, deduplicator, run.config or {},
+                                                      generation, population, evaluations)
+            await db.run_sync(record_generation, run, evaluations, next_population, owner)
+            if checkpoints.due(generation):
+                data = await asyncio.to_thread(checkpoints.encode, evolver, deduplicator,
+                                               run.next_generation, run.population_ids or [])
+                await db.run_sync(checkpoints.save_checkpoint, run.id, run.next_generation, data)
+
+            yield _generation_result(run, generation, population, evaluations)
+            population = next_population
+    except Exception as e:
+        await db.run_sync(_fail_generations, run, owner, release, e)
+        raise
+    finally:
+        if close_evolver and evolver is not None:
+            evolver.close()
+        await db.run_sync(_end_generations, run, owner, release, target)
+
+def replay_run(db: Session, run: DBEvolutionRun) -> Iterator[Dict[str, Any]]:
+    """Re-derive a run from its seed and recorded ratings
+    
+    Rebuilds the initial population and every following generation with a
+    fresh evolver, feeding it the evaluations stored for each generation,
+    and yields whether each regenerated population matches the recorded
+    one. Stops at the first mismatch.
+    """
+    evolver = make_evolver(run.config or {})
+    evolver.seed_generation(0)
+    population = evolver.initialize_population(run.base_prompt)
+    config = dict(run.config or {})
+    deduplicator = Deduplicator(config.get("dedup_threshold")) if config.get("dedup_mode", "off") != "off" else None
+    
+    try:
+        for generation in range(run.next_generation + 1):
+            if generation < run.next_generation:
+                recorded = load_generation(db, run.id, generation)
+                recorded_population = [PromptGenome(**p) for p in recorded["population"]]
+            else:
+                # The last population has not been evaluated yet
+                recorded = None
+                recorded_population = load_population(db, run)
+            
+            matches = [p.content for p in population] == [p.content for p in recorded_population]
+            yield {"generation": generation, "matches": matches, "size": len(recorded_population)}
+            if not matches or recorded is None:
+                return
+            
+            # Continue from the recorded genomes so ids line up with the ratings
+            evaluations = [PromptEvaluation(**e) for e in recorded["evaluations"]]
+            if deduplicator is not None:
+                deduplicator.absorb(recorded_population, evaluations)
+            population = _breed(evolver, deduplicator, config, generation, recorded_population, evaluations)
+    finally:
+        evolver.close()
@@ -0,0 +1,87 @@
+"""
+Parent selection operators for LLM-Picbreeder
+
+Every selector takes a fitness array (one entry per individual, higher is
+better), the number of parents to draw and a NumPy ``Generator``, and
+returns an array of indices into the population. All parents for a
+generation are drawn in a single vectorized call.
+"""
+from functools import partial
+from typing import Callable, Dict
+import numpy as np
+
+Selector = Callable[[np.ndarray, int, np.random.Generator], np.ndarray]
+
+def truncation_selection(fitness: np.ndarray, n: int, rng: np.random.Generator,
+                         fraction: float = 0.5) -> np.ndarray:
+    """Draw uniformly from the top ``fraction`` of the population"""
+    keep = max(1, int(len(fitness) * fraction))
+    top = np.argsort(-fitness, kind="stable")[:keep]
+    return rng.choice(top, size=n)
+
+def tournament_selection(fitness: np.ndarray, n: int, rng: np.random.Generator,
+                         tournament_size: int = 3) -> np.ndarray:
+    """Each parent is the fittest of ``tournament_size`` random contestants"""
+    contestants = rng.integers(0, len(fitness), size=(n, tournament_size))
+    winners = np.argmax(fitness[contestants], axis=1)
+    return contestants[np.arange(n), winners]
+
+def _proportional_probabilities(fitness: np.ndarray) -> np.ndarray:
+    # Shift so the weakest individual gets zero weight rather than negative
+    weights = fitness - min(0.0, fitness.min())
+    total = weights.sum()
+    if total <= 0:
+        return np.full(len(fitness), 1.0 / len(fitness))
+    return weights / total
+
+def roulette_selection(fitness: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    """Fitness-proportional selection"""
+    return rng.choice(len(fitness), size=n, p=_proportional_probabilities(fitness))
+
+def _rank_probabilities(fitness: np.ndarray, pressure: float) -> np.ndarray:
+    size = len(fitness)
+    if size == 1:
+        return np.ones(1)
+    ranks = np.empty(size)
+    ranks[np.argsort(fitness, kind="stable")] = np.arange(size)  # 0 is the worst
+    return (2 - pressure) / size + 2 * ranks * (pressure - 1) / (size * (size - 1))
+
+def rank_selection(fitness: np.ndarray, n: int, rng: np.random.Generator,
+                   pressure: float = 1.5) -> np.ndarray:
+    """Linear ranking: probability depends on rank, not on the fitness scale
+
+    ``pressure`` ranges from 1 (uniform) to 2 (the worst is never picked).
+    """
+    return rng.choice(len(fitness), size=n, p=_rank_probabilities(fitness, pressure))
+
+def sus_selection(fitness: np.ndarray, n: int, rng: np.random.Generator) -> np.ndarray:
+    """Stochastic universal sampling: n evenly spaced pointers on one wheel spin
+
+    Gives every individual a number of copies within one of its expected
+    count, then shuffles them so consecutive parents are not correlated.
+    """
+    cumulative = np.cumsum(_proportional_probabilities(fitness))
+    cumulative[-1] = 1.0
+    pointers = rng.uniform(0, 1.0 / n) + np.arange(n) / n
+    return rng.permutation(np.searchsorted(cumulative, pointers, side="right"))
+
+SELECTORS: Dict[str, Callable[..., np.ndarray]] = {
+    "truncation": truncation_selection,
+    "tournament": tournament_selection,
+    "roulette": roulette_selection,
+    "rank": rank_selection,
+    "sus": sus_selection
+}
+
+def make_selector(method: str, tournament_size: int = 3, truncation_fraction: float = 0.5,
+                  rank_pressure: float = 1.5) -> Selector:
+    """Look up a selector by name and bind its parameters"""
+    if method not in SELECTORS:
+        raise ValueError(f"Unknown selection method {method!r}; expected one of {sorted(SELECTORS)}")
+    if method == "truncation":
+        return partial(truncation_selection, fraction=truncation_fraction)
+    if method == "tournament":
+        return partial(tournament_selection, tournament_size=tournament_size)
+    if method == "rank":
+        return partial(rank_selection, pressure=rank_pressure)
+    return SELECTORS[method]
@@ -0,0 +1,144 @@
+"""
+Steady-state evolution for LLM-Picbreeder
+
+Generational evolution waits for a whole population to be evaluated before
+breeding, so every generation lasts as long as its slowest LLM call. In
+steady-state mode there are no generations: a fixed number of evaluations
+is kept in flight, and as soon as one completes its prompt is rated,
+competes for a place in the population, and a replacement child is bred
+from the current population and sent off in its place.
+
+Which evaluations finish first depends on provider latency, so unlike
+generational runs a steady-state run is not reproducible from its seed.
+"""
+import asyncio
+import itertools
+from collections import Counter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from .config import settings
+from .evolver import PromptEvolver
+from .llm_interface import LLMInterface
+from .models import PromptEvaluation, PromptGenome
+from .population import Population
+
+RatingFunction = Callable[[List[PromptGenome], List[PromptEvaluation]], None]
+ResultCallback = Callable[[PromptGenome, PromptEvaluation], None]
+
+class SteadyStateEvolver:
+    """Breeds one child per completed evaluation, keeping ``in_flight`` evaluations running
+
+    The population holds up to ``evolver.population_size`` rated prompts.
+    Once it is full, a child replaces the worst member if it rates at least
+    as well, so the best prompt found is never lost. Parents are drawn with
+    the evolver's selection method and bred with its operators. As in a
+    batch, a prompt identical to a member or to one in flight reuses its
+    output rather than making another request; outputs of prompts that
+    left the population are dropped, so memory stays bounded. Failed
+    evaluations use up the budget but never join the population.
+    """
+
+    def __init__(self, evolver: PromptEvolver, llm: LLMInterface, rate: RatingFunction,
+                 in_flight: Optional[int] = None, ids: Optional[Iterator[int]] = None):
+        self.evolver = evolver
+        self.llm = llm
+        self.rate = rate
+        self.in_flight = in_flight or settings.STEADY_STATE_IN_FLIGHT
+        # Ratings are keyed on prompt ids, so every prompt needs one
+        self.ids = ids if ids is not None else itertools.count(1)
+        self.members: List[PromptGenome] = []
+        self.evaluations: List[PromptEvaluation] = []
+        self.fitness = np.zeros(0)
+        self.completed = 0
+        self._responses: Dict[str, asyncio.Future] = {}
+        self._waiting: Counter = Counter()  # Evaluations in flight per prompt content
+
+    def ranked(self) -> List[Tuple[PromptGenome, PromptEvaluation]]:
+        """The population with its evaluations, best first"""
+        order = np.argsort(-self.fitness, kind="stable")
+        return [(self.members[i], self.evaluations[i]) for i in order.tolist()]
+
+    def breed(self) -> PromptGenome:
+        """One child of parents selected from the current population"""
+        population = Population.from_genomes(self.members)
+        child = self.evolver.breed_offspring(population, self.fitness, 1).to_genomes()[0]
+        child.id = next(self.ids)
+        return child
+
+    def insert(self, genome: PromptGenome, evaluation: PromptEvaluation) -> bool:
+        """Offer a rated prompt a place in the population; returns whether it got one"""
+        if evaluation.error:
+            return False
+        if len(self.members) < self.evolver.population_size:
+            self.members.append(genome)
+            self.evaluations.append(evaluation)
+            self.fitness = np.append(self.fitness, evaluation.rating)
+            return True
+        worst = int(np.argmin(self.fitness))
+        if evaluation.rating < self.fitness[worst]:
+            return False
+        replaced = self.members[worst]
+        self.members[worst] = genome
+        self.evaluations[worst] = evaluation
+        self.fitness[worst] = evaluation.rating
+        self._release(replaced.content)
+        return True
+
+    def _release(self, content: str):
+        """Forget a prompt's output once no member or evaluation in flight has that prompt"""
+        if self._waiting[content] or any(m.content == content for m in self.members):
+            return
+        self._responses.pop(content, None)
+
+    async def _evaluate(self, genome: PromptGenome) -> Tuple[PromptGenome, PromptEvaluation]:
+        response = self._responses.get(genome.content)
+        if response is None:
+            response = self._responses[genome.content] = asyncio.ensure_future(
+                self.llm.arun_coroutine(self.llm.aevaluate_prompt_batch([genome], 1))
+            )
+        self._waiting[genome.content] += 1
+        try:
+            evaluation = (await response)[0]
+        finally:
+            self._waiting[genome.content] -= 1
+            if not self._waiting[genome.content]:
+                del self._waiting[genome.content]
+        if evaluation.error:
+            # Failures are not reused, so a later identical prompt is tried again
+            self._responses.pop(genome.content, None)
+        return genome, evaluation.model_copy(update={"prompt_id": genome.id})
+
+    async def run(self, base_prompt: str, budget: int,
+                  on_result: Optional[ResultCallback] = None) -> List[Tuple[PromptGenome, PromptEvaluation]]:
+        """Evolve from ``base_prompt`` until ``budget`` evaluations have completed
+
+        The initial population is evaluated first; breeding starts with the
+        first rated prompt. ``on_result`` is called with every rated prompt
+        in completion order. Returns the final population, best first.
+        """
+        seeds = self.evolver.initialize_population(base_prompt)
+        for genome in seeds:
+            genome.id = next(self.ids)
+        seeds.reverse()
+
+        pending = set()
+        started = 0
+        while True:
+            while len(pending) < self.in_flight and started < budget and (seeds or self.members):
+                genome = seeds.pop() if seeds else self.breed()
+                pending.add(asyncio.ensure_future(self._evaluate(genome)))
+                started += 1
+            if not pending:
+                break
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                genome, evaluation = task.result()
+                self.rate([genome], [evaluation])
+                if not self.insert(genome, evaluation):
+                    self._release(genome.content)
+                self.completed += 1
+                if on_result is not None:
+                    on_result(genome, evaluation)
+
+        return self.ranked()
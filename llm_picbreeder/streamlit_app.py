@@ -2,7 +2,7 @@
 Streamlit app for LLM-Picbreeder
 """
 import streamlit as st
-import random
+import itertools
 import time
 from typing import List
 import sys
@@ -11,7 +11,7 @@ import os
 # Add the parent directory to the path so we can import our modules
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from llm_picbreeder import evolver, llm_interface, models
+from llm_picbreeder import evolver, fitness, llm_interface, models
 
 # Initialize session state
 if 'population' not in st.session_state:
@@ -24,6 +24,10 @@ if 'evolver' not in st.session_state:
     st.session_state.evolver = evolver.PromptEvolver()
 if 'llm_interface' not in st.session_state:
     st.session_state.llm_interface = llm_interface.LLMInterface()
+if 'rate_outputs' not in st.session_state:
+    st.session_state.rate_outputs = fitness.make_fitness_function()
+if 'next_id' not in st.session_state:
+    st.session_state.next_id = itertools.count(1)
 
 st.title("LLM-Picbreeder: Collaborative Prompt Evolution")
 st.markdown("""
@@ -47,11 +51,13 @@ generations = st.sidebar.slider("Generations", 1, 10, 3)
 population_size = st.sidebar.slider("Population Size", 3, 15, 5)
 mutation_rate = st.sidebar.slider("Mutation Rate", 0.0, 1.0, 0.1)
 crossover_rate = st.sidebar.slider("Crossover Rate", 0.0, 1.0, 0.7)
+selection_method = st.sidebar.selectbox("Selection", ["truncation", "tournament", "roulette", "rank", "sus"])
 
 # Update evolver parameters
 st.session_state.evolver.mutation_rate = mutation_rate
 st.session_state.evolver.crossover_rate = crossover_rate
 st.session_state.evolver.population_size = population_size
+st.session_state.evolver.selection_method = selection_method
 
 # Initialize evolution
 if st.sidebar.button("Initialize Evolution"):
@@ -63,14 +69,18 @@ if st.sidebar.button("Initialize Evolution"):
 # Run generation
 if st.sidebar.button("Run Next Generation") and st.session_state.population:
     with st.spinner("Generating responses..."):
+        # Nothing is stored here, so number new prompts locally
+        for prompt in st.session_state.population:
+            if prompt.id is None:
+                prompt.id = next(st.session_state.next_id)
+        
         # Generate responses for current population
         st.session_state.evaluations = st.session_state.llm_interface.evaluate_prompt_batch(
             st.session_state.population
         )
         
-        # For demo, assign random ratings
-        for eval in st.session_state.evaluations:
-            eval.rating = random.uniform(1.0, 5.0)
+        # Rate the outputs automatically
+        st.session_state.rate_outputs(st.session_state.population, st.session_state.evaluations)
         
         st.session_state.generation += 1
         st.sidebar.success(f"Generation {st.session_state.generation} complete!")
@@ -121,7 +131,7 @@ st.header("How It Works")
 st.markdown("""
 1. **Initialization**: Start with a base prompt and create variations
 2. **Evaluation**: Generate responses from an LLM for each prompt
-3. **Selection**: Users rate the quality of responses (simulated here)
+3. **Selection**: Responses are rated (automatically here, by offline fitness evaluators)
 4. **Evolution**: Create new prompts by combining and mutating high-rated prompts
 5. **Iteration**: Repeat the process to evolve better prompts over time
 
@@ -0,0 +1,129 @@
+"""
+Tests for the async API endpoints
+"""
+import sys
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from llm_picbreeder import database, main, ratings
+
+class TestAsyncEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{self.tmp.name}/api.db"
+        self.engine = create_engine(url)
+        database.Base.metadata.create_all(bind=self.engine)
+
+        # Each TestClient request may run on a new event loop, so don't pool connections
+        self.async_engine = create_async_engine(database.async_database_url(url), poolclass=NullPool)
+        session_factory = async_sessionmaker(self.async_engine, expire_on_commit=False)
+
+        async def get_async_db():
+            async with session_factory() as db:
+                yield db
+
+        main.app.dependency_overrides[database.get_async_db] = get_async_db
+        self.rating_writer = patch.object(main, "rating_writer", ratings.RatingWriter(sessionmaker(bind=self.engine)))
+        self.rating_writer.start()
+        self.client = TestClient(main.app)
+
+    def tearDown(self):
+        main.rating_writer.stop(timeout=5.0)
+        self.rating_writer.stop()
+        main.app.dependency_overrides.clear()
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def test_prompt_crud_and_lineage(self):
+        root = self.client.post("/prompts/", json={"content": "Write a poem"}).json()
+        child = self.client.post("/prompts/", json={"content": "Write a haiku", "parent_id": root["id"]}).json()
+
+        page = self.client.get("/prompts/", params={"limit": 1, "fields": "id,content"}).json()
+        self.assertEqual(page["items"], [{"id": root["id"], "content": "Write a poem"}])
+        page = self.client.get("/prompts/", params={"cursor": page["next_cursor"]}).json()
+        self.assertEqual([p["id"] for p in page["items"]], [child["id"]])
+        self.assertIsNone(page["next_cursor"])
+
+        ancestors = self.client.get(f"/prompts/{child['id']}/ancestors", params={"fields": "id"}).json()
+        self.assertEqual(ancestors, [{"id": root["id"], "depth": 1}])
+        self.assertEqual(self.client.get(f"/prompts/{root['id']}/lineage").json()["subtree_size"], 2)
+        self.assertEqual(self.client.get("/prompts/999/descendants").status_code, 404)
+        self.assertEqual(self.client.get("/prompts/", params={"fields": "secret"}).status_code, 400)
+
+    def test_bulk_ingestion(self):
+        root = self.client.post("/prompts/", json={"content": "Write a poem"}).json()
+        prompts = [{"content": f"Prompt {i}", "parent_id": root["id"]} for i in range(12)]
+
+        with patch.object(main.settings, "INGEST_BATCH_SIZE", 5):
+            result = self.client.post("/prompts/bulk", json=prompts).json()
+            self.assertEqual(result["count"], 12)
+            self.assertEqual(result["ids"], list(range(root["id"] + 1, root["id"] + 13)))
+
+            ndjson = "\n".join(json.dumps(p) for p in prompts[:3]) + "\n\n"
+            response = self.client.post("/prompts/bulk", content=ndjson,
+                                        headers={"content-type": "application/x-ndjson"})
+            self.assertEqual(response.json()["count"], 3)
+
+            # The first batch is stored; the bad record stops the upload
+            bad = prompts[:7] + [{"parent_id": 1}]
+            response = self.client.post("/prompts/bulk", json=bad)
+            self.assertEqual(response.status_code, 422)
+            self.assertEqual(response.json()["detail"]["stored"], 5)
+            self.assertEqual(response.json()["detail"]["errors"][0]["index"], 7)
+
+        stats = self.client.get(f"/prompts/{root['id']}/lineage").json()
+        self.assertEqual(stats["subtree_size"], 1 + 12 + 3 + 5)
+        self.assertEqual(self.client.post("/prompts/bulk", json={"content": "x"}).status_code, 400)
+
+    def test_ratings(self):
+        prompt = self.client.post("/prompts/", json={"content": "Write a poem"}).json()
+        result = self.client.post("/ratings/", json={"prompt_id": prompt["id"], "rating": 4.0, "user_id": None}).json()
+        self.assertEqual(result["count"], 1)
+        result = self.client.post("/ratings/", json=[{"prompt_id": prompt["id"], "rating": 2.0}] * 3).json()
+        self.assertEqual(result["count"], 3)
+
+        summary = self.client.get(f"/prompts/{prompt['id']}/rating").json()
+        self.assertEqual(summary["count"], 4)
+        self.assertAlmostEqual(summary["mean"], 2.5)
+        self.assertAlmostEqual(summary["variance"], 0.75)
+        self.assertAlmostEqual(summary["bayesian_mean"], (5 * 3.0 + 10.0) / 9)
+
+        self.assertEqual(self.client.post("/ratings/", json={"prompt_id": 999, "rating": 3.0}).status_code, 404)
+        self.assertEqual(self.client.post("/ratings/", json={"prompt_id": prompt["id"], "rating": 9}).status_code, 422)
+        self.assertEqual(self.client.get("/prompts/999/rating").status_code, 404)
+
+    def test_evolve_and_read_run(self):
+        run = self.client.post("/evolve/", params={"base_prompt": "Summarize a paper", "generations": 2,
+                                                   "seed": 7}).json()
+        self.assertEqual(run["status"], "completed")
+        self.assertEqual(run["next_generation"], 2)
+
+        generation = self.client.get(f"/runs/{run['id']}/generations/1").json()
+        self.assertEqual(len(generation["evaluations"]), len(run["population_ids"]))
+        self.assertTrue(self.client.get(f"/runs/{run['id']}/replay").json()["reproducible"])
+
+        self.assertEqual(self.client.get(f"/runs/{run['id']}/checkpoint").status_code, 404)
+        checkpoint = self.client.post(f"/runs/{run['id']}/checkpoint").json()
+        self.assertEqual(checkpoint["generation"], 2)
+        self.assertGreater(checkpoint["size"], 0)
+        self.assertEqual(self.client.get(f"/runs/{run['id']}/checkpoint").json()["generation"], 2)
+
+        resumed = self.client.post(f"/runs/{run['id']}/resume", params={"generations": 1}).json()
+        self.assertEqual(resumed["next_generation"], 3)
+        self.assertTrue(self.client.get(f"/runs/{run['id']}/replay").json()["reproducible"])
+        self.assertEqual(self.client.get("/runs/999").status_code, 404)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Tests for run checkpoints
+"""
+import sys
+import os
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from llm_picbreeder import checkpoints, database, dedup, evolver, llm_interface, models, novelty, runs
+from llm_picbreeder.config import settings
+
+def rate_by_length(population, evaluations):
+    for evaluation in evaluations:
+        evaluation.rating = float(len(evaluation.output_content) % 5) + 1.0
+
+class TestCheckpoints(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        database.Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.llm = llm_interface.LLMInterface()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_round_trip(self):
+        prompt_evolver = evolver.PromptEvolver(seed=5)
+        prompt_evolver.novelty_archive = novelty.NoveltyArchive(exact_limit=50)
+        texts = [prompt_evolver.mutate(f"Describe item {i} of the ocean") for i in range(200)]
+        prompt_evolver.novelty_archive.add(texts)
+        deduplicator = dedup.Deduplicator()
+        population = prompt_evolver.initialize_population("Write a poem", 20)
+        for i, genome in enumerate(population):
+            deduplicator.add(genome.content, models.PromptEvaluation(prompt_id=i, output_content=f"Ode {i}",
+                                                                     rating=2.5, user_id=i % 2 or None))
+
+        data = checkpoints.encode(prompt_evolver, deduplicator, 3, [7, 8])
+        checkpoint = checkpoints.Checkpoint(data)
+        self.assertEqual((checkpoint.generation, checkpoint.population_ids), (3, [7, 8]))
+
+        restored, restored_dedup = evolver.PromptEvolver(seed=99), dedup.Deduplicator()
+        checkpoint.restore(restored, restored_dedup)
+
+        # The same draws come next from both random streams
+        self.assertEqual(restored.rng.random(), prompt_evolver.rng.random())
+        self.assertEqual(restored.np_rng.random(), prompt_evolver.np_rng.random())
+
+        original, copy = deduplicator.snapshot(), restored_dedup.snapshot()
+        self.assertEqual(copy[0], original[0])
+        np.testing.assert_array_equal(copy[1], original[1])
+        self.assertEqual([e.model_dump() for e in copy[2]], [e.model_dump() for e in original[2]])
+
+        # The restored index answers queries exactly as the original does
+        queries = [prompt_evolver.mutate("Describe the ocean") for _ in range(10)]
+        np.testing.assert_array_equal(restored.novelty_archive.knn_distances(queries, 5),
+                                      prompt_evolver.novelty_archive.knn_distances(queries, 5))
+
+    def test_resume_from_checkpoint_matches_rebuild(self):
+        prompt_evolver = evolver.PromptEvolver()
+        prompt_evolver.population_size = 6
+        prompt_evolver.novelty_weight = 0.5
+        config = dict(runs.evolver_config(prompt_evolver, seed=21), dedup_mode="replace")
+        run = runs.start_run(self.db, "Write a poem", config)
+        with patch.object(settings, "CHECKPOINT_INTERVAL", 2):
+            list(runs.run_generations(self.db, run, 3, self.llm, rate_by_length))
+
+        row = self.db.get(database.DBRunCheckpoint, run.id)
+        self.assertEqual(row.generation, 2)
+
+        # A checkpoint plus the generation after it gives the state a full rebuild does
+        loaded = []
+        load_generation = runs.load_generation
+        with patch.object(runs, "load_generation", lambda db, run_id, g: loaded.append(g) or load_generation(db, run_id, g)):
+            resumed, resumed_dedup = runs.restore_state(self.db, run)
+        self.assertEqual(loaded, [2])
+        rebuilt = runs.make_evolver(run.config)
+        runs.restore_novelty_archive(self.db, run, rebuilt)
+        rebuilt_dedup = runs.make_deduplicator(self.db, run)
+        self.assertEqual(resumed_dedup.snapshot()[0], rebuilt_dedup.snapshot()[0])
+        np.testing.assert_array_equal(resumed.novelty_archive.snapshot()["vectors"],
+                                      rebuilt.novelty_archive.snapshot()["vectors"])
+
+        with patch.object(settings, "CHECKPOINT_INTERVAL", 2):
+            list(runs.run_generations(self.db, run, 2, self.llm, rate_by_length))
+        self.assertEqual(self.db.get(database.DBRunCheckpoint, run.id).generation, 4)
+        self.assertTrue(all(g["matches"] for g in runs.replay_run(self.db, run)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Tests for the database engine factory
+"""
+import sys
+import os
+import asyncio
+import tempfile
+import unittest
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.pool import StaticPool
+
+from llm_picbreeder import database
+
+class TestEngineFactory(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.url = f"sqlite:///{self.tmp.name}/test.db"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sqlite_file_uses_wal_and_busy_timeout(self):
+        engine = database.create_db_engine(self.url)
+        try:
+            with engine.connect() as connection:
+                self.assertEqual(connection.execute(text("PRAGMA journal_mode")).scalar(), "wal")
+                self.assertEqual(connection.execute(text("PRAGMA busy_timeout")).scalar(),
+                                 int(database.settings.SQLITE_BUSY_TIMEOUT * 1000))
+            self.assertEqual(engine.pool.size(), database.settings.DB_POOL_SIZE)
+        finally:
+            engine.dispose()
+
+    def test_sqlite_memory_shares_one_connection(self):
+        engine = database.create_db_engine("sqlite://")
+        self.assertIsInstance(engine.pool, StaticPool)
+
+    def test_server_options_and_async_urls(self):
+        options = database._engine_options("postgresql://user:secret@db/picbreeder")
+        self.assertTrue(options["pool_pre_ping"])
+        self.assertEqual(options["pool_recycle"], database.settings.DB_POOL_RECYCLE)
+        self.assertNotIn("connect_args", options)
+
+        self.assertEqual(database.async_database_url("postgresql://user:secret@db/picbreeder"),
+                         "postgresql+asyncpg://user:secret@db/picbreeder")
+        self.assertEqual(database.async_database_url(self.url), self.url.replace("sqlite", "sqlite+aiosqlite"))
+        with self.assertRaises(ValueError):
+            database.async_database_url("mssql://db/picbreeder")
+
+    def test_async_engine_sees_sync_writes(self):
+        engine = database.create_db_engine(self.url)
+        database.Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(database.DBPrompt.__table__.insert(), [{"content": "Write a poem"}])
+        engine.dispose()
+
+        async def read():
+            async_engine = database.create_async_db_engine(self.url)
+            try:
+                async with async_engine.connect() as connection:
+                    return (await connection.execute(select(database.DBPrompt.content))).scalars().all()
+            finally:
+                await async_engine.dispose()
+
+        self.assertEqual(asyncio.run(read()), ["Write a poem"])
+
+class TestSchemaUpgrade(unittest.TestCase):
+    def test_existing_tables_get_new_columns_and_indexes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = database.create_db_engine(f"sqlite:///{tmp}/old.db")
+            try:
+                # The tables as the first release created them
+                with engine.begin() as connection:
+                    connection.execute(text(
+                        "CREATE TABLE prompts (id INTEGER PRIMARY KEY, content TEXT NOT NULL, template_vars JSON, "
+                        "metadata_json JSON, creator_id INTEGER, parent_id INTEGER, created_at DATETIME, "
+                        "complexity_score FLOAT)"
+                    ))
+                    connection.execute(text(
+                        "CREATE TABLE evaluations (id INTEGER PRIMARY KEY, prompt_id INTEGER NOT NULL, "
+                        "output_content TEXT NOT NULL, rating FLOAT NOT NULL, user_id INTEGER, created_at DATETIME)"
+                    ))
+                    connection.execute(text("INSERT INTO prompts (content) VALUES ('Write a poem')"))
+
+                changes = database.upgrade_schema(engine)
+                self.assertIn("added column prompts.run_id", changes)
+                self.assertIn("added column evaluations.error", changes)
+                self.assertIn("created index ix_prompts_created_at_id", changes)
+                self.assertEqual(database.upgrade_schema(engine), [])
+
+                columns = {c["name"] for c in inspect(engine).get_columns("evaluations")}
+                self.assertTrue({"run_id", "generation", "error"} <= columns)
+                with engine.connect() as connection:
+                    plan = connection.execute(text(
+                        "EXPLAIN QUERY PLAN SELECT id FROM prompts WHERE created_at > '2024-01-01' ORDER BY created_at, id"
+                    )).all()
+                    self.assertIn("ix_prompts_created_at_id", str(plan))
+                    self.assertEqual(connection.execute(select(database.DBPrompt.run_id)).scalar(), None)
+            finally:
+                engine.dispose()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests for near-duplicate prompt detection
+"""
+import sys
+import os
+import unittest
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from llm_picbreeder.dedup import Deduplicator, MinHasher, canonicalize
+from llm_picbreeder.models import PromptEvaluation, PromptGenome
+
+BASE = "Write a short story about a lighthouse keeper who finds a message in a bottle."
+
+def evaluation(prompt_id, rating):
+    return PromptEvaluation(prompt_id=prompt_id, output_content=f"output {prompt_id}", rating=rating)
+
+class TestDeduplicator(unittest.TestCase):
+    def test_canonical_forms_share_a_signature(self):
+        self.assertEqual(canonicalize("  Write\ta  POEM\n"), "write a poem")
+        hasher = MinHasher()
+        self.assertTrue((hasher.signature(canonicalize(BASE)) ==
+                         hasher.signature(canonicalize(BASE.upper()))).all())
+
+    def test_split_finds_population_and_archive_duplicates(self):
+        deduplicator = Deduplicator(threshold=0.8)
+        deduplicator.add("Summarize the paper in three bullet points.", evaluation(100, 4.0))
+        population = [
+            PromptGenome(id=1, content=BASE),
+            PromptGenome(id=2, content=BASE.replace("short", "shrt")),
+            PromptGenome(id=3, content="summarize  the paper in three bullet points."),
+            PromptGenome(id=4, content="Explain quantum tunnelling to a ten year old.")
+        ]
+
+        fresh, duplicates = deduplicator.split(population)
+        self.assertEqual([g.id for g in fresh], [1, 4])
+        self.assertEqual(duplicates[1], 0)
+        self.assertEqual(duplicates[2].prompt_id, 100)
+
+        evaluations = deduplicator.merge(population, [evaluation(1, 2.0), evaluation(4, 5.0)], duplicates)
+        self.assertEqual([e.prompt_id for e in evaluations], [1, 2, 3, 4])
+        self.assertEqual([e.rating for e in evaluations], [2.0, 2.0, 4.0, 5.0])
+        self.assertEqual(deduplicator.reused, 2)
+        self.assertEqual(len(deduplicator), 3)
+
+    def test_errored_evaluations_are_not_reused(self):
+        deduplicator = Deduplicator()
+        deduplicator.add(BASE, PromptEvaluation(prompt_id=1, output_content="", rating=0.0, error="timeout"))
+        fresh, duplicates = deduplicator.split([PromptGenome(content=BASE)])
+        self.assertEqual((len(fresh), duplicates), (1, {}))
+
+    def test_diversify_remutates_new_duplicates(self):
+        deduplicator = Deduplicator()
+        population = [PromptGenome(id=1, content=BASE), PromptGenome(content=BASE), PromptGenome(content=BASE)]
+        suffixes = iter(" Make it rhyme. | Use a twist ending. ".split("|"))
+
+        deduplicator.diversify(population, lambda content: content + next(suffixes))
+        contents = [g.content for g in population]
+        self.assertEqual(len(set(contents)), 3)
+        self.assertEqual(contents[0], BASE)
+        self.assertTrue(population[1].metadata["deduplicated"])
+
+if __name__ == "__main__":
+    unittest.main()
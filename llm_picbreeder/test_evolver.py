@@ -4,11 +4,12 @@ Tests for LLM-Picbreeder
 import sys
 import os
 import unittest
+import numpy as np
 
 # Add the parent directory to the path so we can import our modules
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from llm_picbreeder import evolver, models
+from llm_picbreeder import aggregates, evolver, models, novelty, population, selection
 
 class TestPromptEvolver(unittest.TestCase):
     def setUp(self):
@@ -64,5 +65,145 @@ class TestPromptEvolver(unittest.TestCase):
         
         self.assertEqual(len(new_population), self.evolver.population_size)
 
+    def test_rank_population_uses_rating_aggregates(self):
+        """Ranking averages each prompt's ratings and ignores failed evaluations"""
+        population = [models.PromptGenome(id=i, content=f"Prompt {i}") for i in (1, 2, 3)]
+        index = aggregates.RatingIndex.from_evaluations([
+            models.PromptEvaluation(prompt_id=1, output_content="a", rating=2.0),
+            models.PromptEvaluation(prompt_id=1, output_content="b", rating=4.0),
+            models.PromptEvaluation(prompt_id=2, output_content="c", rating=5.0),
+            models.PromptEvaluation(prompt_id=3, output_content="", rating=0.0, error="timeout")
+        ])
+        
+        ranked = self.evolver.rank_population(population, index)
+        
+        self.assertEqual([(p.id, r) for p, r in ranked], [(2, 5.0), (1, 3.0), (3, 0.0)])
+        self.assertEqual(index.get(1).variance, 1.0)
+        self.assertNotIn(3, index)
+
+    def test_evolve_population_with_each_selector(self):
+        """Every selection method fills the next generation"""
+        population = [models.PromptGenome(id=i, content=f"Prompt {i}\nLine two") for i in range(10)]
+        evaluations = [models.PromptEvaluation(prompt_id=i, output_content="", rating=float(i % 5))
+                       for i in range(10)]
+        
+        for method in selection.SELECTORS:
+            self.evolver.selection_method = method
+            new_population = self.evolver.evolve_population(population, evaluations)
+            self.assertEqual(len(new_population), self.evolver.population_size)
+            self.assertIn(new_population[0].id, (4, 9))
+
+class TestParallelBreeding(unittest.TestCase):
+    def setUp(self):
+        self.arrays = evolver.PromptEvolver().initialize_arrays("Write a story\nAbout a cat", size=60)
+        self.arrays.fitness[:] = np.arange(60)
+    
+    def evolve(self, workers):
+        prompt_evolver = evolver.PromptEvolver()
+        prompt_evolver.population_size = 60
+        prompt_evolver.mutation_rate = 0.5
+        prompt_evolver.breeding_workers = workers
+        prompt_evolver.breeding_chunk_size = 8
+        
+        prompt_evolver.np_rng = np.random.default_rng(42)
+        try:
+            next_generation = prompt_evolver.evolve_arrays(self.arrays)
+        finally:
+            prompt_evolver.close()
+        return [next_generation.content_of(row) for row in range(len(next_generation))]
+    
+    def test_offspring_independent_of_worker_count(self):
+        """A seeded generation is identical whether bred in-process or in a pool"""
+        self.assertEqual(self.evolve(1), self.evolve(2))
+
+class TestPopulation(unittest.TestCase):
+    def test_round_trip_preserves_imported_genomes(self):
+        """Unchanged rows come back as the same genome objects"""
+        genomes = [models.PromptGenome(id=7, content="Same"), models.PromptGenome(content="Same", parent_id=7)]
+        arrays = population.Population.from_genomes(genomes)
+        arrays.append("Child", "crossover", parent_id=7, parent2_id=8, generation=1)
+        
+        self.assertEqual(len(arrays.pool), 2)  # identical texts are interned once
+        self.assertEqual(arrays.parent_ids.tolist(), [-1, 7, 7])
+        
+        round_trip = arrays.take([2, 0]).to_genomes()
+        self.assertIs(round_trip[1], genomes[0])
+        self.assertEqual(round_trip[0].content, "Child")
+        self.assertEqual(round_trip[0].metadata, {"source": "crossover", "parent1_id": 7, "parent2_id": 8})
+    
+    def test_evolve_arrays(self):
+        prompt_evolver = evolver.PromptEvolver()
+        arrays = prompt_evolver.initialize_arrays("Write a story", size=20)
+        arrays.fitness[:] = np.arange(20)
+        
+        next_generation = prompt_evolver.evolve_arrays(arrays)
+        
+        self.assertEqual(len(next_generation), prompt_evolver.population_size)
+        self.assertEqual(next_generation.content_of(0), arrays.content_of(19))
+        self.assertEqual(next_generation.generation.tolist().count(1), prompt_evolver.population_size - 3)
+
+class TestNovelty(unittest.TestCase):
+    def setUp(self):
+        self.texts = [f"Write a story about {animal} in the {place}"
+                      for animal in ("a cat", "a dog", "an owl", "a fox")
+                      for place in ("city", "forest", "desert")]
+
+    def test_index_matches_exhaustive_search(self):
+        """Probing every cell of the index gives the exact neighbours"""
+        exact = novelty.NoveltyArchive()
+        indexed = novelty.NoveltyArchive(exact_limit=4, probes=100)
+        for archive in (exact, indexed):
+            archive.add(self.texts[:6])
+            archive.add(self.texts[6:])
+        self.assertEqual(len(indexed._cells), 6)
+
+        vectors = exact.embedder.embed(self.texts)
+        expected = np.sort(np.clip(1.0 - vectors @ vectors.T, 0.0, 1.0), axis=1)[:, :3]
+        np.testing.assert_allclose(exact.knn_distances(self.texts, 3), expected, atol=1e-5)
+        np.testing.assert_allclose(indexed.knn_distances(self.texts, 3), expected, atol=1e-5)
+
+    def test_unrelated_prompt_is_most_novel(self):
+        archive = novelty.NoveltyArchive()
+        archive.add(self.texts)
+        scores = archive.novelty(["Write a story about a cat in the city", "Translate this invoice into German"], k=3)
+        self.assertLess(scores[0], scores[1])
+        self.assertEqual(scores[1], 1.0)
+
+    def test_novelty_weight_changes_elites(self):
+        prompt_evolver = evolver.PromptEvolver(seed=1)
+        prompt_evolver.population_size = 5
+        prompt_evolver.novelty_weight = 1.0
+        prompt_evolver.novelty_k = 2
+        genomes = [models.PromptGenome(id=i + 1, content=text) for i, text in enumerate(self.texts[:4])]
+        genomes.append(models.PromptGenome(id=5, content="Translate this invoice into German"))
+        evaluations = [models.PromptEvaluation(prompt_id=g.id, output_content="", rating=5.0 - i)
+                       for i, g in enumerate(genomes)]
+
+        offspring = prompt_evolver.evolve_population(genomes, evaluations)
+        self.assertEqual(offspring[0].id, 5)
+        self.assertEqual(len(prompt_evolver.novelty_archive), 5)
+
+class TestSelection(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.fitness = np.array([1.0, 2.0, 3.0, 4.0])
+    
+    def test_selectors_favour_fitter_individuals(self):
+        for method in selection.SELECTORS:
+            parents = selection.make_selector(method)(self.fitness, 4000, self.rng)
+            counts = np.bincount(parents, minlength=4)
+            self.assertEqual(len(parents), 4000)
+            self.assertGreater(counts[3], counts[0], method)
+    
+    def test_sus_matches_expected_counts(self):
+        """SUS gives every individual within one of its expected number of copies"""
+        parents = selection.sus_selection(self.fitness, 10, self.rng)
+        expected = 10 * self.fitness / self.fitness.sum()
+        self.assertTrue(np.all(np.abs(np.bincount(parents, minlength=4) - expected) < 1))
+    
+    def test_tournament_of_whole_population_picks_best(self):
+        parents = selection.tournament_selection(self.fitness, 50, self.rng, tournament_size=50)
+        self.assertTrue(np.all(parents == 3))
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
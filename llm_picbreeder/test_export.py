@@ -0,0 +1,75 @@
+"""
+Tests for the streaming archive export
+"""
+import sys
+import os
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from llm_picbreeder import database, export, ingest
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        database.Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        ingest.ingest_batch(self.db, [{"content": f"Prompt {i}", "metadata": {"i": i}} for i in range(25)])
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_incremental_ndjson(self):
+        watermark, stream = export.export_table(self.db, "prompts", "ndjson", chunk_size=10)
+        rows = [json.loads(line) for line in b"".join(stream).splitlines()]
+        self.assertEqual(watermark, 25)
+        self.assertEqual([r["id"] for r in rows], list(range(1, 26)))
+        self.assertEqual(rows[3]["metadata_json"], {"i": 3})
+
+        ingest.ingest_batch(self.db, [{"content": "Late arrival"}])
+        watermark, stream = export.export_table(self.db, "prompts", "ndjson", since=watermark)
+        rows = [json.loads(line) for line in b"".join(stream).splitlines()]
+        self.assertEqual((watermark, [r["content"] for r in rows]), (26, ["Late arrival"]))
+
+    def test_refuses_what_it_cannot_export_before_reading(self):
+        # Only SQLite commits ids in order, so only it can resume from a watermark
+        with patch.object(export, "supports_incremental", return_value=False):
+            with self.assertRaises(ValueError):
+                export.export_table(self.db, "prompts", "ndjson", since=10)
+            watermark, _ = export.export_table(self.db, "prompts", "ndjson")
+            self.assertEqual(watermark, 25)
+
+        with patch.dict(sys.modules, {"pyarrow": None}):
+            with self.assertRaises(RuntimeError):
+                export.export_table(self.db, "prompts", "parquet")
+
+    @unittest.skipIf(pa is None, "pyarrow is not installed")
+    def test_columnar_formats_are_written_per_chunk(self):
+        _, stream = export.export_table(self.db, "prompts", "parquet", since=5, chunk_size=10)
+        parquet = pq.ParquetFile(io.BytesIO(b"".join(stream)))
+        self.assertEqual(parquet.metadata.num_row_groups, 2)
+        table = parquet.read()
+        self.assertEqual(table.column("id").to_pylist(), list(range(6, 26)))
+        self.assertEqual(json.loads(table.column("metadata_json")[0].as_py()), {"i": 5})
+
+        _, stream = export.export_table(self.db, "lineages", "arrow")
+        self.assertEqual(pa.ipc.open_stream(b"".join(stream)).read_all().num_rows, 0)
+
+        with self.assertRaises(ValueError):
+            export.export_table(self.db, "users")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Tests for automated fitness evaluation
+"""
+import sys
+import os
+import re
+import unittest
+import numpy as np
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from llm_picbreeder import fitness, models
+
+try:
+    import jsonschema
+except ImportError:
+    jsonschema = None
+
+LIST_ANSWER = "Here are some ideas:\n- Walk the dog.\n- Read a book.\n- Cook a new recipe."
+
+class TestEvaluators(unittest.TestCase):
+    def score(self, evaluator, prompts, outputs):
+        return evaluator(fitness.Features(prompts, outputs))
+
+    def test_constraints_follow_the_prompt(self):
+        prompts = [
+            "Suggest hobbies.\n\nLimit your response to 5 words.",
+            "Suggest hobbies.\n\nLimit your response to 100 words.",
+            "Suggest hobbies.\n\nStructure your response as a list.",
+            "Suggest hobbies.\n\nStructure your response as a list.",
+            "Suggest hobbies.\n\nInclude at least 3 examples.",
+            "Suggest hobbies.\n\nAvoid jargon and acronyms.",
+            "Suggest hobbies."
+        ]
+        outputs = [LIST_ANSWER, LIST_ANSWER, LIST_ANSWER, "Walk the dog or read a book.",
+                   "For example, chess.", "Try DIY and RC cars.", ""]
+        scores = self.score(fitness.constraint_score, prompts, outputs)
+        np.testing.assert_allclose(scores, [5 / 14, 1.0, 1.0, 0.0, 1 / 3, 1 / 3, 1.0])
+
+    def test_readability_and_diversity(self):
+        simple = "The cat sat on the mat. It was warm. The sun was out."
+        dense = ("Notwithstanding considerable methodological heterogeneity, multivariate "
+                 "epidemiological investigations consistently demonstrate associations.")
+        readability = self.score(fitness.readability_score, ["", "", ""], [simple, dense, ""])
+        self.assertGreater(readability[0], readability[1])
+        self.assertEqual(readability[2], 0.0)
+
+        diversity = self.score(fitness.lexical_diversity_score, ["", ""], ["one two three four", "echo echo echo echo"])
+        np.testing.assert_allclose(diversity, [1.0, 0.25])
+
+    def test_regex_check(self):
+        check = fitness.RegexCheck(r"^\s*- ", flags=re.MULTILINE)
+        np.testing.assert_array_equal(self.score(check, ["", ""], [LIST_ANSWER, "No list"]), [1.0, 0.0])
+
+    @unittest.skipIf(jsonschema is None, "jsonschema is not installed")
+    def test_json_schema_check(self):
+        check = fitness.JSONSchemaCheck('{"type": "object", "required": ["title"]}')
+        outputs = ['{"title": "Hi"}', 'Sure!\n```json\n{"title": "Hi"}\n```', '{"name": "Hi"}', "Not JSON"]
+        np.testing.assert_array_equal(self.score(check, [""] * 4, outputs), [1.0, 1.0, 0.5, 0.0])
+
+class TestFitnessFunction(unittest.TestCase):
+    def test_rates_a_generation(self):
+        rate = fitness.make_fitness_function("constraints:3,lexical_diversity", regex="", json_schema="")
+        population = [models.PromptGenome(id=i, content="Suggest hobbies.\n\nStructure your response as a list.")
+                      for i in (1, 2, 3)]
+        evaluations = [
+            models.PromptEvaluation(prompt_id=1, output_content=LIST_ANSWER, rating=0.0),
+            models.PromptEvaluation(prompt_id=2, output_content="dog dog dog dog", rating=0.0),
+            models.PromptEvaluation(prompt_id=3, output_content="", rating=0.0, error="timeout")
+        ]
+        rate(population, evaluations)
+
+        self.assertGreater(evaluations[0].rating, evaluations[1].rating)
+        self.assertAlmostEqual(evaluations[1].rating, 1.0 + 4.0 * 0.25 / 4)
+        self.assertEqual(evaluations[2].rating, 0.0)
+
+    def test_unknown_evaluator(self):
+        with self.assertRaises(ValueError):
+            fitness.make_fitness_function("constraints,sentiment")
+
+if __name__ == "__main__":
+    unittest.main()
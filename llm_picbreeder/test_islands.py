@@ -0,0 +1,101 @@
+"""
+Tests for island-model evolution in LLM-Picbreeder
+"""
+import sys
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from llm_picbreeder import evolver, islands, models
+
+class DyingTransport(islands.QueueTransport):
+    """Kills island 1 when it first sends migrants, before it reports a result"""
+
+    def send(self, generation, source, target, migrants):
+        if source == 1:
+            os._exit(1)
+        super().send(generation, source, target, migrants)
+
+class FailingTransport:
+    def send(self, generation, source, target, migrants):
+        pass
+
+    def receive(self, generation, target, sources, timeout=None):
+        raise TimeoutError("no migrants")
+
+class TestTopology(unittest.TestCase):
+    def test_neighbours(self):
+        self.assertEqual(islands.neighbours("ring", 3), [[1], [2], [0]])
+        self.assertEqual(islands.neighbours("star", 3), [[1, 2], [0], [0]])
+        self.assertEqual(islands.neighbours("complete", 3), [[1, 2], [0, 2], [0, 1]])
+        self.assertEqual(islands.neighbours("ring", 1), [[]])
+        with self.assertRaises(ValueError):
+            islands.neighbours("mesh", 3)
+
+    def test_migrants_replace_the_worst(self):
+        population = [models.PromptGenome(id=i, content=f"Prompt {i}") for i in range(4)]
+        evaluations = [
+            models.PromptEvaluation(prompt_id=i, output_content="", rating=rating, error=error)
+            for i, (rating, error) in enumerate([(3.0, None), (5.0, None), (0.0, "timeout"), (2.0, None)])
+        ]
+        emigrants = islands._emigrants(population, evaluations, 3)
+        self.assertEqual([m["prompt_id"] for m in emigrants], [1, 0, 3])
+
+        islands._immigrate(population, evaluations, {1: emigrants[:2]})
+        self.assertEqual([p.id for p in population], [0, 1, 1, 0])
+        self.assertEqual(population[2].metadata, {"source": "migration", "island": 1})
+        self.assertEqual([e.rating for e in evaluations], [3.0, 5.0, 5.0, 3.0])
+
+class TestIslandRuns(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_transports_agree_and_seeded_runs_reproduce(self):
+        options = dict(islands=2, seed=7, population_size=3, interval=1, size=1)
+        by_queue = islands.run_islands("Describe the ocean", 3, **options)
+        transport = islands.DatabaseTransport("test", f"sqlite:///{self.tmp.name}/islands.db", poll_interval=0.05)
+        by_database = islands.run_islands("Describe the ocean", 3, transport=transport, **options)
+
+        self.assertEqual(by_queue, by_database)
+        for result in by_queue:
+            self.assertEqual(result["migrants_received"], 2)
+            self.assertEqual(len(result["population"]), 3)
+
+    def test_islands_split_the_llm_budgets(self):
+        with patch.object(islands, "LLMInterface", wraps=islands.LLMInterface) as interface:
+            islands.run_island(1, 4, "Describe the ocean", 1, transport=None, population_size=2)
+        interface.assert_called_once_with(shares=4)
+
+    def test_lost_island_stops_the_run(self):
+        """Survivors waiting for a dead island's migrants are terminated, not waited for"""
+        started = time.monotonic()
+        with self.assertRaises(RuntimeError):
+            islands.run_islands("Describe the ocean", 3, islands=2, transport=DyingTransport(2),
+                                population_size=2, interval=1, size=1)
+        self.assertLess(time.monotonic() - started, 60)
+
+    def test_failed_island_closes_its_evolver(self):
+        with patch.object(evolver.PromptEvolver, "close", autospec=True) as close:
+            with self.assertRaises(TimeoutError):
+                islands.run_island(0, 2, "Describe the ocean", 3, FailingTransport(), population_size=2,
+                                   interval=1, size=1)
+        close.assert_called_once()
+
+    def test_receive_times_out(self):
+        transport = islands.DatabaseTransport("test", f"sqlite:///{self.tmp.name}/islands.db", poll_interval=0.01)
+        transport.create_table()
+        transport.send(0, 1, 0, [])
+        self.assertEqual(transport.receive(0, 0, [1], timeout=0), {1: []})
+        with self.assertRaises(TimeoutError):
+            transport.receive(0, 0, [1, 2], timeout=0.05)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,237 @@
+"""
+Tests for the LLM interface of LLM-Picbreeder
+"""
+import sys
+import os
+import asyncio
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from llm_picbreeder import cache, llm_interface, models, rate_limiter
+from llm_picbreeder.config import settings
+
+class FakeAsyncClient:
+    """Stands in for AsyncOpenAI, answering after an injected latency"""
+
+    def __init__(self, latency=0.05, latencies=None):
+        self.latency = latency
+        self.latencies = latencies or {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, max_tokens, temperature):
+        prompt = messages[-1]["content"]
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latencies.get(prompt, self.latency))
+        finally:
+            self.in_flight -= 1
+        message = SimpleNamespace(content=f"Answer to {prompt}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+class RateLimitedError(Exception):
+    status_code = 429
+
+class FilteringAsyncClient(FakeAsyncClient):
+    """Answers prompts mentioning "forbidden" without content, as content filters do"""
+
+    async def create(self, **kwargs):
+        response = await super().create(**kwargs)
+        if "forbidden" in kwargs["messages"][-1]["content"]:
+            response.choices[0].message.content = None
+            response.choices[0].finish_reason = "content_filter"
+        return response
+
+class BadRequestError(Exception):
+    status_code = 400
+
+class RejectingAsyncClient(FakeAsyncClient):
+    """Rejects every request with a 400"""
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        raise BadRequestError("invalid prompt")
+
+class FlakyAsyncClient(FakeAsyncClient):
+    """Fails the first ``failures`` calls with a 429"""
+
+    def __init__(self, failures):
+        super().__init__(latency=0.0)
+        self.failures = failures
+
+    async def create(self, **kwargs):
+        if self.failures > 0:
+            self.failures -= 1
+            self.calls += 1
+            raise RateLimitedError("rate limited")
+        return await super().create(**kwargs)
+
+class TestBatchEvaluation(unittest.TestCase):
+    def make_population(self, size):
+        return [models.PromptGenome(id=i, content=f"Prompt {i}") for i in range(size)]
+
+    def test_results_in_population_order(self):
+        """Evaluations line up with the population even when latencies differ"""
+        client = FakeAsyncClient(latencies={"Prompt 0": 0.1, "Prompt 1": 0.0})
+        interface = llm_interface.LLMInterface(async_client=client)
+
+        evaluations = interface.evaluate_prompt_batch(self.make_population(4))
+
+        self.assertEqual([e.prompt_id for e in evaluations], [0, 1, 2, 3])
+        self.assertEqual(evaluations[0].output_content, "Answer to Prompt 0")
+
+    def test_bounded_concurrency(self):
+        """No more than max_concurrency requests run at once, and they do overlap"""
+        client = FakeAsyncClient(latency=0.05)
+        interface = llm_interface.LLMInterface(async_client=client)
+
+        start = time.perf_counter()
+        interface.evaluate_prompt_batch(self.make_population(12), max_concurrency=4)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(client.max_in_flight, 4)
+        self.assertLess(elapsed, 12 * 0.05)
+
+    def test_responses_without_content_flag_only_their_evaluation(self):
+        interface = llm_interface.LLMInterface(async_client=FilteringAsyncClient(latency=0.0),
+                                               cache=cache.ResponseCache(16))
+        prompts = [models.PromptGenome(id=1, content="Hi"), models.PromptGenome(id=2, content="A forbidden topic")]
+
+        evaluations = interface.evaluate_prompt_batch(prompts)
+
+        self.assertIsNone(evaluations[0].error)
+        self.assertIn("content_filter", evaluations[1].error)
+        # Only the answered prompt was cached
+        interface.evaluate_prompt_batch(prompts)
+        self.assertEqual(interface.async_client.calls, 3)
+
+    def test_request_timeout(self):
+        """A slow request times out without failing the rest of the batch"""
+        client = FakeAsyncClient(latency=0.0, latencies={"Prompt 1": 1.0})
+        interface = llm_interface.LLMInterface(async_client=client)
+        interface.scheduler.request_timeout = 0.1
+        interface.scheduler.max_retries = 0
+
+        evaluations = interface.evaluate_prompt_batch(self.make_population(3))
+
+        self.assertTrue(evaluations[1].output_content.startswith("Error generating response"))
+        self.assertIsNotNone(evaluations[1].error)
+        self.assertIsNone(evaluations[2].error)
+        self.assertEqual(evaluations[2].output_content, "Answer to Prompt 2")
+
+class TestRequestScheduler(unittest.TestCase):
+    def make_interface(self, client):
+        interface = llm_interface.LLMInterface(async_client=client, cache=cache.ResponseCache(0))
+        interface.scheduler.backoff_base = 0.001
+        return interface
+
+    def test_shares_split_the_budgets(self):
+        """Interfaces sharing one key divide its quota and concurrency between them"""
+        with patch.multiple(settings, RATE_LIMIT_RPM=3500, RATE_LIMIT_TPM=90000, MAX_CONCURRENT_REQUESTS=8):
+            scheduler = llm_interface.LLMInterface(async_client=FakeAsyncClient(), shares=4).scheduler
+            self.assertEqual((scheduler.request_bucket.per_minute, scheduler.token_bucket.per_minute),
+                             (875, 22500))
+            self.assertEqual(scheduler.limiter.maximum, 2)
+            self.assertEqual(llm_interface.LLMInterface(shares=16).max_concurrency, 1)
+
+    def test_retries_throttled_requests(self):
+        """429s are retried instead of becoming rated outputs"""
+        interface = self.make_interface(FlakyAsyncClient(failures=2))
+
+        evaluation = interface.evaluate_prompt_batch([models.PromptGenome(id=1, content="Hi")])[0]
+
+        self.assertIsNone(evaluation.error)
+        self.assertEqual(evaluation.output_content, "Answer to Hi")
+        self.assertEqual(interface.scheduler.stats()["throttled"], 2)
+
+    def test_exhausted_retries_flag_the_evaluation(self):
+        interface = self.make_interface(FlakyAsyncClient(failures=10))
+        interface.scheduler.max_retries = 2
+
+        evaluation = interface.evaluate_prompt_batch([models.PromptGenome(id=1, content="Hi")])[0]
+
+        self.assertIn("rate limited", evaluation.error)
+        self.assertEqual(interface.async_client.calls, 3)
+
+    def test_rejected_requests_keep_window_and_tokens(self):
+        """Client errors are not overload: the window holds and reserved tokens come back"""
+        with patch.object(settings, "RATE_LIMIT_TPM", 100000):
+            interface = self.make_interface(RejectingAsyncClient())
+        scheduler = interface.scheduler
+        window = scheduler.limiter.window
+
+        evaluations = interface.evaluate_prompt_batch(
+            [models.PromptGenome(id=i, content=f"Prompt {i}") for i in range(10)]
+        )
+
+        self.assertTrue(all("invalid prompt" in e.error for e in evaluations))
+        self.assertEqual(interface.async_client.calls, 10)
+        self.assertEqual(scheduler.limiter.window, window)
+        self.assertAlmostEqual(scheduler.token_bucket.tokens, scheduler.token_bucket.capacity)
+
+    def test_window_shrinks_on_errors_and_grows_on_success(self):
+        limiter = rate_limiter.AdaptiveConcurrencyLimiter(initial=8, minimum=1, maximum=16)
+
+        async def exercise():
+            await limiter.acquire()
+            await limiter.release(None, ok=False)
+            shrunk = limiter.window
+            for _ in range(40):
+                await limiter.acquire()
+                await limiter.release(0.1, ok=True)
+            return shrunk, limiter.window
+
+        shrunk, grown = asyncio.run(exercise())
+        self.assertEqual(shrunk, 4)
+        self.assertGreater(grown, shrunk)
+
+    def test_token_bucket_waits_for_refill(self):
+        bucket = rate_limiter.TokenBucket(per_minute=600)  # 10 per second
+
+        async def drain():
+            await bucket.acquire(600)
+            start = time.perf_counter()
+            await bucket.acquire(1)
+            return time.perf_counter() - start
+
+        self.assertGreater(asyncio.run(drain()), 0.05)
+
+class TestResponseCache(unittest.TestCase):
+    def test_repeated_prompts_hit_cache(self):
+        """Elites and unmutated children are not sent to the LLM again"""
+        client = FakeAsyncClient(latency=0.0)
+        interface = llm_interface.LLMInterface(async_client=client, cache=cache.ResponseCache(16))
+        population = [models.PromptGenome(id=i, content=f"Prompt {i % 2}") for i in range(4)]
+
+        interface.evaluate_prompt_batch(population)
+        evaluations = interface.evaluate_prompt_batch(population)
+
+        self.assertEqual(client.calls, 2)
+        self.assertEqual(evaluations[3].output_content, "Answer to Prompt 1")
+        self.assertEqual(interface.cache.stats()["hits"], 2)
+
+    def test_lru_eviction_and_disk_tier(self):
+        """Evicted entries are still served from the SQLite tier"""
+        with tempfile.TemporaryDirectory() as tmp:
+            response_cache = cache.ResponseCache(max_entries=1, path=os.path.join(tmp, "cache.db"))
+            response_cache.set("a", "first")
+            response_cache.set("b", "second")
+
+            self.assertEqual(response_cache.stats()["size"], 1)
+            self.assertEqual(response_cache.get("a"), "first")
+            self.assertEqual(response_cache.disk_hits, 1)
+            self.assertIsNone(response_cache.get("c"))
+            self.assertEqual(response_cache.misses, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+Tests for the API's read queries
+"""
+import sys
+import os
+import unittest
+from datetime import datetime
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from llm_picbreeder import database, lineage, queries
+
+class TestListPrompts(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        database.Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.db.add(database.DBUser(id=1, username="alice"))
+        # Several prompts share a timestamp, so the id must break ties
+        for i in range(25):
+            self.db.add(database.DBPrompt(
+                content=f"Prompt {i}",
+                creator_id=1 if i % 2 else None,
+                parent_id=1 if i % 5 == 0 and i else None,
+                created_at=datetime(2024, 1, 1 + i // 4),
+                complexity_score=i / 10
+            ))
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def all_pages(self, limit, **filters):
+        pages, cursor = [], None
+        while True:
+            items, cursor = queries.list_prompts(self.db, limit, cursor, **filters)
+            pages.append(items)
+            if cursor is None:
+                return pages
+
+    def test_cursor_walks_every_row_once(self):
+        pages = self.all_pages(7)
+        self.assertEqual([len(p) for p in pages], [7, 7, 7, 4])
+        ids = [item["id"] for page in pages for item in page]
+        self.assertEqual(ids, list(range(1, 26)))
+
+    def test_projection_and_filters(self):
+        items, cursor = queries.list_prompts(self.db, 100, fields=["id", "complexity_score"], creator_id=1)
+        self.assertIsNone(cursor)
+        self.assertEqual(len(items), 12)
+        self.assertEqual(set(items[0]), {"id", "complexity_score"})
+
+        children = [i["id"] for page in self.all_pages(2, parent_id=1) for i in page]
+        self.assertEqual(children, [6, 11, 16, 21])
+
+    def test_invalid_input(self):
+        with self.assertRaises(ValueError):
+            queries.list_prompts(self.db, fields=["password"])
+        with self.assertRaises(ValueError):
+            queries.list_prompts(self.db, cursor="not-a-cursor")
+
+class TestLineageQueries(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        database.Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        # 1 -> 2 -> 3 -> 4 and 1 -> 5 -> 6; 7 is unrelated
+        parents = {1: None, 2: 1, 3: 2, 4: 3, 5: 1, 6: 5, 7: None}
+        for prompt_id, parent_id in parents.items():
+            self.db.add(database.DBPrompt(id=prompt_id, content=f"Prompt {prompt_id}", parent_id=parent_id))
+        self.db.flush()
+        # Index the first batch separately so the second reads stored ancestries
+        lineage.index_prompts(self.db, [(1, None), (2, 1), (3, 2)])
+        lineage.index_prompts(self.db, [(4, 3), (5, 1), (6, 5), (7, None)])
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_ancestors_and_descendants(self):
+        ancestors = queries.ancestors(self.db, 4, fields=["id"])
+        self.assertEqual(ancestors, [{"id": 3, "depth": 1}, {"id": 2, "depth": 2}, {"id": 1, "depth": 3}])
+
+        descendants = [(d["id"], d["depth"]) for d in queries.descendants(self.db, 1, fields=["id"])]
+        self.assertEqual(descendants, [(2, 1), (5, 1), (3, 2), (6, 2), (4, 3)])
+        self.assertEqual(len(queries.descendants(self.db, 1, max_depth=1)), 2)
+        self.assertEqual(queries.ancestors(self.db, 7), [])
+
+    def test_stats_and_rebuild(self):
+        self.assertEqual(queries.lineage_stats(self.db, 2),
+                         {"prompt_id": 2, "depth": 1, "subtree_size": 3, "subtree_height": 2})
+        self.assertIsNone(queries.lineage_stats(self.db, 99))
+
+        before = self.db.execute(select(database.DBPromptClosure.ancestor_id, database.DBPromptClosure.descendant_id,
+                                        database.DBPromptClosure.depth)).all()
+        self.assertEqual(lineage.rebuild_index(self.db, batch_size=2), 7)
+        after = self.db.execute(select(database.DBPromptClosure.ancestor_id, database.DBPromptClosure.descendant_id,
+                                       database.DBPromptClosure.depth)).all()
+        self.assertEqual(sorted(before), sorted(after))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""
+Tests for rating ingestion and summaries
+"""
+import sys
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import sessionmaker
+
+from llm_picbreeder import database, ingest, models, ratings
+
+class TestRatings(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = database.create_db_engine(f"sqlite:///{self.tmp.name}/ratings.db")
+        database.Base.metadata.create_all(bind=self.engine)
+        self.session_factory = sessionmaker(bind=self.engine)
+        with self.session_factory() as db:
+            self.prompt_ids = ingest.ingest_batch(db, [{"content": f"Prompt {i}"} for i in range(5)])
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def test_summaries_merge_batches_exactly(self):
+        rng = np.random.default_rng(0)
+        values = {pid: rng.uniform(1.0, 5.0, size=20) for pid in self.prompt_ids[:2]}
+        with self.session_factory() as db:
+            for chunk in np.split(np.arange(20), [3, 11]):
+                ratings.store_ratings(db, [
+                    models.RatingIn(prompt_id=pid, rating=float(v)) for pid in values for v in values[pid][chunk]
+                ])
+                db.commit()
+
+            for pid, expected in values.items():
+                summary = ratings.get_summary(db, pid)
+                self.assertEqual(summary["count"], 20)
+                self.assertAlmostEqual(summary["mean"], expected.mean())
+                self.assertAlmostEqual(summary["variance"], expected.var())
+                self.assertAlmostEqual(summary["bayesian_mean"], (5 * 3.0 + expected.sum()) / 25)
+            self.assertIsNone(ratings.get_summary(db, self.prompt_ids[4]))
+
+            # Rebuilding from the evaluations gives the same summaries
+            before = ratings.load_index(db)
+            self.assertEqual(ratings.rebuild_summaries(db), 2)
+            after = ratings.load_index(db)
+            for pid in values:
+                self.assertAlmostEqual(before.get(pid).m2, after.get(pid).m2)
+                self.assertAlmostEqual(before.score(pid), after.score(pid))
+
+    def test_writer_batches_concurrent_submissions(self):
+        writer = ratings.RatingWriter(self.session_factory, batch_size=50)
+        submissions = [[models.RatingIn(prompt_id=self.prompt_ids[i % 5], rating=1.0 + i % 5)]
+                       for i in range(200)]
+        try:
+            with ThreadPoolExecutor(8) as pool:
+                results = list(pool.map(lambda s: writer.submit(s).result(timeout=10), submissions))
+            with self.assertRaises(ratings.UnknownPromptError):
+                writer.submit([models.RatingIn(prompt_id=self.prompt_ids[0], rating=5.0),
+                               models.RatingIn(prompt_id=999, rating=5.0)]).result(timeout=10)
+        finally:
+            writer.stop(timeout=10)
+
+        self.assertEqual(len({i for ids in results for i in ids}), 200)
+        with self.session_factory() as db:
+            self.assertEqual(db.scalar(select(func.count()).select_from(database.DBEvaluation)), 200)
+            index = ratings.load_index(db, prior_weight=0)
+            self.assertEqual([index.get(pid).count for pid in self.prompt_ids], [40] * 5)
+            self.assertEqual([index.score(pid) for pid in self.prompt_ids], [1.0, 2.0, 3.0, 4.0, 5.0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,364 @@
+"""
+Tests for persistent evolution runs
+"""
+import sys
+import os
+import asyncio
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from llm_picbreeder import database, dedup, evolver, jobs, llm_interface, models, queries, ratings, runs
+from llm_picbreeder.config import settings
+
+def rate_by_length(population, evaluations):
+    for evaluation in evaluations:
+        evaluation.rating = float(len(evaluation.output_content) % 5) + 1.0
+
+class TestEvolutionRuns(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        database.Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+        self.evolver = evolver.PromptEvolver()
+        self.evolver.population_size = 6
+        self.llm = llm_interface.LLMInterface()
+
+    def tearDown(self):
+        self.db.close()
+
+    def count(self, model, *where):
+        return self.db.scalar(select(func.count()).select_from(model).where(*where))
+
+    def start_run(self, generations):
+        population = self.evolver.initialize_population("Write a poem")
+        run = runs.create_run(self.db, "Write a poem", population, runs.evolver_config(self.evolver))
+        results = list(runs.run_generations(self.db, run, generations, self.llm, rate_by_length, self.evolver))
+        return run, results
+
+    def test_generations_are_persisted(self):
+        """Every generation's evaluations, offspring and lineage are written"""
+        run, results = self.start_run(3)
+
+        self.assertEqual([r["generation"] for r in results], [0, 1, 2])
+        self.assertEqual(run.status, "completed")
+        self.assertEqual(run.next_generation, 3)
+        self.assertEqual(self.count(database.DBEvaluation, database.DBEvaluation.run_id == run.id), 18)
+        self.assertEqual(
+            self.count(database.DBPrompt, database.DBPrompt.run_id == run.id),
+            self.count(database.DBLineage, database.DBLineage.run_id == run.id)
+        )
+
+        generation = runs.load_generation(self.db, run.id, 1)
+        self.assertEqual(len(generation["evaluations"]), 6)
+        for genome in generation["population"]:
+            self.assertIsNotNone(genome["id"])
+
+        # Offspring carry their parent's ancestry forward
+        child = self.db.scalars(
+            select(database.DBLineage).where(database.DBLineage.generation == 3)
+        ).first()
+        parent = self.db.get(database.DBPrompt, child.ancestor_ids[-1])
+        self.assertEqual(self.db.get(database.DBPrompt, child.prompt_id).parent_id, parent.id)
+
+        # ...and the lineage index agrees with it
+        ancestors = queries.ancestors(self.db, child.prompt_id, fields=["id"])
+        self.assertEqual([a["id"] for a in ancestors], list(reversed(child.ancestor_ids)))
+
+    def test_resume_continues_from_last_generation(self):
+        run, _ = self.start_run(2)
+        population_ids = list(run.population_ids)
+
+        resumed = self.db.get(database.DBEvolutionRun, run.id)
+        self.assertEqual([g.id for g in runs.load_population(self.db, resumed)], population_ids)
+
+        results = list(runs.run_generations(self.db, resumed, 2, self.llm, rate_by_length))
+        self.assertEqual([r["generation"] for r in results], [2, 3])
+        self.assertEqual([p["id"] for p in results[0]["population"]], population_ids)
+
+    def test_stopping_early_pauses_the_run(self):
+        run = runs.start_run(self.db, "Write a poem", runs.evolver_config(self.evolver))
+        generations = runs.run_generations(self.db, run, 3, self.llm, rate_by_length)
+        next(generations)
+        generations.close()
+        self.assertEqual((run.status, run.next_generation, run.lease_owner), ("paused", 1, None))
+
+        list(runs.run_generations(self.db, run, 2, self.llm, rate_by_length))
+        self.assertEqual((run.status, run.next_generation), ("completed", 3))
+
+    def test_async_run_keeps_cpu_work_off_the_event_loop(self):
+        threads = []
+        original_split = dedup.Deduplicator.split
+
+        def split(deduplicator, population):
+            threads.append(threading.current_thread())
+            return original_split(deduplicator, population)
+
+        def rate(population, evaluations):
+            threads.append(threading.current_thread())
+            rate_by_length(population, evaluations)
+
+        async def evolve(run_id):
+            engine = database.create_async_db_engine(url)
+            try:
+                async with AsyncSession(engine, expire_on_commit=False) as db:
+                    run = await db.get(database.DBEvolutionRun, run_id)
+                    async for _ in runs.arun_generations(db, run, 2, self.llm, rate):
+                        pass
+                    return threading.current_thread(), run.status
+            finally:
+                await engine.dispose()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{tmp}/async.db"
+            engine = database.create_db_engine(url)
+            try:
+                database.Base.metadata.create_all(bind=engine)
+                with sessionmaker(bind=engine)() as db:
+                    run_id = runs.start_run(db, "Write a poem", runs.evolver_config(self.evolver)).id
+                with patch.object(dedup.Deduplicator, "split", split):
+                    loop_thread, status = asyncio.run(evolve(run_id))
+            finally:
+                engine.dispose()
+
+        self.assertEqual(status, "completed")
+        self.assertEqual(len(threads), 4)
+        self.assertNotIn(loop_thread, threads)
+
+    def test_seeded_run_replays_exactly(self):
+        """A run is re-derived bit-for-bit from its seed and recorded ratings"""
+        self.evolver.mutation_rate = 0.5
+        run = runs.start_run(self.db, "Write a poem", runs.evolver_config(self.evolver, seed=123))
+        list(runs.run_generations(self.db, run, 2, self.llm, rate_by_length))
+
+        # Resuming with a fresh evolver continues on the same per-generation streams
+        resumed = self.db.get(database.DBEvolutionRun, run.id)
+        list(runs.run_generations(self.db, resumed, 2, self.llm, rate_by_length))
+
+        replay = list(runs.replay_run(self.db, resumed))
+        self.assertEqual(len(replay), 5)
+        self.assertTrue(all(g["matches"] for g in replay))
+
+        # The same seed gives the same initial population
+        again = runs.start_run(self.db, "Write a poem", dict(run.config))
+        self.assertEqual(
+            [p.content for p in runs.load_population(self.db, again)],
+            [p["content"] for p in runs.load_generation(self.db, run.id, 0)["population"]]
+        )
+
+    def test_breeding_mode_is_recorded(self):
+        """Chunked runs replay identically whatever the server's breeding settings"""
+        self.evolver.mutation_rate = 0.5
+        self.evolver.breeding_workers = 1
+        self.evolver.breeding_chunk_size = 4
+        run = runs.start_run(self.db, "Write a poem", runs.evolver_config(self.evolver, seed=9))
+        self.assertEqual((run.config["breeding"], run.config["breeding_chunk_size"]), ("chunked", 4))
+        list(runs.run_generations(self.db, run, 2, self.llm, rate_by_length))
+
+        with patch.object(settings, "BREEDING_WORKERS", 0), patch.object(settings, "BREEDING_CHUNK_SIZE", 512):
+            rebuilt = runs.make_evolver(run.config)
+            self.assertEqual((rebuilt.breeding_workers, rebuilt.breeding_chunk_size), (1, 4))
+            self.assertTrue(all(g["matches"] for g in runs.replay_run(self.db, run)))
+        with patch.object(settings, "BREEDING_WORKERS", 1):
+            in_process = dict(run.config, breeding="in_process")
+            self.assertEqual(runs.make_evolver(in_process).breeding_workers, 0)
+
+    def test_user_ratings_steer_selection(self):
+        """Ratings sent to the API count towards the fitness a run selects on"""
+        def rate_evenly(population, evaluations):
+            for evaluation in evaluations:
+                evaluation.rating = 3.0
+
+        run = runs.start_run(self.db, "Write a poem", runs.evolver_config(self.evolver, seed=3))
+        favourite = run.population_ids[3]
+        ratings.store_ratings(self.db, [models.RatingIn(prompt_id=favourite, rating=5.0)] * 4)
+        self.db.commit()
+
+        list(runs.run_generations(self.db, run, 1, self.llm, rate_evenly))
+        self.assertEqual(run.population_ids[0], favourite)
+        recorded = runs.load_generation(self.db, run.id, 0)["evaluations"]
+        self.assertGreater(recorded[3]["fitness"], recorded[0]["fitness"])
+        self.assertTrue(all(g["matches"] for g in runs.replay_run(self.db, run)))
+
+    def test_fresh_offspring_outrank_long_lived_elites(self):
+        """Re-rating an elite every generation does not count as more raters"""
+        config = dict(runs.evolver_config(self.evolver, seed=3), dedup_mode="off")
+        run = runs.start_run(self.db, "Write a poem", config)
+        elite = run.population_ids[2]
+        newcomer = {}
+
+        def rate(population, evaluations):
+            for evaluation in evaluations:
+                evaluation.rating = 4.0 if evaluation.prompt_id == elite else 1.0
+                if evaluation.prompt_id == newcomer.get("id"):
+                    evaluation.rating = 5.0
+
+        list(runs.run_generations(self.db, run, 10, self.llm, rate))
+        self.assertEqual(run.population_ids[0], elite)
+        self.assertEqual(ratings.get_summary(self.db, elite)["count"], 1)
+
+        newcomer["id"] = run.population_ids[1]
+        list(runs.run_generations(self.db, run, 1, self.llm, rate))
+        self.assertEqual(run.population_ids[0], newcomer["id"])
+
+        # Rebuilt summaries count the same ratings
+        before = ratings.get_summary(self.db, elite)
+        ratings.rebuild_summaries(self.db)
+        self.assertEqual(ratings.get_summary(self.db, elite), before)
+        self.assertTrue(all(g["matches"] for g in runs.replay_run(self.db, run)))
+
+    def test_duplicates_reuse_evaluations(self):
+        """Near-duplicate genomes cost one request; their copies share its rating"""
+        calls = []
+        evaluate = self.llm.evaluate_prompt_batch
+        self.llm.evaluate_prompt_batch = lambda population: calls.append(len(population)) or evaluate(population)
+
+        population = [p.model_copy(update={"content": "Write a poem"}) for p in
+                      self.evolver.initialize_population("Write a poem")]
+        run = runs.create_run(self.db, "Write a poem", population, runs.evolver_config(self.evolver))
+        results = list(runs.run_generations(self.db, run, 3, self.llm, rate_by_length))
+
+        self.assertEqual(calls[0], 1)
+        self.assertEqual(len({e["rating"] for e in results[0]["evaluations"]}), 1)
+        self.assertEqual(self.count(database.DBEvaluation, database.DBEvaluation.run_id == run.id), 18)
+        # A resumed run rebuilds the same archive from the stored generations
+        self.assertEqual(len(runs.make_deduplicator(self.db, run)), sum(calls))
+
+    def test_replace_mode_replays_exactly(self):
+        config = dict(runs.evolver_config(self.evolver, seed=7), dedup_mode="replace")
+        run = runs.start_run(self.db, "Write a poem", config)
+        list(runs.run_generations(self.db, run, 2, self.llm, rate_by_length))
+        list(runs.run_generations(self.db, run, 2, self.llm, rate_by_length))
+
+        replay = list(runs.replay_run(self.db, run))
+        self.assertEqual(len(replay), 5)
+        self.assertTrue(all(g["matches"] for g in replay))
+
+    def test_novelty_run_resumes_and_replays_exactly(self):
+        self.evolver.novelty_weight = 0.5
+        run = runs.start_run(self.db, "Write a poem", runs.evolver_config(self.evolver, seed=11))
+        list(runs.run_generations(self.db, run, 2, self.llm, rate_by_length))
+
+        # A resumed evolver's archive is refilled from the stored generations
+        resumed = runs.make_evolver(run.config)
+        runs.restore_novelty_archive(self.db, run, resumed)
+        self.assertEqual(len(resumed.novelty_archive), 12)
+        list(runs.run_generations(self.db, run, 2, self.llm, rate_by_length))
+
+        self.assertTrue(all(g["matches"] for g in runs.replay_run(self.db, run)))
+
+    def test_evolvers_built_for_a_run_are_closed(self):
+        run = runs.start_run(self.db, "Write a poem", runs.evolver_config(self.evolver, seed=5))
+        with patch.object(evolver.PromptEvolver, "close", autospec=True) as close:
+            list(runs.run_generations(self.db, run, 1, self.llm, rate_by_length))
+            self.assertEqual(close.call_count, 1)
+            list(runs.replay_run(self.db, run))
+            self.assertEqual(close.call_count, 2)
+            # An evolver passed in belongs to the caller
+            list(runs.run_generations(self.db, run, 1, self.llm, rate_by_length, self.evolver))
+            self.assertEqual(close.call_count, 2)
+
+    def test_leased_run_is_not_evolved_twice(self):
+        run = runs.start_run(self.db, "Write a poem", runs.evolver_config(self.evolver))
+        self.assertTrue(runs.claim_run(self.db, run.id, "other-worker"))
+
+        with self.assertRaises(runs.RunLeasedError):
+            list(runs.run_generations(self.db, run, 1, self.llm, rate_by_length))
+        self.assertEqual(run.next_generation, 0)
+
+        # A lapsed lease can be taken over, and is released when the generations end
+        with patch.object(settings, "RUN_LEASE_TIMEOUT", -1):
+            self.assertTrue(runs.claim_run(self.db, run.id, "other-worker"))
+        list(runs.run_generations(self.db, run, 1, self.llm, rate_by_length))
+        self.assertEqual((run.next_generation, run.status, run.lease_owner), (1, "completed", None))
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        engine = create_engine(f"sqlite:///{self.tmp.name}/jobs.db", connect_args={"check_same_thread": False})
+        database.Base.metadata.create_all(bind=engine)
+        self.session_factory = sessionmaker(bind=engine)
+        self.queue = jobs.JobQueue(self.session_factory, llm_interface.LLMInterface(), rate_by_length,
+                                   workers=2, poll_interval=0.05)
+
+    def tearDown(self):
+        self.queue.stop(timeout=5.0)
+        self.tmp.cleanup()
+
+    def wait_for(self, job_ids):
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            with self.session_factory() as db:
+                finished = [db.get(database.DBJob, i) for i in job_ids]
+                if all(job.status in ("succeeded", "failed") for job in finished):
+                    return finished
+            time.sleep(0.05)
+        return finished
+
+    def submit(self, db, generations):
+        evolver_instance = evolver.PromptEvolver()
+        evolver_instance.population_size = 4
+        run = runs.start_run(db, "Summarize a paper", runs.evolver_config(evolver_instance))
+        return self.queue.submit(db, run, generations).id
+
+    def test_jobs_run_in_background(self):
+        """Submitting returns at once; workers record one summary per generation"""
+        with self.session_factory() as db:
+            job_ids = [self.submit(db, 3), self.submit(db, 2)]
+        self.queue.start()
+        finished = self.wait_for(job_ids)
+
+        self.assertEqual([job.status for job in finished], ["succeeded", "succeeded"])
+        self.assertEqual([p["generation"] for p in finished[0].progress], [0, 1, 2])
+        self.assertEqual(len(finished[1].progress), 2)
+
+    def test_jobs_for_one_run_take_turns(self):
+        with self.session_factory() as db:
+            evolver_instance = evolver.PromptEvolver()
+            evolver_instance.population_size = 4
+            run = runs.start_run(db, "Summarize a paper", runs.evolver_config(evolver_instance))
+            job_ids = [self.queue.submit(db, run, 3).id, self.queue.submit(db, run, 3).id]
+            run_id = run.id
+        self.queue.start()
+        finished = self.wait_for(job_ids)
+
+        self.assertEqual([job.status for job in finished], ["succeeded", "succeeded"])
+        self.assertEqual([p["generation"] for p in finished[0].progress], [0, 1, 2])
+        self.assertEqual([p["generation"] for p in finished[1].progress], [3, 4, 5])
+        # A worker releases the run just after recording its job's status
+        self.queue.stop(timeout=5.0)
+        with self.session_factory() as db:
+            run = db.get(database.DBEvolutionRun, run_id)
+            self.assertEqual((run.next_generation, run.lease_owner), (6, None))
+            per_generation = db.execute(
+                select(database.DBEvaluation.generation, func.count())
+                .where(database.DBEvaluation.run_id == run_id)
+                .group_by(database.DBEvaluation.generation)
+            ).all()
+            self.assertEqual(dict(per_generation), {g: 4 for g in range(6)})
+
+    def test_start_only_requeues_jobs_of_unleased_runs(self):
+        with self.session_factory() as db:
+            job_ids = [self.submit(db, 1), self.submit(db, 1)]
+            rows = [db.get(database.DBJob, i) for i in job_ids]
+            for job in rows:
+                job.status = "running"
+            db.commit()
+            # Another live process holds the first job's run
+            runs.claim_run(db, rows[0].run_id, "other-process")
+
+            self.queue._requeue_orphans(db)
+            self.assertEqual([db.get(database.DBJob, i).status for i in job_ids], ["running", "queued"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Tests for steady-state evolution in LLM-Picbreeder
+"""
+import sys
+import os
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+# Add the parent directory to the path so we can import our modules
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from llm_picbreeder import evolver, fitness, llm_interface, models, steady_state
+
+class SlowFirstClient:
+    """Stands in for AsyncOpenAI; the first request takes far longer than the rest"""
+
+    def __init__(self, slow=0.5, latency=0.005):
+        self.slow = slow
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, max_tokens, temperature):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.slow if self.calls == 1 else self.latency)
+        finally:
+            self.in_flight -= 1
+        message = SimpleNamespace(content=f"Answer to {messages[-1]['content']}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+class TestSteadyState(unittest.TestCase):
+    def make_engine(self, client=None, population_size=4, in_flight=3):
+        prompt_evolver = evolver.PromptEvolver(seed=3)
+        prompt_evolver.population_size = population_size
+        llm = llm_interface.LLMInterface(async_client=client or SlowFirstClient())
+        llm.cache = None
+        return steady_state.SteadyStateEvolver(prompt_evolver, llm, fitness.make_fitness_function(),
+                                               in_flight=in_flight)
+
+    def test_breeds_without_waiting_for_slow_evaluations(self):
+        client = SlowFirstClient()
+        engine = self.make_engine(client)
+        finished = []
+        ranked = asyncio.run(engine.run("Describe the ocean", 30,
+                                        on_result=lambda genome, evaluation: finished.append(genome)))
+
+        self.assertEqual(engine.completed, 30)
+        self.assertLessEqual(client.calls, 30)
+        self.assertEqual(client.max_in_flight, 3)
+        # The first prompt sent is the slowest; everything else finished around it
+        self.assertEqual(finished[-1].id, 1)
+        self.assertEqual(len(ranked), 4)
+        ratings = [evaluation.rating for _, evaluation in ranked]
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+
+        # Children name parents that were rated before them
+        ids = {genome.id for genome in finished}
+        children = [genome for genome in finished if genome.metadata["source"] != "initial_population"]
+        self.assertEqual(len(children), 26)
+        for child in children:
+            self.assertIn(child.parent_id, ids)
+
+        # Only the outputs of the final members are still held
+        self.assertEqual(set(engine._responses), {genome.content for genome, _ in ranked})
+
+    def test_insert_replaces_worst(self):
+        engine = self.make_engine()
+        engine.evolver.population_size = 2
+
+        def offer(prompt_id, rating, error=None):
+            genome = models.PromptGenome(id=prompt_id, content=f"Prompt {prompt_id}")
+            evaluation = models.PromptEvaluation(prompt_id=prompt_id, output_content="", rating=rating, error=error)
+            return engine.insert(genome, evaluation)
+
+        self.assertTrue(offer(1, 2.0))
+        self.assertTrue(offer(2, 4.0))
+        self.assertFalse(offer(3, 1.5))
+        self.assertFalse(offer(4, 5.0, error="timeout"))
+        self.assertTrue(offer(5, 3.0))
+        self.assertEqual([genome.id for genome, _ in engine.ranked()], [2, 5])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -33,7 +33,7 @@ elif [ "$1" = "comprehensive" ]; then
     python -m llm_picbreeder.comprehensive_example
 elif [ "$1" = "test" ]; then
     echo "Running tests..."
-    python -m unittest llm_picbreeder/test_evolver.py
+    python -m unittest discover -s llm_picbreeder -p "test_*.py"
 else
     echo "Usage: ./run.sh [api|streamlit|cli|example|comprehensive|test]"
     echo ""
@@ -13,9 +13,15 @@ setup(
         "uvicorn>=0.23.0",
         "sqlalchemy>=2.0.0",
         "alembic>=1.11.0",
+        "aiosqlite>=0.19.0",
         "streamlit>=1.25.0",
         "python-dotenv>=1.0.0",
     ],
+    extras_require={
+        "postgres": ["psycopg2-binary>=2.9", "asyncpg>=0.28"],
+        "export": ["pyarrow>=12.0.0"],
+        "fitness": ["jsonschema>=4.0"],
+    },
     entry_points={
         "console_scripts": [
             "llm-picbreeder=llm_picbreeder.cli:main",